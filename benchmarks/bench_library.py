@@ -0,0 +1,59 @@
+# Theme library import and query benchmark
+# Fills a throwaway SQLite library with synthetic themes, then times the
+# searches the sidebar and the "library search" command run.
+# run as "python benchmarks/bench_library.py [--themes 100000] [--repeat N]"
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from common import synthetic_theme, time_call, tte
+
+QUERIES = [
+    ("font for one element", [{"element": "dashboard-title", "attribute": "font-family", "value": "Tableau Bold"}]),
+    ("exact mark color", [{"attribute": "mark-color", "value": "#0072ce"}]),
+    ("any color attribute", [{"kind": "color", "value": "#0072CE"}]),
+    ("font and size", [
+        {"element": "worksheet", "attribute": "font-family", "value": "Roboto"},
+        {"element": "worksheet", "attribute": "font-size", "value": 12},
+    ]),
+    ("element set at all", [{"element": "highlighter-title"}]),
+]
+
+
+def themes(count, seed=42):
+    """Synthetic (name, theme) pairs, a known brand color in every 100th theme"""
+    rng = random.Random(seed)
+    for index in range(count):
+        theme = synthetic_theme(rng)
+        if index % 100 == 0:
+            theme["styles"]["mark"]["mark-color"] = "#0072CE"
+        yield f"synthetic/{index:06d}.json", theme
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Theme library benchmark")
+    parser.add_argument("--themes", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", help="Keep the library at this path instead of a temp file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.keep or os.path.join(tmp, "library.sqlite3")
+        library = tte.ThemeLibrary(path)
+        start = time.perf_counter()
+        count = library.save_many(themes(args.themes))
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path) / 1024 / 1024
+        print(f"import {count} themes in {elapsed:.1f}s ({count / elapsed:,.0f} themes/sec), {size:.1f} MB")
+
+        print(f"\nqueries (best of {args.repeat})")
+        for label, conditions in QUERIES:
+            timing = time_call(lambda: library.search(conditions), args.repeat)
+            matches = len(library.search(conditions, limit=args.themes))
+            print(f"  {label:<22} {timing['best_ms']:8.2f} ms  {matches:7d} match(es)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# Cold start benchmark
+# Every measurement runs in a fresh interpreter, like a newly scheduled
+# container: module import time for tabthemeeditor, the slowest imports it pulls
+# in (from -X importtime), and first paint - process start until the first
+# AppTest run of the welcome screen or of a loaded theme has finished.
+# run as "python benchmarks/bench_startup.py [--repeat N] [--output results.json]"
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from common import APP_PATH, REPO_ROOT
+
+IMPORT_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import tabthemeeditor
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({"ms": elapsed, "pandas": "pandas" in sys.modules}))
+"""
+
+FIRST_PAINT_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+if {with_theme!r}:
+    import tabthemeeditor
+    at.session_state.theme_data = tabthemeeditor.ThemeModel(tabthemeeditor.create_default_theme())
+at.run()
+elapsed = (time.perf_counter() - start) * 1000
+if at.exception:
+    raise SystemExit(str(at.exception))
+print(json.dumps({{"ms": elapsed, "pandas": "pandas" in sys.modules}}))
+"""
+
+
+def run_snippet(code, extra_args=()):
+    """Run code in a fresh interpreter from the repo root and return the completed process"""
+    return subprocess.run(
+        [sys.executable, *extra_args, "-c", code],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+
+
+def sample(code, repeat):
+    """Best and median of the JSON timing the snippet prints"""
+    runs = [json.loads(run_snippet(code).stdout.strip().splitlines()[-1]) for _ in range(repeat)]
+    times = [run["ms"] for run in runs]
+    return {
+        "best_ms": min(times),
+        "median_ms": statistics.median(times),
+        "repeat": repeat,
+        "pandas_loaded": runs[-1]["pandas"],
+    }
+
+
+def slowest_imports(top):
+    """Top-level packages ranked by cumulative import time, from -X importtime"""
+    stderr = run_snippet("import tabthemeeditor", ("-X", "importtime")).stderr
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not cumulative.isdigit() or name.startswith(" ") or "." in name:
+            continue
+        totals[name] = totals.get(name, 0) + int(cumulative)
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{"module": name, "cumulative_ms": us / 1000} for name, us in ranked]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Theme editor cold start benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="How many of the slowest imports to list")
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args(argv)
+
+    report = {
+        "import": sample(IMPORT_SNIPPET, args.repeat),
+        "first_paint_welcome": sample(FIRST_PAINT_SNIPPET.format(app=APP_PATH, with_theme=False), args.repeat),
+        "first_paint_theme": sample(FIRST_PAINT_SNIPPET.format(app=APP_PATH, with_theme=True), args.repeat),
+        "slowest_imports": slowest_imports(args.top),
+    }
+
+    for name in ("import", "first_paint_welcome", "first_paint_theme"):
+        timing = report[name]
+        print(f"{name:<22} best {timing['best_ms']:8.1f} ms  median {timing['median_ms']:8.1f} ms  "
+              f"pandas loaded: {timing['pandas_loaded']}")
+    print("\nslowest imports (cumulative)")
+    for entry in report["slowest_imports"]:
+        print(f"  {entry['module']:<24} {entry['cumulative_ms']:8.1f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
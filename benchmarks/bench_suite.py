@@ -0,0 +1,285 @@
+# Performance baseline for the theme editor
+# Drives main() headlessly through Streamlit's AppTest with synthetic themes of
+# increasing size, then benchmarks the core helpers in isolation. Results are
+# written as JSON so runs from different commits can be compared.
+# run as "python benchmarks/bench_suite.py [--quick] [--compare results/<old>.json]"
+import argparse
+import colorsys
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+
+from common import APP_PATH, REPO_ROOT, synthetic_theme, synthetic_themes, time_call, tte
+
+# (label, catalog elements set, extra custom elements)
+THEME_SIZES = [
+    ("small", 5, 0),
+    ("full", None, 0),
+    ("full+100", None, 100),
+    ("full+500", None, 500),
+]
+
+# AppTest accessors that return widgets (as opposed to display elements)
+WIDGET_TYPES = [
+    "button", "checkbox", "color_picker", "date_input", "download_button",
+    "file_uploader", "multiselect", "number_input", "radio", "select_slider",
+    "selectbox", "slider", "text_area", "text_input", "time_input", "toggle",
+]
+
+
+def git_commit():
+    """Short hash of the checked out commit, or None outside a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """Versions that matter when comparing runs"""
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": tte.np.__version__,
+        "streamlit": tte.st.__version__,
+        "orjson": getattr(tte.orjson, "__version__", None),
+    }
+
+
+def count_widgets(at):
+    """Number of widgets AppTest saw in the last run"""
+    total = 0
+    for widget_type in WIDGET_TYPES:
+        try:
+            total += len(at.get(widget_type))
+        except (AttributeError, KeyError):
+            continue
+    return total
+
+
+def bench_app(label, theme, reruns):
+    """Full-rerun wall time and widget count for one theme"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.session_state.theme_data = tte.ThemeModel(theme)
+    start = time.perf_counter()
+    at.run()
+    first_ms = (time.perf_counter() - start) * 1000
+    if at.exception:
+        raise RuntimeError(f"App raised during benchmark: {at.exception}")
+
+    samples = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "theme": label,
+        "elements": len(theme["styles"]),
+        "first_run_ms": first_ms,
+        "rerun_best_ms": min(samples),
+        "rerun_median_ms": sorted(samples)[len(samples) // 2],
+        "widgets": count_widgets(at),
+    }
+
+
+def render_preview_cold(model):
+    """Render the preview with empty fragment and cascade caches"""
+    tte.render_preview_fragment.cache_clear()
+    return tte.render_preview_svg(model, tte.CascadeResolver())
+
+
+def bench_core(label, themes, repeat):
+    """validate_theme, cascade resolution, preview, palette helpers and serialization over a list of themes"""
+    palette = tte.COLOR_PALETTES["Corporate Blue"]
+    plan = tte.load_palette_plan()
+    snap_index = tte.nearest_color_index(tte.palette_colors("Corporate Blue"))
+    validator = tte.IncrementalValidator()
+    for theme in themes:
+        validator.validate(theme)
+    models = [tte.ThemeModel(theme) for theme in themes]
+    resolver = tte.CascadeResolver()
+    results = {
+        "validate_theme": time_call(lambda: [tte.validate_theme(t) for t in themes], repeat),
+        "incremental_validate_unchanged": time_call(lambda: validator.validate(themes[-1]), repeat, number=100),
+        "cascade_resolve_cold": time_call(lambda: [tte.CascadeResolver().effective_styles(m) for m in models], repeat),
+        "cascade_resolve_warm": time_call(lambda: resolver.effective_styles(models[-1]), repeat, number=100),
+        "preview_render_cold": time_call(lambda: [render_preview_cold(m) for m in models], repeat),
+        "cvd_simulate": time_call(lambda: [tte.simulate_theme_cvd(t) for t in themes], repeat),
+        "contrast_audit": time_call(lambda: [tte.audit_contrast(m) for m in models], repeat),
+        "preview_render_warm": time_call(lambda: tte.render_preview_svg(models[-1], resolver), repeat, number=100),
+        "apply_palette": time_call(lambda: [tte.apply_palette(t, palette) for t in themes], repeat),
+        "palette_plan_many": time_call(lambda: plan.apply_many(themes, palette), repeat),
+        "palette_plan_changes": time_call(lambda: [plan.changes(t, palette) for t in themes], repeat),
+        "snap_to_palette": time_call(lambda: tte.snap_themes_to_palette(json.loads(json.dumps(themes)), snap_index), repeat),
+        "json_dumps_indent": time_call(lambda: [json.dumps(t, indent=2) for t in themes], repeat),
+        "dumps_theme_pretty": time_call(lambda: [tte.dumps_theme(t) for t in themes], repeat),
+        "dumps_theme_compact": time_call(lambda: [tte.dumps_theme(t, pretty=False) for t in themes], repeat),
+    }
+    return {"theme": label, "themes": len(themes), "results": results}
+
+
+def synthetic_logo(width=4000, height=3000):
+    """PNG bytes of a flat-color logo on white, with anti-aliased-looking noise at the edges"""
+    from PIL import Image
+
+    rng = tte.np.random.default_rng(3)
+    pixels = tte.np.full((height, width, 3), 255, dtype=tte.np.uint8)
+    pixels[height // 10:height // 2, width // 20:width // 2] = (31, 58, 95)
+    pixels[height // 8:height // 2, width // 2 + 200:width - 200] = (242, 142, 43)
+    pixels[height // 2 + 100:height - 200, width // 20:width // 3] = (78, 121, 167)
+    edge = rng.random((height, width)) < 0.01
+    pixels[edge] = rng.integers(0, 256, (int(edge.sum()), 3), dtype=tte.np.uint8)
+    buffer = tte.io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def bench_colors(count, repeat):
+    """Scalar color helpers versus the vectorized color engine"""
+    rng = random.Random(7)
+    colors = ["#{:06X}".format(rng.randrange(0x1000000)) for _ in range(count)]
+
+    def scalar_round_trip():
+        for color in colors:
+            tte.rgb_to_hex(*tte.hex_to_rgb(color))
+
+    def scalar_cmyk():
+        for color in colors:
+            tte.cmyk_to_hex(*tte.hex_to_cmyk(color))
+
+    def vector_round_trip():
+        tte.rgba_array_to_hex(tte.hex_to_rgba_array(colors)[0])
+
+    def vector_cmyk():
+        rgba, _ = tte.hex_to_rgba_array(colors)
+        tte.rgba_array_to_hex(tte.cmyk_to_rgb_array(tte.rgb_to_cmyk_array(rgba)))
+
+    def scalar_hsl():
+        for color in colors:
+            r, g, b = (channel / 255 for channel in tte.hex_to_rgb(color))
+            tte.rgb_to_hex(*(round(channel * 255) for channel in colorsys.hls_to_rgb(*colorsys.rgb_to_hls(r, g, b))))
+
+    def vector_hsl():
+        rgba, _ = tte.hex_to_rgba_array(colors)
+        tte.rgba_array_to_hex(tte.hsl_to_rgb_array(tte.rgb_to_hsl_array(rgba)))
+
+    def vector_oklab():
+        rgba, _ = tte.hex_to_rgba_array(colors)
+        tte.oklab_to_rgb_array(tte.rgb_to_oklab_array(rgba))
+
+    return {
+        "colors": count,
+        "results": {
+            "scalar_hex_rgb_round_trip": time_call(scalar_round_trip, repeat),
+            "vector_hex_rgb_round_trip": time_call(vector_round_trip, repeat),
+            "scalar_cmyk_round_trip": time_call(scalar_cmyk, repeat),
+            "vector_cmyk_round_trip": time_call(vector_cmyk, repeat),
+            "scalar_hsl_round_trip": time_call(scalar_hsl, repeat),
+            "vector_hsl_round_trip": time_call(vector_hsl, repeat),
+            "vector_oklab_round_trip": time_call(vector_oklab, repeat),
+            "gamut_map_oklch": time_call(lambda: tte.oklch_to_rgb_array(tte.oklab_to_oklch_array(
+                tte.rgb_to_oklab_array(tte.hex_to_rgba_array(colors)[0]) * (1, 1.5, 1.5))), repeat),
+        },
+    }
+
+
+def bench_palettes(repeat):
+    """Palette generation from seed colors and from a logo image, each with its own fixed input"""
+    rng = random.Random(11)
+    seeds = ["#{:06X}".format(rng.randrange(0x1000000)) for _ in range(20)]
+    logo = synthetic_logo()
+
+    def generate_palettes():
+        tte.generate_palettes.cache_clear()
+        for seed in seeds:
+            tte.generate_palettes(seed)
+
+    return {
+        "generate_palettes_20_seeds": time_call(generate_palettes, repeat),
+        "logo_palette_4000x3000_png": time_call(lambda: tte.extract_logo_palette(logo, 6), repeat),
+    }
+
+
+def flatten(report):
+    """Map of benchmark name -> best time in ms, used for comparisons"""
+    flat = {}
+    for run in report["app"]:
+        flat[f"app/{run['theme']}/rerun"] = run["rerun_best_ms"]
+    for run in report["core"]:
+        for name, timing in run["results"].items():
+            flat[f"core/{run['theme']}/{name}"] = timing["best_ms"]
+    for name, timing in report["colors"]["results"].items():
+        flat[f"colors/{name}"] = timing["best_ms"]
+    for name, timing in report.get("palettes", {}).items():
+        flat[f"palettes/{name}"] = timing["best_ms"]
+    return flat
+
+
+def compare(report, baseline_path):
+    """Print per-benchmark ratios against an earlier results file"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = flatten(json.load(f))
+    current = flatten(report)
+    print(f"\nCompared with {baseline_path} (ratio > 1 means slower now)")
+    for name in sorted(current):
+        if name in baseline and baseline[name] > 0:
+            ratio = current[name] / baseline[name]
+            flag = "  <-- regression" if ratio > 1.2 else ""
+            print(f"  {name:<55} {baseline[name]:10.3f} -> {current[name]:10.3f} ms  {ratio:5.2f}x{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Theme editor benchmark suite")
+    parser.add_argument("--quick", action="store_true", help="Fewer themes and repeats, for a smoke run")
+    parser.add_argument("--skip-app", action="store_true", help="Skip the AppTest rerun benchmarks")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    repeat = 3 if args.quick else 7
+    theme_count = 50 if args.quick else 500
+    report = {"environment": environment(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "app": [], "core": []}
+
+    for label, elements, extra in THEME_SIZES:
+        rng = random.Random(label)
+        if not args.skip_app:
+            run = bench_app(label, synthetic_theme(rng, elements, extra), reruns=repeat)
+            report["app"].append(run)
+            print(f"app   {label:<10} {run['elements']:4d} elements  first {run['first_run_ms']:8.1f} ms  "
+                  f"rerun {run['rerun_best_ms']:8.1f} ms  {run['widgets']:5d} widgets")
+        run = bench_core(label, synthetic_themes(theme_count, elements=elements, extra_elements=extra), repeat)
+        report["core"].append(run)
+        timings = ", ".join(f"{name} {t['best_ms']:.2f}" for name, t in run["results"].items())
+        print(f"core  {label:<10} ({theme_count} themes, ms) {timings}")
+
+    report["colors"] = bench_colors(1000 if args.quick else 10000, repeat)
+    for name, timing in report["colors"]["results"].items():
+        print(f"color {name:<30} {timing['best_ms']:8.2f} ms for {report['colors']['colors']} colors")
+    report["palettes"] = bench_palettes(repeat)
+    for name, timing in report["palettes"].items():
+        print(f"palette {name:<28} {timing['best_ms']:8.2f} ms")
+
+    output = args.output or os.path.join(
+        REPO_ROOT, "benchmarks", "results",
+        f"{time.strftime('%Y%m%d-%H%M%S')}-{report['environment']['commit'] or 'nogit'}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# Validation throughput micro-benchmark
+# Throughput before and after the compiled schema: the original string-matching
+# validator against validate_theme, which calls each attribute's compiled
+# validator. validate_theme also checks the enumerated attributes (font-weight,
+# line-visibility, line-pattern) the original skipped, so a second reference
+# adds those checks for a like-for-like number. The compiled schema is about
+# one source of truth for validation and editors, not speed: the per-attribute
+# validator call costs a little more than the inline string tests.
+# run as "python benchmarks/bench_validation.py [--themes N] [--repeat N]"
+import argparse
+import time
+
+from common import synthetic_themes, tte
+
+
+def legacy_validate_theme(data):
+    """Reference copy of the pre-schema validator (string matching per attribute)"""
+    errors, warnings = tte.validate_theme_header(data)
+    styles = data.get("styles", {})
+    for element, properties in styles.items():
+        if element not in tte.STYLE_ELEMENTS:
+            warnings.append(f"Unknown style element '{element}' - it may not be supported")
+        if not isinstance(properties, dict):
+            errors.append(f"Style element '{element}' must be an object")
+            continue
+        for attr, value in properties.items():
+            if "color" in attr:
+                if not isinstance(value, str) or not value.startswith("#"):
+                    errors.append(f"Color attribute '{attr}' in '{element}' must be a hex color code (e.g., #FF0000)")
+            elif "font-size" in attr or "line-width" in attr:
+                if not isinstance(value, int) or value < 1 or value > 99:
+                    errors.append(f"Size attribute '{attr}' in '{element}' must be an integer between 1-99")
+            elif "font-family" in attr:
+                if not isinstance(value, str) or len(value) > 50:
+                    errors.append(f"Font family '{attr}' in '{element}' must be a string (max 50 characters)")
+    return errors, warnings
+
+
+def legacy_full_validate_theme(data):
+    """String-matching validator extended with the enumerated attribute checks, for a like-for-like comparison"""
+    errors, warnings = tte.validate_theme_header(data)
+    styles = data.get("styles", {})
+    for element, properties in styles.items():
+        if element not in tte.STYLE_ELEMENTS:
+            warnings.append(f"Unknown style element '{element}' - it may not be supported")
+        if not isinstance(properties, dict):
+            errors.append(f"Style element '{element}' must be an object")
+            continue
+        for attr, value in properties.items():
+            if "color" in attr:
+                if not isinstance(value, str) or not value.startswith("#"):
+                    errors.append(f"Color attribute '{attr}' in '{element}' must be a hex color code (e.g., #FF0000)")
+            elif "font-size" in attr or "line-width" in attr:
+                if not isinstance(value, int) or value < 1 or value > 99:
+                    errors.append(f"Size attribute '{attr}' in '{element}' must be an integer between 1-99")
+            elif "font-family" in attr:
+                if not isinstance(value, str) or len(value) > 50:
+                    errors.append(f"Font family '{attr}' in '{element}' must be a string (max 50 characters)")
+            elif attr == "font-weight":
+                if value not in ("normal", "bold"):
+                    errors.append(f"Attribute '{attr}' in '{element}' must be one of: normal, bold")
+            elif attr == "line-visibility":
+                if value not in ("on", "off"):
+                    errors.append(f"Attribute '{attr}' in '{element}' must be one of: on, off")
+            elif attr == "line-pattern":
+                if value not in ("solid", "dashed", "dotted", "none"):
+                    errors.append(f"Attribute '{attr}' in '{element}' must be one of: solid, dashed, dotted, none")
+    return errors, warnings
+
+
+def measure(label, validate, themes, repeat):
+    """Run a validator over all themes and report the best throughput"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for theme in themes:
+            validate(theme)
+        best = min(best, time.perf_counter() - start)
+    rate = len(themes) / best
+    print(f"{label:<26} {best * 1000:9.2f} ms  {rate:12,.0f} themes/sec")
+    return rate
+
+
+def measure_dispatch(repeat, rounds=2000):
+    """Time resolving every catalog attribute, a kind by name versus the full compiled spec the editors use"""
+    pairs = [(key, attr) for key, info in tte.STYLE_ELEMENTS.items() for attr in info["attributes"]]
+    for label, resolve in (
+        ("string matching", lambda element, attr: tte.classify_attribute(attr)),
+        ("compiled schema", lambda element, attr: tte.attribute_spec(element, attr).kind),
+    ):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for element, attr in pairs:
+                    resolve(element, attr)
+            best = min(best, time.perf_counter() - start)
+        print(f"{label:<26} {best * 1000:9.2f} ms  {rounds * len(pairs) / best:12,.0f} lookups/sec")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Theme validation throughput benchmark")
+    parser.add_argument("--themes", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    themes = synthetic_themes(args.themes)
+    attributes = sum(len(specs) for specs in tte.DEFAULT_CATALOG.schema.values())
+    print(f"{args.themes} themes x {attributes} attributes, best of {args.repeat}")
+
+    print("\nvalidate_theme")
+    before = measure("string matching", legacy_validate_theme, themes, args.repeat)
+    before_full = measure("string matching + enums", legacy_full_validate_theme, themes, args.repeat)
+    after = measure("compiled schema", tte.validate_theme, themes, args.repeat)
+    print(f"after / before: {after / before:.2f}x ({after / before_full:.2f}x checking the same attributes)")
+
+    print("\nattribute dispatch")
+    measure_dispatch(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# Shared helpers for the benchmark scripts in this folder
+import os
+import random
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, "tabthemeeditor.py")
+sys.path.insert(0, REPO_ROOT)
+
+import tabthemeeditor as tte
+
+
+def random_value(rng, element_key, attr):
+    """A plausible random value for one attribute"""
+    spec = tte.attribute_spec(element_key, attr)
+    if spec.kind == "color":
+        return "#{:06X}".format(rng.randrange(0x1000000))
+    if spec.kind == "size":
+        return rng.randint(1, 99)
+    if spec.allowed:
+        return rng.choice(spec.allowed)
+    return None
+
+
+def synthetic_theme(rng, elements=None, extra_elements=0):
+    """A theme with the given catalog elements set to random values
+
+    ``extra_elements`` adds copies of real elements under made-up keys, which
+    stands in for the larger custom element catalogs.
+    """
+    catalog = list(tte.STYLE_ELEMENTS.items())
+    if elements is not None:
+        catalog = catalog[:elements]
+    styles = {}
+    for element_key, element_info in catalog:
+        styles[element_key] = {
+            attr: random_value(rng, element_key, attr)
+            for attr in element_info["attributes"]
+        }
+    for index in range(extra_elements):
+        element_key, element_info = catalog[index % len(catalog)]
+        styles[f"{element_key}-custom-{index}"] = {
+            attr: random_value(rng, element_key, attr)
+            for attr in element_info["attributes"]
+        }
+    return {"version": tte.TABLEAU_VERSION, "base-theme": "smooth", "styles": styles}
+
+
+def synthetic_themes(count, seed=42, **kwargs):
+    """A reproducible list of synthetic themes"""
+    rng = random.Random(seed)
+    return [synthetic_theme(rng, **kwargs) for _ in range(count)]
+
+
+def time_call(fn, repeat=5, number=1):
+    """Best and median wall time per call in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) * 1000 / number)
+    return {"best_ms": min(samples), "median_ms": statistics.median(samples), "repeat": repeat, "number": number}
@@ -1,18 +1,81 @@
-import streamlit as st
+import argparse
+import copy
+import difflib
+import hashlib
+import html
+import importlib
+import io
 import json
-import pandas as pd
+import os
+import pickle
+import re
+import sqlite3
+import sys
+import shutil
+import tempfile
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+from xml.sax.saxutils import XMLGenerator, quoteattr
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache, partial, wraps
+from typing import Callable, NamedTuple, Optional
+import numpy as np
+try:
+    import orjson  # optional, faster JSON backend
+except ImportError:
+    orjson = None
 # Tableau Theme Editor 
 # Author : Paul Morgan (paul.morgan@salesforce.com)
 # Requiements - Streamlit and Python 
 # run as "streamlit run tabthemeeditor.py"
+# batch mode: "python -m tabthemeeditor batch validate <dir>"
+
+# --- STREAMLIT ---
+# Streamlit is only imported once the UI touches it. The batch engine and the
+# CLI never do, so command line runs and their worker processes skip its
+# (large) import cost.
+
+class LazyModule:
+    """Module stand-in that imports the real module on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+st = LazyModule("streamlit")
+
+def streamlit_decorator(name, *args, **kwargs):
+    """``@st.<name>(*args, **kwargs)`` applied on the first call instead of at definition"""
+    def decorate(func):
+        decorated = None
+        @wraps(func)
+        def call(*call_args, **call_kwargs):
+            nonlocal decorated
+            if decorated is None:
+                decorated = getattr(st, name)(*args, **kwargs)(func)
+            return decorated(*call_args, **call_kwargs)
+        return call
+    return decorate
 
 # --- CONFIGURATION ---
-st.set_page_config(
-    page_title="The Unofficial Tableau Theme Editor",
-    page_icon="🎨",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+def configure_page():
+    """Configure the Streamlit page (must run before any other st call)"""
+    st.set_page_config(
+        page_title="The Unofficial Tableau Theme Editor",
+        page_icon="🎨",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
 
 # --- CONSTANTS ---
 TABLEAU_VERSION = "1.0.0"
@@ -157,6 +220,26 @@ STYLE_ELEMENTS = {
     }
 }
 
+# Style inheritance: each element falls back to its parent for any attribute
+# it supports but does not set. "all" is the root of the cascade.
+STYLE_PARENTS = {
+    "worksheet": "all",
+    "dashboard-title": "all",
+    "story-title": "all",
+    "worksheet-title": "worksheet",
+    "tooltip": "worksheet",
+    "header": "worksheet",
+    "legend": "worksheet",
+    "filter": "worksheet",
+    "parameter-ctrl": "worksheet",
+    "highlighter": "worksheet",
+    "page-ctrl-title": "worksheet",
+    "legend-title": "legend",
+    "filter-title": "filter",
+    "parameter-ctrl-title": "parameter-ctrl",
+    "highlighter-title": "highlighter",
+}
+
 # Preset color palettes for quick theming
 COLOR_PALETTES = {
     "Corporate Blue": {
@@ -191,6 +274,14 @@ COLOR_PALETTES = {
     }
 }
 
+# Which theme attributes each palette role is written to, as "element.attribute"
+PALETTE_RULES = {
+    "primary": ("worksheet-title.font-color", "dashboard-title.font-color", "story-title.font-color"),
+    "secondary": ("legend-title.font-color", "filter-title.font-color", "parameter-ctrl-title.font-color"),
+    "accent": ("mark.mark-color",),
+    "background": ("view.background-color",),
+}
+
 # --- HELPER FUNCTIONS ---
 
 def hex_to_rgb(hex_color):
@@ -210,116 +301,3065 @@ def cmyk_to_hex(c, m, y, k):
     b = round(255 * (1 - y_val) * (1 - k_val))
     return '#{:02x}{:02x}{:02x}'.format(r, g, b)
 
+def hex_to_rgba(hex_color):
+    """Convert 6 or 8 digit hex color to an (r, g, b, alpha) tuple of 0-255 ints"""
+    hex_color = hex_color.lstrip('#')
+    alpha = int(hex_color[6:8], 16) if len(hex_color) == 8 else 255
+    return hex_to_rgb(hex_color) + (alpha,)
+
+def hex_to_cmyk(hex_color):
+    """Convert hex color to CMYK (0-100) tuple"""
+    r, g, b = (channel / 255 for channel in hex_to_rgb(hex_color))
+    k = 1 - max(r, g, b)
+    if k >= 1:
+        return (0, 0, 0, 100)
+    return tuple(round(100 * value) for value in ((1 - r - k) / (1 - k), (1 - g - k) / (1 - k), (1 - b - k) / (1 - k), k))
+
+def keep_alpha(original, new_color):
+    """Carry the alpha suffix of an 8 digit hex color over to a new 6 digit color"""
+    return new_color[:7] + original[7:9]
+
 def validate_hex(color):
     """Validate and fix hex color codes"""
-    if not color:
+    if not color or not isinstance(color, str):
         return "#000000"
     color = color.strip()
     if not color.startswith('#'):
         color = '#' + color
-    if len(color) == 7:
-        return color
-    elif len(color) == 9:  # With transparency
+    # 7 characters, or 9 with transparency
+    if HEX_COLOR_RE.fullmatch(color):
         return color
     return "#000000"
 
-def create_default_theme():
-    """Create a default theme template"""
-    return {
-        "version": TABLEAU_VERSION,
-        "base-theme": "smooth",
-        "styles": {
-            "all": {
-                "font-family": "Tableau Regular",
-                "font-color": "#000000"
-            },
-            "worksheet": {
-                "font-family": "Tableau Regular",
-                "font-color": "#000000",
-                "font-size": 10
-            }
-        }
-    }
+def create_default_theme(catalog=None):
+    """Create a default theme template"""
+    return {
+        "version": TABLEAU_VERSION if catalog is None else catalog.version,
+        "base-theme": "smooth",
+        "styles": {
+            "all": {
+                "font-family": "Tableau Regular",
+                "font-color": "#000000"
+            },
+            "worksheet": {
+                "font-family": "Tableau Regular",
+                "font-color": "#000000",
+                "font-size": 10
+            }
+        }
+    }
+
+# --- COMPILED SCHEMA ---
+# Catalog elements are compiled once into an element -> attribute ->
+# AttributeSpec table, so validation and the attribute editors dispatch with
+# dict lookups instead of matching on attribute names every call. Widget
+# builders come from ATTRIBUTE_WIDGETS, defined with the editors in the UI
+# section; specs are only built once the module has loaded (DEFAULT_CATALOG
+# is compiled at the very end).
+
+class AttributeSpec(NamedTuple):
+    """Compiled description of one style attribute"""
+    kind: str
+    validate: Optional[Callable]
+    widget: Optional[Callable]
+    allowed: Optional[tuple]
+    default: object
+
+def check_color(element, attr, value):
+    """Color attributes must be hex strings"""
+    if not isinstance(value, str) or not value.startswith("#"):
+        return f"Color attribute '{attr}' in '{element}' must be a hex color code (e.g., #FF0000)"
+
+def check_size(element, attr, value):
+    """Sizes and widths must be integers in Tableau's 1-99 range"""
+    if not isinstance(value, int) or value < 1 or value > 99:
+        return f"Size attribute '{attr}' in '{element}' must be an integer between 1-99"
+
+def check_font_family(element, attr, value):
+    """Font families are free text (any installed font) up to 50 characters"""
+    if not isinstance(value, str) or len(value) > 50:
+        return f"Font family '{attr}' in '{element}' must be a string (max 50 characters)"
+
+def check_choice(allowed, element, attr, value):
+    """Enumerated attributes must use one of the allowed values"""
+    if value not in allowed:
+        return f"Attribute '{attr}' in '{element}' must be one of: {', '.join(allowed)}"
+
+def classify_attribute(attr):
+    """Work out what kind of value an attribute holds from its name"""
+    if "color" in attr:
+        return "color"
+    if "font-size" in attr or "line-width" in attr:
+        return "size"
+    if "font-family" in attr:
+        return "font-family"
+    if attr == "font-weight":
+        return "font-weight"
+    if attr == "line-visibility":
+        return "visibility"
+    if attr == "line-pattern":
+        return "pattern"
+    return "other"
+
+# kind -> (validator, allowed values)
+# For font-family the allowed values are suggestions offered by the widget,
+# custom fonts still validate. Line pattern "none" is what earlier versions of
+# the editor offered for an undashed line, so themes saved with it stay valid.
+ATTRIBUTE_KINDS = {
+    "color": (check_color, None),
+    "size": (check_size, None),
+    "font-family": (check_font_family, tuple(TABLEAU_FONTS)),
+    "font-weight": (check_choice, ("normal", "bold")),
+    "visibility": (check_choice, ("on", "off")),
+    "pattern": (check_choice, ("solid", "dashed", "dotted", "none")),
+    "other": (None, None),
+}
+
+@lru_cache(maxsize=None)
+def spec_for_attribute(attr):
+    """Build (and memoize) the spec for an attribute name"""
+    kind = classify_attribute(attr)
+    validate, allowed = ATTRIBUTE_KINDS[kind]
+    if kind == "color":
+        default = "#000000"
+    elif kind == "size":
+        default = 10 if "size" in attr else 1
+    elif allowed:
+        default = allowed[0]
+    else:
+        default = None
+    if validate is check_choice:
+        validate = partial(check_choice, allowed)
+    return AttributeSpec(kind, validate, ATTRIBUTE_WIDGETS.get(kind), allowed, default)
+
+def compile_schema(elements, fonts=None):
+    """Compile a style element catalog into an element -> attribute -> AttributeSpec table
+
+    ``fonts`` replaces the suggested font families of font-family attributes.
+    """
+    font_specs = {}
+    def catalog_spec(attr):
+        spec = spec_for_attribute(attr)
+        if fonts and spec.kind == "font-family":
+            if attr not in font_specs:
+                font_specs[attr] = spec._replace(allowed=tuple(fonts), default=fonts[0])
+            return font_specs[attr]
+        return spec
+    return {
+        element_key: {attr: catalog_spec(attr) for attr in element_info["attributes"]}
+        for element_key, element_info in elements.items()
+    }
+
+def attribute_spec(element, attr, schema=None):
+    """Look up an attribute's spec, falling back to its name for unknown elements"""
+    specs = (DEFAULT_CATALOG.schema if schema is None else schema).get(element)
+    spec = specs.get(attr) if specs is not None else None
+    return spec if spec is not None else spec_for_attribute(attr)
+
+# --- VALIDATION ---
+
+def validate_theme_header(data, catalog=None):
+    """Validate the top-level theme fields (everything except individual style elements)"""
+    catalog = DEFAULT_CATALOG if catalog is None else catalog
+    errors = []
+    warnings = []
+    
+    if not isinstance(data, dict):
+        errors.append("Theme file must be a JSON object")
+        return errors, warnings
+    
+    # Check required fields
+    if "version" not in data:
+        errors.append("Missing required 'version' field")
+    elif data["version"] != catalog.version:
+        warnings.append(f"Version {data['version']} may not match {catalog.label} (expected {catalog.version})")
+    
+    if "styles" not in data:
+        errors.append("Missing required 'styles' object")
+        return errors, warnings
+    
+    # Validate base-theme
+    base_theme = data.get("base-theme", "smooth")
+    if base_theme not in catalog.base_themes:
+        warnings.append(f"Unknown base theme '{base_theme}'. Valid options: {', '.join(catalog.base_themes.keys())}")
+    
+    return errors, warnings
+
+def check_styles(styles, errors, warnings, schema):
+    """Append the problems of (element, properties) pairs to the given lists using a compiled schema"""
+    for element, properties in styles:
+        specs = schema.get(element)
+        if specs is None:
+            warnings.append(f"Unknown style element '{element}' - it may not be supported")
+            specs = {}
+        
+        if not isinstance(properties, dict):
+            errors.append(f"Style element '{element}' must be an object")
+            continue
+        
+        # Validate attributes through the compiled schema
+        for attr, value in properties.items():
+            spec = specs[attr] if attr in specs else spec_for_attribute(attr)
+            if spec.validate is not None:
+                error = spec.validate(element, attr, value)
+                if error:
+                    errors.append(error)
+
+def validate_element(element, properties, catalog=None):
+    """Validate a single style element and its attributes"""
+    errors = []
+    warnings = []
+    catalog = DEFAULT_CATALOG if catalog is None else catalog
+    check_styles(((element, properties),), errors, warnings, catalog.schema)
+    return errors, warnings
+
+def validate_theme(data, catalog=None):
+    """Comprehensive theme validation against a catalog (the built-in one by default)"""
+    catalog = DEFAULT_CATALOG if catalog is None else catalog
+    errors, warnings = validate_theme_header(data, catalog)
+    if not isinstance(data, dict) or "styles" not in data:
+        return errors, warnings
+    
+    # Validate style elements
+    check_styles(data.get("styles", {}).items(), errors, warnings, catalog.schema)
+    
+    return errors, warnings
+
+def element_content_key(properties):
+    """Type-aware snapshot of a style element, compared by equality to detect changes
+
+    Value types are part of the key because 10 == 10.0 and 1 == True, yet
+    validation treats them differently.
+    """
+    if isinstance(properties, dict):
+        try:
+            return frozenset((attr, type(value), value) for attr, value in properties.items())
+        except TypeError:
+            # Nested lists/objects in hand-edited JSON are not hashable
+            return json.dumps(properties, sort_keys=True, default=str)
+    return (type(properties), repr(properties))
+
+class IncrementalValidator:
+    """Validator that caches results per style element
+
+    Results are keyed by a type-aware snapshot of each ``styles[element]`` dict, so
+    a rerun only re-checks the elements that actually changed. The combined
+    error and warning lists are rebuilt only when some element's result did.
+    Produces the same output as ``validate_theme``.
+    """
+
+    def __init__(self, catalog=None):
+        self.catalog = DEFAULT_CATALOG if catalog is None else catalog
+        self.element_results = {}
+        self.errors = []
+        self.warnings = []
+        self._order = ()
+        self._element_errors = []
+        self._element_warnings = []
+
+    def validate(self, data):
+        """Validate a theme, re-checking only changed elements"""
+        errors, warnings = validate_theme_header(data, self.catalog)
+        if not isinstance(data, dict) or "styles" not in data:
+            self.element_results.clear()
+            self._order = ()
+            self.errors, self.warnings = errors, warnings
+            return self.errors, self.warnings
+        
+        styles = data.get("styles", {})
+        changed = tuple(styles) != self._order
+        for element, properties in styles.items():
+            content_key = element_content_key(properties)
+            cached = self.element_results.get(element)
+            if cached is None or cached[0] != content_key:
+                self.element_results[element] = (content_key, *validate_element(element, properties, self.catalog))
+                changed = True
+        
+        if changed:
+            # Drop results for removed elements and rebuild in theme order
+            for element in set(self.element_results) - set(styles):
+                del self.element_results[element]
+            self._order = tuple(styles)
+            self._element_errors = [e for element in self._order for e in self.element_results[element][1]]
+            self._element_warnings = [w for element in self._order for w in self.element_results[element][2]]
+        
+        self.errors = errors + self._element_errors
+        self.warnings = warnings + self._element_warnings
+        return self.errors, self.warnings
+
+# --- PALETTE RULES ---
+
+class PaletteChange(NamedTuple):
+    element: str
+    attribute: str
+    role: str
+    old: object
+    new: str
+
+class PalettePlan:
+    """Palette rules (role -> "element.attribute" targets) compiled once into a flat apply plan
+
+    Rules are checked against a catalog (the built-in one by default) when the
+    plan is built, and palettes once per apply, so applying to a theme is only
+    the dict writes. Targets the catalog doesn't define (an organization
+    catalog may remove elements) are left out and listed in ``skipped`` as
+    (role, target) pairs; a role left without targets needs no palette color.
+    """
+
+    def __init__(self, rules, catalog=None):
+        catalog = DEFAULT_CATALOG if catalog is None else catalog
+        elements = catalog.elements
+        self.rules = {}
+        targets = []
+        skipped = []
+        for role, role_targets in rules.items():
+            if isinstance(role_targets, str):
+                role_targets = (role_targets,)
+            parsed = []
+            for target in role_targets:
+                element, _, attr = str(target).partition(".")
+                if element not in elements or attr not in elements[element]["attributes"]:
+                    skipped.append((role, str(target)))
+                    continue
+                if attribute_spec(element, attr, catalog.schema).kind != "color":
+                    raise ValueError(f"Palette rule for '{role}' targets '{target}', which is not a color")
+                parsed.append((element, attr))
+                targets.append((element, attr, role))
+            if parsed:
+                self.rules[role] = tuple(parsed)
+        self.targets = tuple(targets)
+        self.skipped = tuple(skipped)
+
+    def values(self, palette_colors):
+        """The color written to each target, raises ValueError for a missing or invalid role color"""
+        missing = [role for role in self.rules if role not in palette_colors]
+        if missing:
+            raise ValueError(f"Palette has no color for: {', '.join(missing)}")
+        for role in self.rules:
+            error = check_color("palette", role, palette_colors[role])
+            if error:
+                raise ValueError(error)
+        return [palette_colors[role] for _, _, role in self.targets]
+
+    def changes(self, theme_data, palette_colors):
+        """What applying the palette would change, without touching the theme"""
+        styles = theme_data.get("styles", {})
+        changes = []
+        for (element, attr, role), value in zip(self.targets, self.values(palette_colors)):
+            properties = styles.get(element)
+            old = properties.get(attr) if isinstance(properties, dict) else None
+            if old != value:
+                changes.append(PaletteChange(element, attr, role, old, value))
+        return changes
+
+    def apply(self, theme_data, palette_colors):
+        """Write the palette into a theme in place and return it"""
+        return self.apply_many([theme_data], palette_colors)[0]
+
+    def apply_many(self, themes, palette_colors):
+        """Write the palette into many themes in place, checking the palette only once"""
+        writes = list(zip(self.targets, self.values(palette_colors)))
+        for theme_data in themes:
+            styles = theme_data.setdefault("styles", {})
+            for (element, attr, _), value in writes:
+                properties = styles.get(element)
+                if properties is None:
+                    properties = styles[element] = {}
+                elif not isinstance(properties, dict):
+                    raise ValueError(f"Style element '{element}' must be an object")
+                properties[attr] = value
+        return themes
+
+# (rules path, catalog id, catalog dependencies) -> PalettePlan
+PALETTE_PLAN_MEMO = {}
+
+def load_palette_plan(path=None, catalog=None):
+    """Plan for a JSON rules file ({"role": ["element.attribute", ...]}), or PALETTE_RULES
+
+    Targets are resolved through ``catalog`` (the built-in one by default), so
+    rules may name elements that only an organization catalog defines.
+    """
+    catalog = DEFAULT_CATALOG if catalog is None else catalog
+    key = (path, catalog.id, catalog.dependencies)
+    plan = PALETTE_PLAN_MEMO.get(key)
+    if plan is not None:
+        return plan
+    if path is None:
+        rules = PALETTE_RULES
+    else:
+        with open(path, encoding="utf-8") as f:
+            rules = json.load(f)
+        if not isinstance(rules, dict):
+            raise ValueError("Palette rules must be a JSON object of role -> targets")
+    plan = PALETTE_PLAN_MEMO[key] = PalettePlan(rules, catalog)
+    return plan
+
+def check_palette_plan(plan, palette_colors, catalog):
+    """Check a plan can apply a palette, returning warnings for the targets it skipped
+
+    Raises ValueError if the palette doesn't fit or no target exists in the catalog.
+    """
+    plan.values(palette_colors)
+    if not plan.targets:
+        raise ValueError(f"no rule targets an attribute that {catalog.label} defines")
+    return [
+        f"Palette rule for '{role}' skips '{target}', which {catalog.label} doesn't define"
+        for role, target in plan.skipped
+    ]
+
+def apply_palette(theme_data, palette_colors, catalog=None):
+    """Apply a color palette to the theme"""
+    return load_palette_plan(catalog=catalog).apply(theme_data, palette_colors)
+
+# --- COLOR ENGINE ---
+# Vectorized conversions over whole arrays of colors. RGBA arrays are float64
+# with channels in 0-1 and shape (..., 4); hex parsing accepts 6 and 8 digit
+# colors (with or without '#') so alpha is never silently dropped.
+
+# ASCII code -> hex nibble, 255 marks characters that are not hex digits
+_HEX_NIBBLES = np.full(256, 255, dtype=np.uint8)
+for _code, _char in enumerate("0123456789abcdef"):
+    _HEX_NIBBLES[ord(_char)] = _code
+    _HEX_NIBBLES[ord(_char.upper())] = _code
+
+def hex_to_rgba_array(colors):
+    """Parse hex colors into an (N, 4) RGBA array plus a mask of which inputs were valid
+
+    Invalid entries come back as opaque black with ``valid`` False.
+    """
+    normalized = []
+    for color in colors:
+        digits = color.strip().lstrip("#") if isinstance(color, str) else ""
+        if len(digits) == 6:
+            digits += "ff"
+        normalized.append(digits if len(digits) == 8 and digits.isascii() else "xxxxxxxx")
+    if not normalized:
+        return np.zeros((0, 4)), np.zeros(0, dtype=bool)
+    nibbles = _HEX_NIBBLES[np.frombuffer("".join(normalized).encode("ascii"), dtype=np.uint8)].reshape(-1, 4, 2)
+    valid = (nibbles != 255).all(axis=(1, 2))
+    rgba = (nibbles[..., 0].astype(np.float64) * 16 + nibbles[..., 1]) / 255
+    rgba[~valid] = (0.0, 0.0, 0.0, 1.0)
+    return rgba, valid
+
+def rgba_array_to_hex(rgba):
+    """Format an (N, 3) or (N, 4) array as hex strings, using 8 digits only where alpha < 1"""
+    rgba = np.asarray(rgba, dtype=np.float64).reshape(-1, np.shape(rgba)[-1])
+    channels = np.rint(np.clip(rgba, 0, 1) * 255).astype(np.uint8)
+    digits = channels.tobytes().hex().upper()
+    width = channels.shape[1] * 2
+    translucent = channels[:, 3] < 255 if channels.shape[1] == 4 else np.zeros(len(channels), dtype=bool)
+    return [
+        "#" + digits[i * width:i * width + (8 if translucent[i] else 6)]
+        for i in range(len(channels))
+    ]
+
+def srgb_to_linear(rgb):
+    """Undo the sRGB transfer curve"""
+    rgb = np.asarray(rgb, dtype=np.float64)
+    return np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+
+def linear_to_srgb(rgb):
+    """Apply the sRGB transfer curve"""
+    rgb = np.clip(np.asarray(rgb, dtype=np.float64), 0, 1)
+    return np.where(rgb <= 0.0031308, rgb * 12.92, 1.055 * rgb ** (1 / 2.4) - 0.055)
+
+def rgb_to_cmyk_array(rgb):
+    """RGB (0-1) to CMYK (0-1), last axis of size 3 -> 4"""
+    rgb = np.asarray(rgb, dtype=np.float64)[..., :3]
+    k = 1 - rgb.max(axis=-1)
+    scale = np.where(k < 1, 1 - k, 1)
+    cmy = np.where((k < 1)[..., None], (1 - rgb - k[..., None]) / scale[..., None], 0)
+    return np.concatenate([cmy, k[..., None]], axis=-1)
+
+def cmyk_to_rgb_array(cmyk):
+    """CMYK (0-1) to RGB (0-1), last axis of size 4 -> 3"""
+    cmyk = np.asarray(cmyk, dtype=np.float64)
+    return (1 - cmyk[..., :3]) * (1 - cmyk[..., 3:4])
+
+def rgb_to_hsl_array(rgb):
+    """RGB (0-1) to HSL with hue in degrees and saturation/lightness in 0-1"""
+    rgb = np.asarray(rgb, dtype=np.float64)[..., :3]
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    high, low = rgb.max(axis=-1), rgb.min(axis=-1)
+    delta = high - low
+    lightness = (high + low) / 2
+    chromatic = delta > 0
+    safe_delta = np.where(chromatic, delta, 1)
+    saturation = np.where(chromatic, delta / np.maximum(1 - np.abs(2 * lightness - 1), 1e-12), 0)
+    hue = np.select(
+        [high == r, high == g],
+        [((g - b) / safe_delta) % 6, (b - r) / safe_delta + 2],
+        (r - g) / safe_delta + 4
+    )
+    hue = np.where(chromatic, hue * 60, 0)
+    return np.stack([hue, saturation, lightness], axis=-1)
+
+def hsl_to_rgb_array(hsl):
+    """HSL (hue in degrees, s/l in 0-1) to RGB (0-1)"""
+    hsl = np.asarray(hsl, dtype=np.float64)
+    hue, saturation, lightness = hsl[..., 0:1], hsl[..., 1:2], hsl[..., 2:3]
+    k = (np.array([0, 8, 4]) + hue / 30) % 12
+    a = saturation * np.minimum(lightness, 1 - lightness)
+    return lightness - a * np.clip(np.minimum(k - 3, 9 - k), -1, 1)
+
+_LINEAR_TO_LMS = np.array([
+    [0.4122214708, 0.5363325363, 0.0514459929],
+    [0.2119034982, 0.6806995451, 0.1073969566],
+    [0.0883024619, 0.2817188376, 0.6299787005],
+])
+_LMS_TO_OKLAB = np.array([
+    [0.2104542553, 0.7936177850, -0.0040720468],
+    [1.9779984951, -2.4285922050, 0.4505937099],
+    [0.0259040371, 0.7827717662, -0.8086757660],
+])
+_OKLAB_TO_LMS = np.linalg.inv(_LMS_TO_OKLAB)
+_LMS_TO_LINEAR = np.linalg.inv(_LINEAR_TO_LMS)
+
+def rgb_to_oklab_array(rgb):
+    """sRGB (0-1) to OKLab (L in 0-1, a/b roughly -0.4-0.4)"""
+    linear = srgb_to_linear(np.asarray(rgb, dtype=np.float64)[..., :3])
+    return np.cbrt(linear @ _LINEAR_TO_LMS.T) @ _LMS_TO_OKLAB.T
+
+def oklab_to_rgb_array(lab):
+    """OKLab to sRGB (0-1), clipped to the sRGB gamut"""
+    lms = (np.asarray(lab, dtype=np.float64) @ _OKLAB_TO_LMS.T) ** 3
+    return linear_to_srgb(lms @ _LMS_TO_LINEAR.T)
+
+def collect_theme_colors(themes):
+    """Gather every color attribute across themes as (locations, RGBA array, valid mask)
+
+    ``locations`` holds (theme index, element, attribute) for each row, which is
+    what ``write_theme_colors`` needs to put transformed colors back.
+    """
+    locations = []
+    values = []
+    for index, data in enumerate(themes):
+        styles = data.get("styles", {}) if isinstance(data, dict) else {}
+        for element, properties in styles.items():
+            if not isinstance(properties, dict):
+                continue
+            for attr, value in properties.items():
+                if attribute_spec(element, attr).kind == "color":
+                    locations.append((index, element, attr))
+                    values.append(value)
+    rgba, valid = hex_to_rgba_array(values)
+    return locations, rgba, valid
+
+def write_theme_colors(themes, locations, rgba, valid=None):
+    """Write an RGBA array back into the theme attributes it was collected from"""
+    hex_colors = rgba_array_to_hex(rgba)
+    for row, (index, element, attr) in enumerate(locations):
+        if valid is None or valid[row]:
+            themes[index]["styles"][element][attr] = hex_colors[row]
+    return themes
+
+def recolor_themes(themes, transform):
+    """Apply a vectorized RGBA -> RGBA transform to every valid color in many themes at once"""
+    locations, rgba, valid = collect_theme_colors(themes)
+    if len(locations):
+        rgba[valid] = transform(rgba[valid])
+    return write_theme_colors(themes, locations, rgba, valid)
+
+# --- PALETTE SNAPPING ---
+# Maps free-typed colors onto an allowed (brand) palette. Distances are
+# Euclidean in OKLab (delta E OK), where about 0.02 is a just noticeable difference.
+
+SNAP_CHUNK_SIZE = 8192
+
+class ColorSnap(NamedTuple):
+    theme: int
+    element: str
+    attribute: str
+    original: str
+    snapped: str
+    distance: float
+    applied: bool
+
+class NearestColorIndex:
+    """Nearest palette color for whole arrays of colors at once"""
+
+    def __init__(self, colors):
+        rgba, valid = hex_to_rgba_array(list(colors))
+        if not len(rgba):
+            raise ValueError("The palette has no colors")
+        if not valid.all():
+            bad = [color for color, ok in zip(colors, valid) if not ok]
+            raise ValueError(f"Invalid palette color(s): {', '.join(map(str, bad))}")
+        self.rgb = rgba[:, :3]
+        self.colors = rgba_array_to_hex(self.rgb)
+        self.lab = rgb_to_oklab_array(rgba)
+        self._norms = (self.lab ** 2).sum(axis=1)
+
+    def query(self, rgba):
+        """Index of the nearest palette color and its distance for each RGBA row"""
+        lab = rgb_to_oklab_array(rgba).reshape(-1, 3)
+        indices = np.empty(len(lab), dtype=np.intp)
+        distances = np.empty(len(lab))
+        # |x - p|^2 = |x|^2 - 2 x.p + |p|^2, in chunks so huge sweeps stay bounded in memory
+        for start in range(0, len(lab), SNAP_CHUNK_SIZE):
+            chunk = lab[start:start + SNAP_CHUNK_SIZE]
+            squared = self._norms - 2 * chunk @ self.lab.T
+            nearest = squared.argmin(axis=1)
+            indices[start:start + len(chunk)] = nearest
+            best = squared[np.arange(len(chunk)), nearest] + (chunk ** 2).sum(axis=1)
+            distances[start:start + len(chunk)] = np.sqrt(np.maximum(best, 0))
+        return indices, distances
+
+@lru_cache(maxsize=32)
+def nearest_color_index(colors):
+    """Shared index for a palette, given as a tuple of hex colors"""
+    return NearestColorIndex(colors)
+
+def palette_colors(palette=None, colors=None):
+    """Allowed colors from a preset palette name and/or a comma separated list, deduplicated"""
+    allowed = list(COLOR_PALETTES[palette].values()) if palette else []
+    if colors:
+        allowed += [color.strip() for color in colors.split(",") if color.strip()]
+    return tuple(dict.fromkeys(color.upper() for color in allowed))
+
+def snap_themes_to_palette(themes, index, max_distance=None):
+    """Replace every valid color in many themes with its nearest palette color
+
+    Alpha is kept from the original color. Colors further than ``max_distance``
+    from every palette color are left alone and reported with applied False.
+    Returns the themes (modified in place) and one ColorSnap per color.
+    """
+    locations, rgba, valid = collect_theme_colors(themes)
+    if not len(locations):
+        return themes, []
+    nearest, distances = index.query(rgba)
+    apply = valid if max_distance is None else valid & (distances <= max_distance)
+    snapped = np.concatenate([index.rgb[nearest], rgba[:, 3:]], axis=1)
+    originals = rgba_array_to_hex(rgba)
+    targets = rgba_array_to_hex(snapped)
+    write_theme_colors(themes, locations, snapped, apply)
+    distances = np.round(distances, 4).tolist()
+    applied = apply.tolist()
+    report = [
+        ColorSnap(theme, element, attr, originals[row], targets[row], distances[row], applied[row])
+        for row, (theme, element, attr) in enumerate(locations)
+        if valid[row]
+    ]
+    return themes, report
+
+# --- SERIALIZATION ---
+
+# Tableau rejects theme files larger than this
+MAX_THEME_BYTES = 15000
+
+def dumps_theme(data, pretty=True, fast=True):
+    """Serialize a theme to UTF-8 bytes, using orjson when it is installed
+
+    Pretty output matches json.dumps(indent=2) apart from non-ASCII text,
+    which orjson writes as UTF-8 instead of escaping.
+    """
+    if fast and orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+        except TypeError:
+            # Non-string keys or out of range integers, let json handle them
+            pass
+    if pretty:
+        return json.dumps(data, indent=2).encode("utf-8")
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+class SerializedTheme:
+    """Pretty and compact serializations of one theme revision, computed on demand"""
+
+    def __init__(self, data, revision, fast=True, catalog=None):
+        self.revision = revision
+        self.data = data
+        self.catalog = catalog
+        self._fast = fast
+        self._pretty = None
+        self._compact = None
+        self._optimized = {}
+
+    @property
+    def pretty_bytes(self):
+        if self._pretty is None:
+            self._pretty = dumps_theme(self.data, pretty=True, fast=self._fast)
+        return self._pretty
+
+    @property
+    def compact_bytes(self):
+        if self._compact is None:
+            self._compact = dumps_theme(self.data, pretty=False, fast=self._fast)
+        return self._compact
+
+    @property
+    def pretty(self):
+        return self.pretty_bytes.decode("utf-8")
+
+    @property
+    def size(self):
+        """Size in bytes of the pretty (exported) output"""
+        return len(self.pretty_bytes)
+
+    @property
+    def compact_size(self):
+        return len(self.compact_bytes)
+
+    @property
+    def too_large(self):
+        return self.size > MAX_THEME_BYTES
+
+    def optimized(self, rules=None):
+        """Size-optimized export of this revision (default rules unless given), see optimize_theme"""
+        rules = OPTIMIZE_RULES if rules is None else rules
+        if rules not in self._optimized:
+            self._optimized[rules] = optimize_theme(self.data, rules, fast=self._fast, catalog=self.catalog)
+        return self._optimized[rules]
+
+class ThemeSerializer:
+    """Versioned serialization cache shared by export, size check and JSON editor
+
+    Serializations are keyed by the theme revision, which every mutation path
+    bumps, so each revision is serialized at most once per output format.
+    """
+
+    def __init__(self, fast=True, catalog=None):
+        self.fast = fast
+        self.catalog = catalog
+        self._cached = None
+
+    def serialize(self, data, revision):
+        """Return the cached serialization for this revision, serializing lazily on a miss"""
+        cached = self._cached
+        if cached is None or cached.revision != revision or cached.data is not data:
+            cached = self._cached = SerializedTheme(data, revision, fast=self.fast, catalog=self.catalog)
+        return cached
+
+# --- HISTORY ---
+# Undo/redo stores RFC 6902 JSON patches (forward and inverse) instead of
+# deep copies of the theme. The only full copy kept is the last committed
+# state, which new edits are diffed against.
+
+HISTORY_MAX_BYTES = 64 * 1024
+HISTORY_MAX_ENTRIES = 200
+
+def json_pointer(parts):
+    """Build an RFC 6901 JSON pointer from path parts"""
+    return "".join("/" + str(part).replace("~", "~0").replace("/", "~1") for part in parts)
+
+def parse_json_pointer(pointer):
+    """Split an RFC 6901 JSON pointer into its path parts"""
+    if not pointer:
+        return []
+    return [part.replace("~1", "/").replace("~0", "~") for part in pointer[1:].split("/")]
+
+def same_json_value(a, b):
+    """Equality that, unlike ==, tells 1, 1.0 and True apart"""
+    return type(a) is type(b) and a == b
+
+def diff_json(old, new, path=()):
+    """Compute an RFC 6902 patch (add/remove/replace ops) turning old into new
+
+    Objects are diffed key by key; any other changed value is replaced whole.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key, value in old.items():
+            if key not in new:
+                ops.append({"op": "remove", "path": json_pointer(path + (key,))})
+            else:
+                ops.extend(diff_json(value, new[key], path + (key,)))
+        for key, value in new.items():
+            if key not in old:
+                ops.append({"op": "add", "path": json_pointer(path + (key,)), "value": copy.deepcopy(value)})
+        return ops
+    if same_json_value(old, new):
+        return []
+    return [{"op": "replace", "path": json_pointer(path), "value": copy.deepcopy(new)}]
+
+def apply_json_patch(doc, ops):
+    """Apply add/remove/replace ops to a JSON document in place and return it"""
+    for op in ops:
+        parts = parse_json_pointer(op["path"])
+        if not parts:
+            # Whole-document replace, keep the caller's object identity
+            doc.clear()
+            doc.update(copy.deepcopy(op["value"]))
+            continue
+        parent = doc
+        for part in parts[:-1]:
+            parent = parent[int(part) if isinstance(parent, list) else part]
+        key = int(parts[-1]) if isinstance(parent, list) else parts[-1]
+        if op["op"] == "remove":
+            del parent[key]
+        elif op["op"] in ("add", "replace"):
+            parent[key] = copy.deepcopy(op["value"])
+        else:
+            raise ValueError(f"Unsupported patch op '{op['op']}'")
+    return doc
+
+class ThemeHistory:
+    """Bounded undo/redo history of JSON patches
+
+    Each entry holds the forward and inverse patch for one change. Entries
+    are evicted oldest-first once the history exceeds ``max_bytes`` (measured
+    as serialized patch size) or ``max_entries``.
+    """
+
+    def __init__(self, max_bytes=HISTORY_MAX_BYTES, max_entries=HISTORY_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.memory_bytes = 0
+        self._snapshot = None
+
+    @property
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    @property
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def reset(self, data=None):
+        """Forget all history and start tracking from this state"""
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.memory_bytes = 0
+        self._snapshot = copy.deepcopy(data) if isinstance(data, dict) else None
+
+    def record(self, data):
+        """Record the change from the last committed state to data, returns True if anything changed"""
+        if not isinstance(data, dict):
+            return False
+        if self._snapshot is None:
+            self._snapshot = copy.deepcopy(data)
+            return False
+        forward = diff_json(self._snapshot, data)
+        if not forward:
+            return False
+        inverse = diff_json(data, self._snapshot)
+        apply_json_patch(self._snapshot, forward)
+        self._push(self.undo_stack, (forward, inverse))
+        for entry in self.redo_stack:
+            self.memory_bytes -= entry[2]
+        self.redo_stack.clear()
+        self._evict()
+        return True
+
+    def undo(self, data):
+        """Revert the latest change in place, returns True if there was one"""
+        if not self.undo_stack:
+            return False
+        forward, inverse, size = self.undo_stack.pop()
+        apply_json_patch(data, inverse)
+        apply_json_patch(self._snapshot, inverse)
+        self.redo_stack.append((forward, inverse, size))
+        return True
+
+    def redo(self, data):
+        """Re-apply the latest undone change in place, returns True if there was one"""
+        if not self.redo_stack:
+            return False
+        forward, inverse, size = self.redo_stack.pop()
+        apply_json_patch(data, forward)
+        apply_json_patch(self._snapshot, forward)
+        self.undo_stack.append((forward, inverse, size))
+        return True
+
+    def _push(self, stack, patches):
+        size = len(json.dumps(patches, separators=(",", ":")))
+        stack.append(patches + (size,))
+        self.memory_bytes += size
+
+    def _evict(self):
+        while self.undo_stack and (self.memory_bytes > self.max_bytes or len(self.undo_stack) > self.max_entries):
+            self.memory_bytes -= self.undo_stack.popleft()[2]
+
+# --- THEME MODEL ---
+
+class ThemeModel:
+    """The theme being edited, with change tracking
+
+    Every mutation goes through a method that compares against the stored
+    value, so rerunning widgets with unchanged values writes nothing. Real
+    changes bump ``revision`` and record it per element, which caches (export,
+    validation) key on. Elements without attributes are left out of
+    ``to_dict``, so browsing the editor never adds empty objects to the file.
+    """
+
+    __slots__ = ("version", "base_theme", "styles", "extra", "revision",
+                 "element_revisions", "header_revision", "_dict", "_dict_revision")
+
+    def __init__(self, data=None):
+        self.version = TABLEAU_VERSION
+        self.base_theme = "smooth"
+        self.styles = {}
+        self.extra = {}
+        self.revision = 0
+        self.element_revisions = {}
+        self.header_revision = 0
+        self._dict = None
+        self._dict_revision = -1
+        if data is not None:
+            self.load(data)
+
+    def get(self, element, attr, default=None):
+        """Current value of an attribute, or default when it is not set"""
+        properties = self.styles.get(element)
+        if not isinstance(properties, dict):
+            return default
+        return properties.get(attr, default)
+
+    def has_element(self, element):
+        """True if the element has at least one attribute set"""
+        return bool(self.styles.get(element))
+
+    def set(self, element, attr, value):
+        """Set one attribute, returns True if the theme changed"""
+        return self.update(element, {attr: value})
+
+    def update(self, element, values):
+        """Set several attributes of one element as a single change"""
+        properties = self.styles.get(element)
+        if not isinstance(properties, dict):
+            properties = {}
+        changed = {
+            attr: value for attr, value in values.items()
+            if attr not in properties or not same_json_value(properties[attr], value)
+        }
+        if not changed:
+            return False
+        properties.update(changed)
+        self.styles[element] = properties
+        self._touch(element)
+        return True
+
+    def unset(self, element, attr):
+        """Remove one attribute, dropping the element once it is empty"""
+        properties = self.styles.get(element)
+        if not isinstance(properties, dict) or attr not in properties:
+            return False
+        del properties[attr]
+        if not properties:
+            del self.styles[element]
+        self._touch(element)
+        return True
+
+    def remove_element(self, element):
+        """Remove a style element and all its attributes"""
+        if element not in self.styles:
+            return False
+        del self.styles[element]
+        self._touch(element)
+        return True
+
+    def set_base_theme(self, base_theme):
+        """Change the base theme, returns True if it differs"""
+        if self.base_theme == base_theme:
+            return False
+        self.base_theme = base_theme
+        self._touch(None)
+        return True
+
+    def load(self, data):
+        """Replace the contents with a theme dict, touching only what differs
+
+        Raises ValueError if data is not a theme-shaped JSON object.
+        """
+        if not isinstance(data, dict):
+            raise ValueError("Theme file must be a JSON object")
+        styles = data.get("styles", {})
+        if not isinstance(styles, dict):
+            raise ValueError("'styles' must be a JSON object")
+        
+        changed = set()
+        extra = {key: value for key, value in data.items() if key not in ("version", "base-theme", "styles")}
+        if (data.get("version"), data.get("base-theme")) != (self.version, self.base_theme) or diff_json(self.extra, extra):
+            self.version = data.get("version")
+            self.base_theme = data.get("base-theme")
+            self.extra = copy.deepcopy(extra)
+            changed.add(None)
+        for element in list(self.styles):
+            if element not in styles:
+                del self.styles[element]
+                changed.add(element)
+        for element, properties in styles.items():
+            if element not in self.styles or diff_json(self.styles[element], properties):
+                # Non-object elements are kept as-is so validation can report them
+                self.styles[element] = copy.deepcopy(properties)
+                changed.add(element)
+        
+        if changed:
+            self.revision += 1
+            for element in changed:
+                self._mark(element)
+        return bool(changed)
+
+    def changed_since(self, revision):
+        """Elements changed after the given revision (None stands for the header fields)"""
+        changed = {element for element, rev in self.element_revisions.items() if rev > revision}
+        if self.header_revision > revision:
+            changed.add(None)
+        return changed
+
+    def to_dict(self):
+        """Theme as a plain dict, cached per revision; treat the result as read-only"""
+        if self._dict_revision != self.revision:
+            data = {}
+            if self.version is not None:
+                data["version"] = self.version
+            if self.base_theme is not None:
+                data["base-theme"] = self.base_theme
+            data["styles"] = {
+                element: dict(properties) if isinstance(properties, dict) else properties
+                for element, properties in self.styles.items()
+                if properties or not isinstance(properties, dict)
+            }
+            data.update(self.extra)
+            self._dict = data
+            self._dict_revision = self.revision
+        return self._dict
+
+    def _touch(self, element):
+        self.revision += 1
+        self._mark(element)
+
+    def _mark(self, element):
+        if element is None:
+            self.header_revision = self.revision
+        else:
+            self.element_revisions[element] = self.revision
+
+# --- CASCADE ---
+
+class CascadeResolver:
+    """Effective (inherited) style of each element, memoized per theme revision
+
+    An element's resolved style is its parent's resolved style, limited to the
+    attributes the element supports, overlaid with what the element sets
+    itself. Results are cached per element; when the theme changes only the
+    changed elements and their descendants in STYLE_PARENTS are recomputed.
+    """
+
+    def __init__(self, parents=None, elements=None):
+        self.parents = STYLE_PARENTS if parents is None else parents
+        self.elements = STYLE_ELEMENTS if elements is None else elements
+        self.children = {}
+        for child, parent in self.parents.items():
+            self.children.setdefault(parent, []).append(child)
+        self._theme = None
+        self._revision = -1
+        self._cache = {}
+
+    def resolve(self, theme, element):
+        """Resolved attribute -> value dict for one element; treat it as read-only"""
+        self._sync(theme)
+        return self._resolve(element)[0]
+
+    def source(self, theme, element, attr):
+        """The element the resolved value of attr comes from, or None if nothing sets it"""
+        self._sync(theme)
+        return self._resolve(element)[1].get(attr)
+
+    def effective_styles(self, theme):
+        """Resolved styles of every catalog element and every element the theme sets"""
+        self._sync(theme)
+        elements = list(self.elements) + [element for element in theme.styles if element not in self.elements]
+        return {element: self._resolve(element)[0] for element in elements}
+
+    def _sync(self, theme):
+        if theme is not self._theme or theme.revision < self._revision:
+            self._theme = theme
+            self._cache.clear()
+        elif theme.revision != self._revision:
+            for element in theme.changed_since(self._revision):
+                if element is not None:
+                    self._invalidate(element)
+        self._revision = theme.revision
+
+    def _invalidate(self, element):
+        stack = [element]
+        while stack:
+            element = stack.pop()
+            self._cache.pop(element, None)
+            stack.extend(self.children.get(element, ()))
+
+    def _resolve(self, element):
+        cached = self._cache.get(element)
+        if cached is None:
+            parent = self.parents.get(element)
+            values, sources = {}, {}
+            if parent is not None:
+                parent_values, parent_sources = self._resolve(parent)
+                supported = self.elements.get(element, {}).get("attributes", ())
+                for attr in supported:
+                    if attr in parent_values:
+                        values[attr] = parent_values[attr]
+                        sources[attr] = parent_sources[attr]
+            own = self._theme.styles.get(element)
+            if isinstance(own, dict):
+                values.update(own)
+                sources.update(dict.fromkeys(own, element))
+            cached = self._cache[element] = (values, sources)
+        return cached
+
+# --- CONTRAST AUDIT ---
+# WCAG 2.x contrast of every element's text color against the background it
+# is drawn on, from resolved (inherited) styles. Translucent colors are
+# composited first: the background over the page, then the text over that.
+
+CONTRAST_PAGE_COLOR = "#FFFFFF"
+# level -> (normal text, large text) minimum ratios
+CONTRAST_LEVELS = {"AA": (4.5, 3.0), "AAA": (7.0, 4.5)}
+# Backgrounds text is drawn on besides its own and its ancestors' (worksheet text sits on the view)
+CONTRAST_BACKDROPS = {"worksheet": "view"}
+_LUMINANCE_WEIGHTS = np.array([0.2126, 0.7152, 0.0722])
+
+class ContrastResult(NamedTuple):
+    element: str
+    text_color: str
+    background: str
+    background_source: Optional[str]
+    ratio: float
+    required: float
+    large_text: bool
+
+    @property
+    def passed(self):
+        return self.ratio >= self.required
+
+def contrast_pairs(parents, elements):
+    """(text element, background elements nearest first) for every element with a font color"""
+    pairs = []
+    for element, info in elements.items():
+        if "font-color" not in info.get("attributes", ()):
+            continue
+        chain = []
+        current = element
+        while current is not None and current not in chain:
+            chain.append(current)
+            current = parents.get(current)
+        backgrounds = [c for c in chain if "background-color" in elements.get(c, {}).get("attributes", ())]
+        backdrop = CONTRAST_BACKDROPS.get(element)
+        if backdrop in elements:
+            backgrounds.append(backdrop)
+        pairs.append((element, tuple(backgrounds)))
+    return pairs
+
+def composite_array(rgba, backdrop):
+    """Alpha-composite (N, 4) colors over (N, 3) or (3,) opaque backdrops"""
+    alpha = rgba[:, 3:4]
+    return rgba[:, :3] * alpha + backdrop * (1 - alpha)
+
+def relative_luminance_array(rgb):
+    """WCAG relative luminance of sRGB (0-1) colors"""
+    return srgb_to_linear(rgb) @ _LUMINANCE_WEIGHTS
+
+def contrast_ratio_array(foreground, background):
+    """WCAG contrast ratio (1-21) between opaque sRGB colors, row by row"""
+    a = relative_luminance_array(foreground)
+    b = relative_luminance_array(background)
+    return (np.maximum(a, b) + 0.05) / (np.minimum(a, b) + 0.05)
+
+def audit_contrast(theme, resolver=None, catalog=None, level="AA"):
+    """Contrast of every text/background pair in a theme (dict or ThemeModel), one ContrastResult per element
+
+    Large text (18pt, or 14pt bold) needs the lower ratio of the level.
+    Pairs with a color that is not valid hex are skipped; validation reports those.
+    """
+    catalog = catalog or DEFAULT_CATALOG
+    if isinstance(theme, dict):
+        theme = ThemeModel(theme)
+    resolver = resolver or CascadeResolver(catalog.parents, catalog.elements)
+    normal, large = CONTRAST_LEVELS[level]
+    rows = []
+    for element, backgrounds in contrast_pairs(catalog.parents, catalog.elements):
+        style = resolver.resolve(theme, element)
+        text = style.get("font-color", attribute_spec(element, "font-color", catalog.schema).default)
+        background, source = CONTRAST_PAGE_COLOR, None
+        for candidate in backgrounds:
+            value = resolver.resolve(theme, candidate).get("background-color")
+            if value is not None:
+                background, source = value, candidate
+                break
+        size = style.get("font-size", attribute_spec(element, "font-size", catalog.schema).default)
+        size = size if isinstance(size, (int, float)) else 0
+        is_large = size >= 18 or (size >= 14 and style.get("font-weight") == "bold")
+        rows.append((element, text, background, source, is_large))
+    if not rows:
+        return []
+
+    text_rgba, text_valid = hex_to_rgba_array([row[1] for row in rows])
+    background_rgba, background_valid = hex_to_rgba_array([row[2] for row in rows])
+    page = hex_to_rgba_array([CONTRAST_PAGE_COLOR])[0][0, :3]
+    backdrop = composite_array(background_rgba, page)
+    ratios = np.round(contrast_ratio_array(composite_array(text_rgba, backdrop), backdrop), 2).tolist()
+    valid = (text_valid & background_valid).tolist()
+    return [
+        ContrastResult(element, text, background, source, ratios[i], large if is_large else normal, is_large)
+        for i, (element, text, background, source, is_large) in enumerate(rows)
+        if valid[i]
+    ]
+
+# --- COLOR VISION ---
+# Simulated color vision deficiencies using the full-severity matrices of
+# Machado, Oliveira & Fernandes (2009), applied in linear RGB. Every color of
+# a theme goes through all modes in one batch, cached per theme revision.
+
+CVD_MODES = {
+    "protanopia": "Protanopia (no red cones)",
+    "deuteranopia": "Deuteranopia (no green cones)",
+    "tritanopia": "Tritanopia (no blue cones)",
+}
+CVD_MATRICES = {
+    "protanopia": np.array([
+        [0.152286, 1.052583, -0.204868],
+        [0.114503, 0.786281, 0.099216],
+        [-0.003882, -0.048116, 1.051998],
+    ]),
+    "deuteranopia": np.array([
+        [0.367322, 0.860646, -0.227968],
+        [0.280085, 0.672501, 0.047413],
+        [-0.011820, 0.042940, 0.968881],
+    ]),
+    "tritanopia": np.array([
+        [1.255528, -0.076749, -0.178779],
+        [-0.078411, 0.930809, 0.147602],
+        [0.004733, 0.691367, 0.303900],
+    ]),
+}
+# OKLab distance below which two role colors are hard to tell apart
+CVD_MIN_DISTANCE = 0.06
+class CvdSimulation(NamedTuple):
+    mode: str
+    theme: object
+    resolver: object
+    warnings: list
+
+def simulate_cvd_array(rgba, modes=tuple(CVD_MODES)):
+    """Simulate several deficiencies for (N, 4) RGBA colors at once, shape (modes, N, 4)"""
+    rgba = np.asarray(rgba, dtype=np.float64).reshape(-1, 4)
+    matrices = np.stack([CVD_MATRICES[mode] for mode in modes])
+    simulated = linear_to_srgb(np.einsum("mij,nj->mni", matrices, srgb_to_linear(rgba[:, :3])))
+    alpha = np.broadcast_to(rgba[:, 3:], (len(modes), len(rgba), 1))
+    return np.concatenate([simulated, alpha], axis=-1)
+
+def role_colors(theme, resolver, catalog=None):
+    """Resolved color of each PALETTE_RULES role the theme sets, as role -> value"""
+    colors = {}
+    for role, targets in load_palette_plan(catalog=catalog).rules.items():
+        for element, attr in targets:
+            value = resolver.resolve(theme, element).get(attr)
+            if value is not None:
+                colors[role] = value
+                break
+    return colors
+
+def cvd_role_warnings(colors, modes=tuple(CVD_MODES)):
+    """Per mode, warnings for role colors that are distinct normally but look alike simulated"""
+    roles = list(colors)
+    rgba, valid = hex_to_rgba_array([colors[role] for role in roles])
+    roles = [role for role, ok in zip(roles, valid) if ok]
+    warnings = {mode: [] for mode in modes}
+    if len(roles) < 2:
+        return warnings
+    page = hex_to_rgba_array([CONTRAST_PAGE_COLOR])[0][0, :3]
+    rgba = rgba[valid]
+    normal = rgb_to_oklab_array(composite_array(rgba, page))
+    simulated = simulate_cvd_array(rgba, modes)
+    # (1 + modes, N, 3) in OKLab, then all pairwise distances at once
+    lab = np.concatenate([normal[None], rgb_to_oklab_array(composite_array(simulated.reshape(-1, 4), page)).reshape(len(modes), -1, 3)])
+    distances = np.linalg.norm(lab[:, :, None, :] - lab[:, None, :, :], axis=-1)
+    first, second = np.triu_indices(len(roles), k=1)
+    for m, mode in enumerate(modes):
+        merged = (distances[0, first, second] >= CVD_MIN_DISTANCE) & (distances[m + 1, first, second] < CVD_MIN_DISTANCE)
+        for i, j in zip(first[merged], second[merged]):
+            warnings[mode].append(
+                f"{roles[i].title()} ({colors[roles[i]]}) and {roles[j].title()} ({colors[roles[j]]}) "
+                f"are hard to tell apart (distance {distances[m + 1, i, j]:.3f})"
+            )
+    return warnings
+
+def simulate_theme_cvd(data, catalog=None, modes=tuple(CVD_MODES)):
+    """Simulated copy of a theme for each mode, with warnings for roles that become indistinguishable"""
+    catalog = catalog or DEFAULT_CATALOG
+    locations, rgba, valid = collect_theme_colors([data])
+    simulated = simulate_cvd_array(rgba, modes) if len(locations) else np.zeros((len(modes), 0, 4))
+    original = ThemeModel(data)
+    warnings = cvd_role_warnings(role_colors(original, CascadeResolver(catalog.parents, catalog.elements), catalog), modes)
+    results = {}
+    for m, mode in enumerate(modes):
+        themes = write_theme_colors([copy.deepcopy(data)], locations, simulated[m], valid)
+        results[mode] = CvdSimulation(
+            mode, ThemeModel(themes[0]), CascadeResolver(catalog.parents, catalog.elements), warnings[mode]
+        )
+    return results
+
+class CvdSimulator:
+    """Color vision simulations of the edited theme, recomputed once per revision for all modes"""
+
+    def __init__(self, catalog=None):
+        self.catalog = catalog
+        self._theme = None
+        self._revision = -1
+        self._results = {}
+
+    def simulate(self, theme, mode):
+        """CvdSimulation of a ThemeModel for one of CVD_MODES"""
+        if theme is not self._theme or theme.revision != self._revision:
+            self._results = simulate_theme_cvd(theme.to_dict(), self.catalog)
+            self._theme = theme
+            self._revision = theme.revision
+        return self._results[mode]
+
+# --- PALETTE GENERATOR ---
+# Role palettes and mark color ramps grown from one or two seed colors in
+# OKLCH (OKLab as lightness, chroma, hue), so steps look evenly spaced. Every
+# candidate is built and scored in one batch: text contrast against the
+# background, accent contrast, and how distinct the role colors stay, also
+# under the simulated color vision deficiencies.
+
+# name -> (secondary, accent) hue offsets from the seed, in degrees
+PALETTE_HARMONIES = {
+    "Monochrome": (0, 0),
+    "Analogous": (-30, 30),
+    "Complementary": (0, 180),
+    "Split complementary": (150, 210),
+    "Triadic": (120, 240),
+}
+# Primary (title) lightness variants; secondary text sits a fixed step lighter
+PALETTE_PRIMARY_LIGHTNESS = {"dark": 0.30, "deep": 0.38, "mid": 0.46}
+PALETTE_SECONDARY_STEP = 0.14
+# Generated accents keep the seed's lightness within this range, dark enough for marks on a light background
+PALETTE_ACCENT_LIGHTNESS = (0.45, 0.65)
+# (lightness, chroma) of the background: near neutral, or a light tint of the seed hue
+PALETTE_BACKGROUNDS = {"neutral": (0.985, 0.004), "tinted": (0.965, 0.015)}
+# Lightness range of the ends of a sequential ramp, and of the midpoint of a diverging one
+RAMP_LIGHTNESS = (0.97, 0.28)
+RAMP_TYPES = {"sequential": "ordered-sequential", "diverging": "ordered-diverging"}
+PALETTE_CANDIDATES_SHOWN = 6
+PALETTE_ROLES = ("primary", "secondary", "accent", "background")
+
+class PaletteCandidate(NamedTuple):
+    name: str
+    colors: dict
+    text_contrast: float
+    accent_contrast: float
+    distinctness: float
+    cvd_distinctness: float
+    score: float
+
+    @property
+    def passed(self):
+        return self.text_contrast >= 4.5 and self.accent_contrast >= 3.0 and self.cvd_distinctness >= CVD_MIN_DISTANCE
+
+def oklab_to_oklch_array(lab):
+    """OKLab to OKLCH with hue in degrees"""
+    lab = np.asarray(lab, dtype=np.float64)
+    chroma = np.hypot(lab[..., 1], lab[..., 2])
+    hue = np.degrees(np.arctan2(lab[..., 2], lab[..., 1])) % 360
+    return np.stack([lab[..., 0], chroma, hue], axis=-1)
+
+def oklch_to_oklab_array(lch):
+    """OKLCH (hue in degrees) to OKLab"""
+    lch = np.asarray(lch, dtype=np.float64)
+    hue = np.radians(lch[..., 2])
+    return np.stack([lch[..., 0], lch[..., 1] * np.cos(hue), lch[..., 1] * np.sin(hue)], axis=-1)
+
+def oklch_to_rgb_array(lch, iterations=16):
+    """OKLCH to sRGB (0-1), lowering chroma (keeping lightness and hue) where a color is out of gamut"""
+    lch = np.array(lch, dtype=np.float64)
+    lch[..., 0] = np.clip(lch[..., 0], 0, 1)
+
+    def linear(chroma):
+        lab = oklch_to_oklab_array(np.stack([lch[..., 0], chroma, lch[..., 2]], axis=-1))
+        return ((lab @ _OKLAB_TO_LMS.T) ** 3) @ _LMS_TO_LINEAR.T
+
+    def in_gamut(chroma):
+        rgb = linear(chroma)
+        return ((rgb >= -1e-6) & (rgb <= 1 + 1e-6)).all(axis=-1)
+
+    chroma = lch[..., 1]
+    low, high = np.zeros_like(chroma), chroma.copy()
+    fits = in_gamut(chroma)
+    for _ in range(iterations):
+        middle = (low + high) / 2
+        ok = in_gamut(middle)
+        low = np.where(ok, middle, low)
+        high = np.where(ok, high, middle)
+    return linear_to_srgb(linear(np.where(fits, chroma, low)))
+
+def seed_oklch(*seeds):
+    """OKLCH rows for hex seed colors, raises ValueError for an invalid one"""
+    rgba, valid = hex_to_rgba_array(seeds)
+    if not valid.all():
+        raise ValueError(f"Invalid seed color: {seeds[int(np.argmin(valid))]}")
+    return oklab_to_oklch_array(rgb_to_oklab_array(rgba))
+
+def color_ramp(seed, second=None, steps=7, kind="sequential"):
+    """Hex colors of a sequential or diverging ramp, interpolated in OKLab
+
+    A sequential ramp runs from a light tint through the seed to a dark shade,
+    or straight from the seed to the second seed. A diverging ramp runs from
+    the seed through a light neutral to the second seed (default: the seed's
+    complement).
+    """
+    if kind not in RAMP_TYPES:
+        raise ValueError(f"Unknown ramp type '{kind}'")
+    light, dark = RAMP_LIGHTNESS
+    first = seed_oklch(seed)[0]
+    if kind == "diverging":
+        end = seed_oklch(second)[0] if second else np.array([first[0], first[1], (first[2] + 180) % 360])
+        stops = [first, (light, 0.0, first[2]), end]
+        positions = [0.0, 0.5, 1.0]
+    elif second:
+        stops = [first, seed_oklch(second)[0]]
+        positions = [0.0, 1.0]
+    else:
+        # Place the seed along the ramp by its lightness, so it appears close to unchanged
+        middle = float(np.clip(first[0], dark + 0.05, light - 0.05))
+        at = (light - middle) / (light - dark)
+        stops = [(light, first[1] * 0.12, first[2]), (middle, first[1], first[2]), (dark, first[1] * 0.6, first[2])]
+        positions = [0.0, at, 1.0]
+    lab = oklch_to_oklab_array(np.array(stops, dtype=np.float64))
+    t = np.linspace(0, 1, steps)
+    ramp = np.stack([np.interp(t, positions, lab[:, channel]) for channel in range(3)], axis=-1)
+    return rgba_array_to_hex(oklch_to_rgb_array(oklab_to_oklch_array(ramp)))
+
+def score_palettes(rgb):
+    """Contrast and distinctness of (K, 4) role palettes given as a (K, 4, 3) sRGB array
+
+    Returns (text contrast, accent contrast, distinctness, CVD distinctness,
+    score), each of shape (K,). Distinctness is the smallest OKLab distance
+    between the primary, secondary and accent colors.
+    """
+    rgb = np.asarray(rgb, dtype=np.float64)
+    count = len(rgb)
+    primary, secondary, accent, background = (rgb[:, i] for i in range(4))
+    text = np.minimum(contrast_ratio_array(primary, background), contrast_ratio_array(secondary, background))
+    accent_contrast = contrast_ratio_array(accent, background)
+    rgba = np.concatenate([rgb[:, :3].reshape(-1, 3), np.ones((count * 3, 1))], axis=1)
+    modes = tuple(CVD_MODES)
+    # (1 + modes, K, 3 roles, 3) in OKLab
+    lab = rgb_to_oklab_array(np.concatenate([rgba[None], simulate_cvd_array(rgba, modes)])).reshape(len(modes) + 1, count, 3, 3)
+    first, second = np.triu_indices(3, k=1)
+    distances = np.linalg.norm(lab[:, :, first] - lab[:, :, second], axis=-1).min(axis=-1)
+    distinct, cvd_distinct = distances[0], distances[1:].min(axis=0)
+    score = (
+        0.4 * np.clip(text / 7.0, 0, 1)
+        + 0.2 * np.clip(accent_contrast / 4.5, 0, 1)
+        + 0.2 * np.clip(distinct / 0.25, 0, 1)
+        + 0.2 * np.clip(cvd_distinct / 0.15, 0, 1)
+    )
+    return text, accent_contrast, distinct, cvd_distinct, score
+
+@lru_cache(maxsize=32)
+def generate_palettes(seed, second=None):
+    """Candidate role palettes for one or two seed colors, best score first
+
+    With one seed the accent hue comes from each harmony; a second seed is
+    used as the accent itself and the harmony only moves the secondary hue.
+    """
+    seeds = seed_oklch(seed, second) if second else seed_oklch(seed)
+    lightness, chroma, hue = seeds[0]
+    chroma = max(chroma, 0.04)
+    names = []
+    rows = []
+    for harmony, (secondary_offset, accent_offset) in PALETTE_HARMONIES.items():
+        if second:
+            accent = seeds[1]
+        else:
+            accent = (np.clip(lightness, *PALETTE_ACCENT_LIGHTNESS), max(chroma, 0.1), hue + accent_offset)
+        for shade, primary_lightness in PALETTE_PRIMARY_LIGHTNESS.items():
+            for background, (background_lightness, background_chroma) in PALETTE_BACKGROUNDS.items():
+                names.append(f"{harmony}, {shade} on {background}")
+                rows.append([
+                    (primary_lightness, chroma * 0.8, hue),
+                    (primary_lightness + PALETTE_SECONDARY_STEP, chroma, hue + secondary_offset),
+                    accent,
+                    (background_lightness, background_chroma, hue),
+                ])
+    lch = np.array(rows, dtype=np.float64)
+    lch[..., 2] %= 360
+    rgb = oklch_to_rgb_array(lch)
+    text, accent_contrast, distinct, cvd_distinct, score = (np.round(v, 3).tolist() for v in score_palettes(rgb))
+    hexes = rgba_array_to_hex(rgb.reshape(-1, 3))
+    label = f"{seed} + {second}" if second else seed
+    candidates = [
+        PaletteCandidate(
+            f"{names[k]} ({label})", dict(zip(PALETTE_ROLES, hexes[k * 4:k * 4 + 4])),
+            text[k], accent_contrast[k], distinct[k], cvd_distinct[k], score[k]
+        )
+        for k in range(len(rows))
+    ]
+    return tuple(sorted(candidates, key=lambda candidate: candidate.score, reverse=True))
+
+def palette_preferences_tps(name, roles, ramps):
+    """Tableau Preferences.tps defining the role colors as a regular palette plus named ramps
+
+    ``ramps`` maps a ramp kind from RAMP_TYPES to its hex colors.
+    """
+    lines = ["<?xml version='1.0'?>", "<workbook>", "  <preferences>"]
+    palettes = [(name, "regular", list(roles.values()))]
+    palettes += [(f"{name} {kind}", RAMP_TYPES[kind], colors) for kind, colors in ramps.items()]
+    for title, palette_type, colors in palettes:
+        lines.append(f"    <color-palette name={quoteattr(title)} type=\"{palette_type}\">")
+        lines += [f"      <color>{color}</color>" for color in colors]
+        lines.append("    </color-palette>")
+    lines += ["  </preferences>", "</workbook>", ""]
+    return "\n".join(lines)
+
+# --- LOGO PALETTE ---
+# Dominant colors of a logo by weighted k-means in OKLab. The image is
+# downsampled first and identical pixels are counted once, so clustering runs
+# over a few thousand distinct colors regardless of the upload's resolution.
+
+LOGO_SAMPLE_SIZE = 160
+LOGO_COLOR_RANGE = (4, 8)
+LOGO_KMEANS_ITERATIONS = 15
+# Pixels more transparent than this are ignored (the logo's surroundings)
+LOGO_MIN_ALPHA = 0.5
+# A cluster this light and grey is taken as the logo's own background
+LOGO_BACKGROUND_LIGHTNESS = 0.9
+LOGO_BACKGROUND_CHROMA = 0.04
+# Clusters with less of the logo than this are dropped (anti-aliasing and JPEG fringes)
+LOGO_MIN_SHARE = 0.01
+
+class LogoPalette(NamedTuple):
+    colors: tuple
+    weights: tuple
+    roles: dict
+
+def logo_pixels(image_bytes):
+    """Distinct opaque colors of a downsampled image as (N, 3) sRGB (0-1) plus their pixel counts"""
+    from PIL import Image  # Pillow is only needed for logo uploads
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        # JPEG can decode straight at a fraction of full size
+        image.draft("RGB", (LOGO_SAMPLE_SIZE * 2, LOGO_SAMPLE_SIZE * 2))
+        image = image.convert("RGBA")
+        image.thumbnail((LOGO_SAMPLE_SIZE, LOGO_SAMPLE_SIZE), Image.Resampling.NEAREST)
+        pixels = np.asarray(image, dtype=np.uint8).reshape(-1, 4)
+    pixels = pixels[pixels[:, 3] >= LOGO_MIN_ALPHA * 255]
+    if not len(pixels):
+        raise ValueError("The image has no opaque pixels")
+    packed = (pixels[:, 0].astype(np.uint32) << 16) | (pixels[:, 1].astype(np.uint32) << 8) | pixels[:, 2]
+    colors, counts = np.unique(packed, return_counts=True)
+    rgb = np.stack([(colors >> 16) & 255, (colors >> 8) & 255, colors & 255], axis=-1) / 255
+    return rgb, counts.astype(np.float64)
+
+def kmeans_oklab(lab, weights, count, iterations=LOGO_KMEANS_ITERATIONS):
+    """Weighted k-means over OKLab points, returns (centers, total weight per center)
+
+    Seeding is deterministic: the heaviest point, then repeatedly the point
+    with the largest weighted squared distance to the chosen centers.
+    """
+    count = min(count, len(lab))
+    centers = [lab[np.argmax(weights)]]
+    nearest = ((lab - centers[0]) ** 2).sum(axis=-1)
+    for _ in range(count - 1):
+        centers.append(lab[np.argmax(nearest * weights)])
+        nearest = np.minimum(nearest, ((lab - centers[-1]) ** 2).sum(axis=-1))
+    centers = np.array(centers)
+    for _ in range(iterations):
+        labels = ((lab[:, None, :] - centers[None]) ** 2).sum(axis=-1).argmin(axis=1)
+        totals = np.bincount(labels, weights=weights, minlength=count)
+        sums = np.stack([np.bincount(labels, weights=weights * lab[:, c], minlength=count) for c in range(3)], axis=-1)
+        moved = np.where(totals[:, None] > 0, sums / np.maximum(totals, 1e-12)[:, None], centers)
+        if np.allclose(moved, centers, atol=1e-5):
+            break
+        centers = moved
+    labels = ((lab[:, None, :] - centers[None]) ** 2).sum(axis=-1).argmin(axis=1)
+    return centers, np.bincount(labels, weights=weights, minlength=count)
+
+def darken_to_contrast(lch, background_rgb, ratio):
+    """Lower the lightness of OKLCH colors (rows) until each reaches a contrast ratio against the background"""
+    lch = np.asarray(lch, dtype=np.float64).reshape(-1, 3)
+    steps = np.linspace(0, 1, 41)
+    # (colors, steps, 3): every color at every lightness from its own down to black
+    trials = np.repeat(lch[:, None, :], len(steps), axis=1)
+    trials[..., 0] = lch[:, :1] * (1 - steps)
+    rgb = oklch_to_rgb_array(trials)
+    ok = contrast_ratio_array(rgb.reshape(-1, 3), np.broadcast_to(background_rgb, (rgb.size // 3, 3))).reshape(len(lch), -1) >= ratio
+    first = np.where(ok.any(axis=1), ok.argmax(axis=1), len(steps) - 1)
+    return rgb[np.arange(len(lch)), first]
+
+def logo_roles(lab, weights):
+    """Map logo clusters (OKLab, by weight) to the apply_palette roles
+
+    A light grey cluster becomes the background, otherwise a faint tint of
+    the dominant hue. Primary and secondary are the two heaviest brand
+    colors and the accent the most chromatic one, each darkened only as much
+    as needed for text (4.5:1) or mark (3:1) contrast against the background.
+    """
+    lch = oklab_to_oklch_array(lab)
+    order = np.argsort(-weights)
+    light = (lch[:, 0] >= LOGO_BACKGROUND_LIGHTNESS) & (lch[:, 1] <= LOGO_BACKGROUND_CHROMA)
+    brand = [i for i in order if not light[i]]
+    if not brand:
+        # All light greys, e.g. a white logo: the darkest cluster carries the brand
+        brand = [int(np.argmin(lch[:, 0]))]
+    hue = lch[brand[0], 2]
+    if light.any():
+        background_rgb = oklab_to_rgb_array(lab[[i for i in order if light[i]][0]])
+    else:
+        background_rgb = oklch_to_rgb_array(np.array([0.985, 0.006, hue]))
+    primary = brand[0]
+    secondary = brand[1] if len(brand) > 1 else brand[0]
+    accent_pool = [i for i in brand if i not in (primary, secondary)] or [i for i in brand if i != primary] or brand
+    accent = max(accent_pool, key=lambda i: lch[i, 1])
+    text = darken_to_contrast(lch[[primary, secondary]], background_rgb, 4.5)
+    if secondary == primary:
+        # A single brand color: the secondary is a lighter step of it that still reads as text
+        lifted = lch[primary].copy()
+        lifted[0] = min(lifted[0] + PALETTE_SECONDARY_STEP, LOGO_BACKGROUND_LIGHTNESS)
+        text[1] = darken_to_contrast(lifted, background_rgb, 4.5)[0]
+    mark = darken_to_contrast(lch[accent], background_rgb, 3.0)
+    hexes = rgba_array_to_hex(np.stack([text[0], text[1], mark[0], background_rgb]))
+    return dict(zip(PALETTE_ROLES, hexes))
+
+def extract_logo_palette(image_bytes, count=6):
+    """Dominant colors of a logo image (heaviest first) and their role mapping, as a LogoPalette"""
+    low, high = LOGO_COLOR_RANGE
+    rgb, counts = logo_pixels(image_bytes)
+    lab = rgb_to_oklab_array(rgb)
+    centers, totals = kmeans_oklab(lab, counts, int(np.clip(count, low, high)))
+    keep = totals >= LOGO_MIN_SHARE * totals.sum()
+    centers, totals = centers[keep], totals[keep]
+    order = np.argsort(-totals)
+    centers, totals = centers[order], totals[order]
+    colors = rgba_array_to_hex(oklab_to_rgb_array(centers))
+    weights = np.round(totals / totals.sum(), 4).tolist()
+    return LogoPalette(tuple(colors), tuple(weights), logo_roles(centers, totals))
+
+# --- ELEMENT SEARCH ---
+
+# Field weights for ranking search hits; fuzzy (misspelled) hits count half
+SEARCH_FIELD_WEIGHTS = {"key": 4, "name": 4, "category": 2, "attribute": 2, "description": 1}
+ELEMENTS_PER_PAGE = 10
+
+def search_tokens(text):
+    """Lowercase word tokens of a key, name or description"""
+    return [token for token in re.split(r"[^0-9a-z]+", str(text).lower()) if token]
+
+class ElementSearchIndex:
+    """Prefix and fuzzy search over a style element catalog
+
+    All tokens (from keys, names, descriptions, categories and attribute names)
+    are kept in one sorted list, so each query term is a bisect for its prefix
+    range. Terms without prefix hits fall back to difflib close matches over
+    the token vocabulary. Every term has to match for an element to be returned.
+    """
+
+    def __init__(self, elements):
+        self.order = {element: index for index, element in enumerate(elements)}
+        postings = {}
+        for element, info in elements.items():
+            fields = [
+                ("key", element),
+                ("name", info.get("name", "")),
+                ("category", info.get("category", "")),
+                ("description", info.get("description", "")),
+            ] + [("attribute", attr) for attr in info.get("attributes", ())]
+            for field, text in fields:
+                for token in search_tokens(text):
+                    weights = postings.setdefault(token, {})
+                    weights[element] = max(weights.get(element, 0), SEARCH_FIELD_WEIGHTS[field])
+        self.tokens = sorted(postings)
+        self.postings = postings
+
+    def state(self):
+        """Plain-data form of the index, for the on-disk catalog cache"""
+        return {"order": self.order, "tokens": self.tokens, "postings": self.postings}
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild an index from state() without re-tokenizing the catalog"""
+        index = cls.__new__(cls)
+        index.order = state["order"]
+        index.tokens = state["tokens"]
+        index.postings = state["postings"]
+        return index
+
+    def search(self, query):
+        """Matching element keys, best match first; an empty query returns the whole catalog"""
+        terms = search_tokens(query)
+        if not terms:
+            return list(self.order)
+        scores = None
+        for term in terms:
+            term_scores = self._match_term(term)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {element: scores[element] + score for element, score in term_scores.items() if element in scores}
+            if not scores:
+                return []
+        return sorted(scores, key=lambda element: (-scores[element], self.order[element]))
+
+    def _match_term(self, term):
+        scores = {}
+        start = bisect_left(self.tokens, term)
+        for token in self.tokens[start:bisect_left(self.tokens, term + "\uffff")]:
+            for element, weight in self.postings[token].items():
+                # Whole-word hits rank above prefix hits
+                score = weight * (2 if token == term else 1)
+                scores[element] = max(scores.get(element, 0), score)
+        if not scores:
+            for token in difflib.get_close_matches(term, self.tokens, n=5, cutoff=0.75):
+                for element, weight in self.postings[token].items():
+                    scores[element] = max(scores.get(element, 0), weight / 2)
+        return scores
+
+# --- SIZE OPTIMIZER ---
+# Rewrites a theme into the smallest equivalent file. Each rule's saving is
+# measured on the serialized output, starting from the pretty export.
+
+# drop-inherited relies on the catalog's inheritance, which is the editor's
+# model of Tableau rather than something Tableau documents, so dropping an
+# explicit value could change how a theme renders. It only runs when asked for.
+OPTIMIZE_RULES = ("shorten-colors", "remove-empty", "compact-separators")
+DROP_INHERITED_RULES = ("shorten-colors", "drop-inherited", "remove-empty", "compact-separators")
+
+class OptimizedTheme(NamedTuple):
+    data: dict
+    payload: bytes
+    original_bytes: int
+    saved: dict
+
+    @property
+    def size(self):
+        return len(self.payload)
+
+    @property
+    def too_large(self):
+        return self.size > MAX_THEME_BYTES
+
+HEX_COLOR_RE = re.compile(r"#[0-9A-Fa-f]{6}(?:[0-9A-Fa-f]{2})?")
+
+def shorten_color(value):
+    """Shortest equivalent hex color: uppercase digits, fully opaque alpha dropped"""
+    if not isinstance(value, str) or not HEX_COLOR_RE.fullmatch(value):
+        return value
+    value = value.upper()
+    if len(value) == 9 and value.endswith("FF"):
+        return value[:7]
+    return value
+
+def shorten_colors(styles, catalog):
+    """Optimizer rule: rewrite the attributes the catalog knows as colors in their shortest form"""
+    for element, properties in styles.items():
+        if isinstance(properties, dict):
+            for attr, value in properties.items():
+                if attribute_spec(element, attr, catalog.schema).kind == "color":
+                    properties[attr] = shorten_color(value)
+
+def drop_inherited(styles, catalog):
+    """Optimizer rule: drop attributes equal to what the element inherits anyway"""
+    theme = ThemeModel({"styles": styles})
+    resolver = CascadeResolver(catalog.parents, catalog.elements)
+    # Dropping a value equal to the inherited one leaves every resolved style
+    # unchanged, so all drops can be decided against the original cascade
+    drops = []
+    for element, properties in theme.styles.items():
+        parent = catalog.parents.get(element)
+        if parent is None or not isinstance(properties, dict):
+            continue
+        inherited = resolver.resolve(theme, parent)
+        supported = catalog.elements.get(element, {}).get("attributes", ())
+        for attr, value in properties.items():
+            if attr in supported and attr in inherited and same_json_value(inherited[attr], value):
+                drops.append((element, attr))
+    for element, attr in drops:
+        del styles[element][attr]
+
+def remove_empty(styles, catalog):
+    """Optimizer rule: remove style elements that set nothing"""
+    for element in [element for element, properties in styles.items() if properties == {}]:
+        del styles[element]
+
+STYLE_RULES = {
+    "shorten-colors": shorten_colors,
+    "drop-inherited": drop_inherited,
+    "remove-empty": remove_empty,
+}
+
+def optimize_theme(data, rules=OPTIMIZE_RULES, fast=True, catalog=None):
+    """Apply the optimizer rules to a copy of a theme, reporting bytes saved per rule"""
+    catalog = DEFAULT_CATALOG if catalog is None else catalog
+    optimized = copy.deepcopy(data)
+    styles = optimized.get("styles")
+    pretty = True
+    payload = dumps_theme(optimized, fast=fast)
+    original_bytes = size = len(payload)
+    saved = {}
+    for rule in rules:
+        if rule == "compact-separators":
+            pretty = False
+        elif isinstance(styles, dict):
+            STYLE_RULES[rule](styles, catalog)
+        payload = dumps_theme(optimized, pretty=pretty, fast=fast)
+        saved[rule] = size - len(payload)
+        size = len(payload)
+    return OptimizedTheme(optimized, payload, original_bytes, saved)
+
+# --- PREVIEW ---
+# A mock dashboard drawn as SVG from the resolved (inherited) styles. Each
+# element is rendered to its own SVG fragment, memoized on that element's
+# resolved style, so an edit only redraws the elements whose style changed.
+
+PREVIEW_WIDTH = 820
+PREVIEW_HEIGHT = 470
+PREVIEW_BARS = (("East", 0.62), ("West", 0.88), ("Central", 0.45), ("South", -0.28))
+PT_TO_PX = 1.33
+
+def svg_font(style, size=10, weight=None):
+    """SVG presentation attributes for a resolved font style"""
+    family = html.escape(str(style.get("font-family", "Tableau Book")), quote=True)
+    attrs = (
+        f'font-family="{family}, Segoe UI, Helvetica, Arial, sans-serif" '
+        f'font-size="{float(style.get("font-size", size)) * PT_TO_PX:.1f}" '
+        f'fill="{html.escape(str(style.get("font-color", "#333333")), quote=True)}"'
+    )
+    weight = style.get("font-weight", weight)
+    if weight:
+        attrs += f' font-weight="{html.escape(str(weight), quote=True)}"'
+    return attrs
+
+def svg_text(x, y, text, style, size=10, weight=None, anchor="start"):
+    """An SVG text element in a resolved font style"""
+    return f'<text x="{x}" y="{y}" text-anchor="{anchor}" {svg_font(style, size, weight)}>{html.escape(text)}</text>'
+
+def svg_stroke(style, color, width=1):
+    """SVG stroke attributes for a resolved line style, or None when the line is hidden"""
+    if style.get("line-visibility", "on") == "off":
+        return None
+    dash = {"dashed": ' stroke-dasharray="6 4"', "dotted": ' stroke-dasharray="1.5 3"'}.get(style.get("line-pattern"), "")
+    color = html.escape(str(style.get("line-color", color)), quote=True)
+    return f'stroke="{color}" stroke-width="{style.get("line-width", width)}"{dash}'
+
+def svg_control(y, title, body_lines, title_style, body_style):
+    """A control card (legend, filter, ...) in the right hand column"""
+    background = html.escape(str(body_style.get("background-color", "#FFFFFF")), quote=True)
+    height = 34 + 20 * len(body_lines)
+    parts = [f'<rect x="600" y="{y}" width="200" height="{height}" rx="4" fill="{background}" stroke="#D9D9D9"/>']
+    if title is not None:
+        parts.append(svg_text(610, y + 20, title, title_style, weight="bold"))
+    for index, line in enumerate(body_lines):
+        parts.append(svg_text(616, y + 42 + 20 * index, line, body_style))
+    return "".join(parts)
+
+def preview_dashboard_title(style):
+    return svg_text(20, 34, "Regional Sales Overview", style, size=18, weight="bold")
+
+def preview_worksheet_title(style):
+    return svg_text(30, 76, "Profit Ratio by Region", style, size=12)
+
+def preview_view(style):
+    background = html.escape(str(style.get("background-color", "#FFFFFF")), quote=True)
+    return f'<rect x="80" y="90" width="490" height="330" fill="{background}" stroke="#D9D9D9"/>'
+
+def preview_gridline(style):
+    stroke = svg_stroke(style, "#E6E6E6")
+    if stroke is None:
+        return ""
+    return "".join(f'<line x1="80" y1="{y}" x2="570" y2="{y}" {stroke}/>' for y in (110, 170, 230, 350, 410))
+
+def preview_zeroline(style):
+    stroke = svg_stroke(style, "#8C8C8C")
+    if stroke is None:
+        return ""
+    return f'<line x1="80" y1="290" x2="570" y2="290" {stroke}/>'
+
+def preview_mark(style):
+    color = html.escape(str(style.get("mark-color", "#4E79A7")), quote=True)
+    bars = []
+    for index, (_, value) in enumerate(PREVIEW_BARS):
+        height = abs(value) * 180
+        y = 290 - height if value >= 0 else 290
+        bars.append(f'<rect x="{110 + index * 115}" y="{y:.0f}" width="70" height="{height:.0f}" fill="{color}"/>')
+    return "".join(bars)
+
+def preview_worksheet(style):
+    # Axis tick labels use the worksheet default font
+    ticks = ((110, "150%"), (170, "100%"), (230, "50%"), (290, "0%"), (350, "-50%"), (410, "-100%"))
+    return "".join(svg_text(72, y + 4, label, style, size=8, anchor="end") for y, label in ticks)
+
+def preview_header(style):
+    return "".join(
+        svg_text(145 + index * 115, 440, name, style, size=9, anchor="middle")
+        for index, (name, _) in enumerate(PREVIEW_BARS)
+    )
+
+def preview_tooltip(style):
+    return (
+        '<rect x="350" y="100" width="150" height="50" rx="3" fill="#FFFFFF" stroke="#BFBFBF"/>'
+        + svg_text(360, 120, "Region: West", style, size=9)
+        + svg_text(360, 138, "Profit Ratio: 88%", style, size=9)
+    )
+
+def preview_legend(style):
+    return svg_control(60, None, ["■ Profitable", "■ Unprofitable"], {}, style)
+
+def preview_legend_title(style):
+    return svg_text(610, 80, "Profitability", style, weight="bold")
+
+def preview_filter(style):
+    return svg_control(150, None, ["☑ (All)", "☑ Furniture", "☐ Technology"], {}, style)
+
+def preview_filter_title(style):
+    return svg_text(610, 170, "Category", style, weight="bold")
+
+def preview_parameter_ctrl(style):
+    return svg_control(260, None, ["Top 10 ▾"], {}, style)
+
+def preview_parameter_ctrl_title(style):
+    return svg_text(610, 280, "Top N Customers", style, weight="bold")
+
+def preview_highlighter(style):
+    return svg_control(330, None, ["Highlight Segment"], {}, style)
+
+def preview_highlighter_title(style):
+    return svg_text(610, 350, "Segment", style, weight="bold")
+
+# Drawing order matters: later fragments paint over earlier ones
+PREVIEW_RENDERERS = {
+    "dashboard-title": preview_dashboard_title,
+    "worksheet-title": preview_worksheet_title,
+    "view": preview_view,
+    "gridline": preview_gridline,
+    "zeroline": preview_zeroline,
+    "mark": preview_mark,
+    "worksheet": preview_worksheet,
+    "header": preview_header,
+    "tooltip": preview_tooltip,
+    "legend": preview_legend,
+    "legend-title": preview_legend_title,
+    "filter": preview_filter,
+    "filter-title": preview_filter_title,
+    "parameter-ctrl": preview_parameter_ctrl,
+    "parameter-ctrl-title": preview_parameter_ctrl_title,
+    "highlighter": preview_highlighter,
+    "highlighter-title": preview_highlighter_title,
+}
+
+def freeze_style(style):
+    """Hashable form of a resolved style, used as the fragment cache key"""
+    try:
+        return tuple(sorted(style.items()))
+    except TypeError:
+        # Nested values from hand-edited JSON
+        return tuple(sorted((attr, json.dumps(value, sort_keys=True)) for attr, value in style.items()))
+
+@lru_cache(maxsize=1024)
+def render_preview_fragment(element, style):
+    """SVG for one element of the preview, memoized on its frozen resolved style"""
+    try:
+        return PREVIEW_RENDERERS[element](dict(style))
+    except (TypeError, ValueError):
+        # Invalid values (validation reports them) are drawn with the defaults
+        return PREVIEW_RENDERERS[element]({})
+
+def render_preview_svg(theme, resolver):
+    """The whole preview as an SVG document for a ThemeModel"""
+    fragments = [
+        render_preview_fragment(element, freeze_style(resolver.resolve(theme, element)))
+        for element in PREVIEW_RENDERERS
+    ]
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {PREVIEW_WIDTH} {PREVIEW_HEIGHT}" '
+        f'width="100%" role="img" aria-label="Theme preview">'
+        f'<rect width="{PREVIEW_WIDTH}" height="{PREVIEW_HEIGHT}" fill="#FFFFFF"/>'
+        + "".join(fragments)
+        + "</svg>"
+    )
+
+# --- THEME LIBRARY ---
+# Local SQLite store for many themes. Each theme is kept as canonical compact
+# JSON, and every attribute it sets is also a row in theme_attrs so searches
+# by element, attribute, font or color are index lookups instead of scans.
+# Element/attribute pairs are interned in attr_keys, which keeps the attribute
+# rows and their index small (a few bytes each) at hundreds of thousands of themes.
+
+LIBRARY_ENV_VAR = "TABTHEME_LIBRARY"
+LIBRARY_BATCH_SIZE = 1000
+
+LIBRARY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS themes (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    content_hash TEXT NOT NULL,
+    version TEXT,
+    base_theme TEXT,
+    body BLOB NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attr_keys (
+    id INTEGER PRIMARY KEY,
+    element TEXT NOT NULL,
+    attribute TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    UNIQUE (element, attribute)
+);
+CREATE INDEX IF NOT EXISTS attr_keys_by_attribute ON attr_keys (attribute, kind);
+CREATE INDEX IF NOT EXISTS attr_keys_by_kind ON attr_keys (kind);
+CREATE TABLE IF NOT EXISTS theme_attrs (
+    theme_id INTEGER NOT NULL REFERENCES themes(id) ON DELETE CASCADE,
+    key_id INTEGER NOT NULL REFERENCES attr_keys(id),
+    value TEXT NOT NULL,
+    PRIMARY KEY (theme_id, key_id)
+) WITHOUT ROWID;
+-- One seek per matching element/attribute key: "Tableau Bold for dashboard-title",
+-- "mark-color is #0072CE" or "any color equal to #0072CE"
+CREATE INDEX IF NOT EXISTS theme_attrs_by_value ON theme_attrs (key_id, value, theme_id);
+CREATE INDEX IF NOT EXISTS themes_by_hash ON themes (content_hash);
+"""
+
+def default_library_path():
+    """Library database location, TABTHEME_LIBRARY overrides"""
+    return os.environ.get(LIBRARY_ENV_VAR) or os.path.join(os.path.expanduser("~"), ".tabthemeeditor", "library.sqlite3")
+
+def value_text(value):
+    """Text form of a (canonical) attribute value for the theme_attrs table"""
+    if isinstance(value, str):
+        return value
+    if type(value) is int:
+        return str(value)
+    return json.dumps(value, sort_keys=True)
+
+def canonical_value(attr, value):
+    """Canonical text form of an attribute value, as stored and searched"""
+    if spec_for_attribute(attr).kind == "color":
+        value = shorten_color(value.strip() if isinstance(value, str) else value)
+    return value_text(value)
+
+def canonical_theme(data):
+    """Theme with canonical colors and no empty elements, plus its sorted compact JSON"""
+    canonical = copy.deepcopy({key: value for key, value in data.items() if key != "styles"})
+    styles = data.get("styles", {})
+    canonical["styles"] = {
+        element: {
+            attr: shorten_color(value) if spec_for_attribute(attr).kind == "color" else copy.deepcopy(value)
+            for attr, value in properties.items()
+        } if isinstance(properties, dict) else copy.deepcopy(properties)
+        for element, properties in styles.items()
+        if properties != {}
+    }
+    return canonical, json.dumps(canonical, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+class ThemeLibrary:
+    """SQLite-backed theme library with indexed attribute search
+
+    Every operation opens its own short-lived connection, so one instance can
+    be shared by all sessions of the app (and their threads).
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_library_path()
+        self._key_ids = {}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(LIBRARY_SCHEMA)
+
+    @contextmanager
+    def connect(self):
+        """A connection that commits on success and is always closed"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA foreign_keys=ON")
+            # Safe with WAL: a crash can only lose the last commits, never corrupt the file
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def save(self, name, data):
+        """Store a theme under a name, replacing any theme with that name; returns its id"""
+        try:
+            with self.connect() as conn:
+                return self._save(conn, name, data)
+        except Exception:
+            # Key ids cached during a rolled back transaction may not exist
+            self._key_ids.clear()
+            raise
+
+    def save_many(self, items):
+        """Store (name, theme) pairs, committing every LIBRARY_BATCH_SIZE themes; returns the count"""
+        count = 0
+        items = iter(items)
+        while True:
+            saved = 0
+            try:
+                with self.connect() as conn:
+                    for name, data in items:
+                        self._save(conn, name, data)
+                        saved += 1
+                        if saved == LIBRARY_BATCH_SIZE:
+                            break
+            except Exception:
+                self._key_ids.clear()
+                raise
+            count += saved
+            if saved < LIBRARY_BATCH_SIZE:
+                return count
+
+    def _save(self, conn, name, data):
+        if not isinstance(data, dict) or not isinstance(data.get("styles", {}), dict):
+            raise ValueError(f"Theme '{name}' is not a theme object")
+        canonical, body = canonical_theme(data)
+        row = conn.execute(
+            "INSERT INTO themes (name, content_hash, version, base_theme, body, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET content_hash=excluded.content_hash, version=excluded.version, "
+            "base_theme=excluded.base_theme, body=excluded.body, updated_at=excluded.updated_at RETURNING id",
+            (name, hashlib.sha256(body).hexdigest(), canonical.get("version"), canonical.get("base-theme"),
+             body, time.time())
+        ).fetchone()
+        theme_id = row[0]
+        conn.execute("DELETE FROM theme_attrs WHERE theme_id = ?", (theme_id,))
+        conn.executemany(
+            "INSERT INTO theme_attrs (theme_id, key_id, value) VALUES (?, ?, ?)",
+            [
+                (theme_id, self._key_id(conn, element, attr), value_text(value))
+                for element, properties in canonical.get("styles", {}).items() if isinstance(properties, dict)
+                for attr, value in properties.items()
+            ]
+        )
+        return theme_id
+
+    def _key_id(self, conn, element, attr):
+        key_id = self._key_ids.get((element, attr))
+        if key_id is None:
+            conn.execute(
+                "INSERT OR IGNORE INTO attr_keys (element, attribute, kind) VALUES (?, ?, ?)",
+                (element, attr, spec_for_attribute(attr).kind)
+            )
+            key_id = conn.execute(
+                "SELECT id FROM attr_keys WHERE element = ? AND attribute = ?", (element, attr)
+            ).fetchone()[0]
+            self._key_ids[(element, attr)] = key_id
+        return key_id
+
+    def load(self, theme_id):
+        """The stored theme dict for an id, or None"""
+        with self.connect() as conn:
+            row = conn.execute("SELECT body FROM themes WHERE id = ?", (theme_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, theme_id):
+        """Remove a theme and its index rows"""
+        with self.connect() as conn:
+            conn.execute("DELETE FROM themes WHERE id = ?", (theme_id,))
+
+    def count(self):
+        """Number of stored themes"""
+        with self.connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM themes").fetchone()[0]
+
+    def revision(self):
+        """Changes whenever the library is written, by any process: (mtime, size) of the database and its WAL"""
+        stats = []
+        for path in (self.path, f"{self.path}-wal"):
+            try:
+                stat = os.stat(path)
+                stats.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stats.append(None)
+        return tuple(stats)
+
+    def iter_themes(self, batch_size=LIBRARY_BATCH_SIZE):
+        """(id, name, theme) of every stored theme in id order, read a page at a time"""
+        last_id = 0
+        while True:
+            with self.connect() as conn:
+                rows = conn.execute(
+                    "SELECT id, name, body FROM themes WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+                ).fetchall()
+            for theme_id, name, body in rows:
+                yield theme_id, name, json.loads(body)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def recent(self, limit=50):
+        """(id, name) of the most recently saved themes"""
+        with self.connect() as conn:
+            return conn.execute(
+                "SELECT id, name FROM themes ORDER BY updated_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+    def search(self, conditions, limit=100):
+        """(id, name) of themes matching every condition, sorted by name
+
+        Each condition is a dict with any of ``element``, ``attribute``,
+        ``kind`` and ``value``; values are canonicalized like stored ones, so
+        "#0072ce" finds "#0072CE". A condition without a value matches themes
+        that set the element/attribute at all.
+        """
+        with self.connect() as conn:
+            clauses = []
+            params = []
+            for condition in conditions:
+                where = []
+                key_params = []
+                for column in ("element", "attribute", "kind"):
+                    if condition.get(column):
+                        where.append(f"{column} = ?")
+                        key_params.append(condition[column])
+                value = condition.get("value")
+                if not where and value in (None, ""):
+                    continue
+                if where:
+                    key_ids = [row[0] for row in conn.execute(
+                        "SELECT id FROM attr_keys WHERE " + " AND ".join(where), key_params
+                    )]
+                else:
+                    key_ids = [row[0] for row in conn.execute("SELECT id FROM attr_keys")]
+                if not key_ids:
+                    return []
+                clause = f"SELECT theme_id FROM theme_attrs WHERE key_id IN ({', '.join('?' * len(key_ids))})"
+                params.extend(key_ids)
+                if value not in (None, ""):
+                    if condition.get("kind") == "color":
+                        value = shorten_color(value.strip())
+                    else:
+                        value = canonical_value(condition.get("attribute") or "", value)
+                    clause += " AND value = ?"
+                    params.append(value)
+                clauses.append(clause)
+            if not clauses:
+                return conn.execute("SELECT id, name FROM themes ORDER BY name LIMIT ?", (limit,)).fetchall()
+            query = (
+                "SELECT id, name FROM themes WHERE id IN (" + " INTERSECT ".join(clauses) + ") "
+                "ORDER BY name LIMIT ?"
+            )
+            return conn.execute(query, params + [limit]).fetchall()
+
+# --- WORKBOOK IMPORT ---
+# Pulls the workbook-level formatting (Format > Workbook) out of Tableau
+# workbooks. The XML is parsed incrementally and parsing stops as soon as
+# the workbook's <style> block ends; .twbx packages are read straight from
+# the zip, so large workbooks are never loaded or extracted whole.
+
+WORKBOOK_FILE_EXTENSIONS = (".twb", ".twbx")
+# Workbook style-rule element -> theme style element, where the names differ
+TWB_ELEMENT_ALIASES = {"title": "worksheet-title", "dash-title": "dashboard-title", "table": "view"}
+# Workbook format attribute -> candidate theme attributes, the first one the element supports wins
+TWB_ATTRIBUTE_ALIASES = {
+    "color": ("font-color", "line-color", "mark-color"),
+    "stroke-color": ("line-color",),
+    "stroke-size": ("line-width",),
+}
+
+# Theme attribute -> the workbook format attribute written for it
+TWB_ATTRIBUTE_NAMES = {"font-color": "color", "line-color": "stroke-color", "line-width": "stroke-size"}
+# Workbook children that come before the workbook <style> block
+TWB_STYLE_PRECEDES = ("repository-location", "document-format-change-manifest", "preferences")
+WORKBOOK_COPY_CHUNK = 1024 * 1024
+
+class ExtractedTheme(NamedTuple):
+    data: dict
+    # "element/attribute" of workbook formats with no theme equivalent
+    unmapped: list
+
+def workbook_member(package):
+    """The workbook XML member of a .twbx package, the top-most .twb"""
+    members = sorted(
+        (info for info in package.infolist() if info.filename.lower().endswith(".twb")),
+        key=lambda info: (info.filename.count("/"), info.filename)
+    )
+    if not members:
+        raise ValueError("Packaged workbook contains no .twb file")
+    return members[0]
+
+@contextmanager
+def open_workbook_xml(source):
+    """Binary stream of a workbook's XML, from a .twb or from the .twb inside a .twbx package
+
+    ``source`` is a path or a seekable binary file object (e.g. an upload).
+    """
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as package:
+            with package.open(workbook_member(package)) as stream:
+                yield stream
+        return
+    if hasattr(source, "read"):
+        source.seek(0)
+        yield source
+        return
+    with open(source, "rb") as stream:
+        yield stream
+
+def workbook_value(spec, value):
+    """Convert a workbook format value (always text) to the type the theme uses"""
+    if spec.kind == "size":
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        return int(number) if number.is_integer() else value
+    if spec.kind == "color" and HEX_COLOR_RE.fullmatch(value):
+        return value.upper()
+    return value
+
+def theme_attribute(element, attr, specs):
+    """Theme attribute a workbook format attribute maps to for an element, or None"""
+    if attr in specs:
+        return attr
+    for candidate in TWB_ATTRIBUTE_ALIASES.get(attr, ()):
+        if candidate in specs:
+            return candidate
+    return None
+
+def extract_workbook_theme(source, catalog=None):
+    """Theme dict built from a workbook's workbook-level style rules
+
+    Values that do not validate against the catalog are reported as unmapped
+    rather than copied into the theme.
+    """
+    catalog = catalog or DEFAULT_CATALOG
+    styles = {}
+    unmapped = []
+    with open_workbook_xml(source) as stream:
+        path = []
+        nodes = []
+        element = None
+        for event, node in ET.iterparse(stream, events=("start", "end")):
+            if event == "start":
+                path.append(node.tag)
+                nodes.append(node)
+                if node.tag == "style-rule" and path[-3:-1] == ["workbook", "style"]:
+                    element = node.get("element")
+                continue
+            path.pop()
+            nodes.pop()
+            if nodes:
+                # Every child of the parent has ended by now; dropping them keeps memory flat
+                del nodes[-1][:]
+            if node.tag == "format" and element is not None and path[-3:] == ["workbook", "style", "style-rule"]:
+                theme_element = TWB_ELEMENT_ALIASES.get(element, element)
+                specs = catalog.schema.get(theme_element, {})
+                attr = theme_attribute(theme_element, node.get("attr", ""), specs)
+                value = node.get("value")
+                if attr is not None and value is not None:
+                    # Later duplicates overwrite earlier ones, as in Tableau
+                    value = workbook_value(specs[attr], value)
+                    if specs[attr].validate is None or not specs[attr].validate(theme_element, attr, value):
+                        styles.setdefault(theme_element, {})[attr] = value
+                        continue
+                unmapped.append(f"{element}/{node.get('attr')}")
+            elif node.tag == "style-rule":
+                element = None
+            elif node.tag == "style" and path == ["workbook"]:
+                # Only the workbook-level block matters, skip the rest of the file
+                break
+    data = create_default_theme(catalog)
+    data["styles"] = styles
+    return ExtractedTheme(data, unmapped)
+
+def workbook_style_rules(data):
+    """Theme styles as workbook style rules: workbook element -> {theme attribute: text value}"""
+    elements = {theme: workbook for workbook, theme in TWB_ELEMENT_ALIASES.items()}
+    rules = {}
+    for element, properties in data.get("styles", {}).items():
+        if isinstance(properties, dict) and properties:
+            rules[elements.get(element, element)] = (element, {attr: str(value) for attr, value in properties.items()})
+    return rules
+
+class WorkbookThemeWriter(XMLGenerator):
+    """Expat handlers that copy workbook XML through, rewriting the workbook-level style rules
+
+    Formats the theme sets replace the workbook's (every duplicate is
+    rewritten, so the last one, which Tableau and extraction use, carries the
+    theme value), theme values the workbook lacks are appended to the first
+    rule for their element, and rules for theme elements the workbook lacks are
+    added at the end of the <style> block, which is created if the workbook has
+    none.
+
+    Once the block is written nothing else needs rewriting, so the writer
+    records ``verbatim_from``, the input offset from which the rest can be
+    copied byte for byte. If the block was created before a later workbook
+    child, the rest is still scanned (depth only) for a workbook-level <style>
+    further down, whose span is recorded in ``skip_from``/``skip_to`` to drop it.
+    """
+
+    def __init__(self, out, rules, catalog, parser):
+        super().__init__(out, encoding="utf-8", short_empty_elements=True)
+        self.rules = rules
+        self.catalog = catalog
+        self.parser = parser
+        self.path = []
+        self.style_written = False
+        self.rule = None
+        # Workbook element of each rule seen -> theme values not yet in the workbook
+        self.pending = {}
+        self.formats_written = 0
+        self.can_copy = True
+        # Input offset of the latest event; nothing the parser reports later starts before it
+        self.last_event = 0
+        self.verbatim_from = None
+        self.verbatim_after_tag = False
+        self.scanning = False
+        self.depth = 0
+        self.skip_from = None
+        self.skip_to = None
+        parser.XmlDeclHandler = self.xml_declaration
+        parser.StartElementHandler = self.startElement
+        parser.EndElementHandler = self.endElement
+        parser.CharacterDataHandler = self.characters
+        parser.ProcessingInstructionHandler = self.processingInstruction
+
+    def xml_declaration(self, version, encoding, standalone):
+        # Verbatim copying only works if the input is UTF-8 like the output
+        if encoding and encoding.lower().replace("_", "-") not in ("utf-8", "utf8"):
+            self.can_copy = False
+
+    def start_verbatim(self, after_tag, scan):
+        """Stop rewriting; the rest of the input is copied (and scanned if scan is True)"""
+        self.verbatim_from = self.parser.CurrentByteIndex
+        self.verbatim_after_tag = after_tag
+        self.scanning = scan
+        self.parser.ProcessingInstructionHandler = None
+        if scan:
+            # Called from the start of a workbook child, which the scan counts as open
+            self.depth = 2
+            self.parser.StartElementHandler = self.scan_start
+            self.parser.EndElementHandler = self.scan_end
+            self.parser.CharacterDataHandler = self.scan_text
+        else:
+            self.stop_scanning()
+
+    def stop_scanning(self):
+        self.scanning = False
+        self.parser.StartElementHandler = None
+        self.parser.EndElementHandler = None
+        self.parser.CharacterDataHandler = None
+
+    def scan_start(self, name, attrs):
+        self.last_event = self.parser.CurrentByteIndex
+        self.depth += 1
+        if self.depth == 2 and name == "style":
+            self.skip_from = self.last_event
+
+    def scan_end(self, name):
+        self.last_event = self.parser.CurrentByteIndex
+        if self.depth == 2 and self.skip_from is not None:
+            self.skip_to = self.last_event
+            self.stop_scanning()
+        self.depth -= 1
+
+    def scan_text(self, content):
+        self.last_event = self.parser.CurrentByteIndex
+
+    def startElement(self, name, attrs):
+        self.last_event = self.parser.CurrentByteIndex
+        if self.path == ["workbook"] and not self.style_written and name not in TWB_STYLE_PRECEDES and name != "style":
+            self.write_style_block()
+            if self.can_copy:
+                self.start_verbatim(after_tag=False, scan=True)
+                return
+        self.path.append(name)
+        if self.path == ["workbook", "style"]:
+            self.style_written = True
+        elif name == "style-rule" and self.path[:-1] == ["workbook", "style"]:
+            self.rule = attrs.get("element")
+            if self.rule not in self.pending:
+                self.pending[self.rule] = dict(self.rules.get(self.rule, (None, {}))[1])
+        elif name == "format" and self.rule is not None and self.path[:-1] == ["workbook", "style", "style-rule"]:
+            element, values = self.rules.get(self.rule, (None, {}))
+            attr = theme_attribute(element, attrs.get("attr", ""), self.catalog.schema.get(element, {})) if element else None
+            if attr is not None and attr in values:
+                attrs = dict(attrs)
+                attrs["value"] = values[attr]
+                self.pending[self.rule].pop(attr, None)
+                self.formats_written += 1
+        super().startElement(name, attrs)
+
+    def endElement(self, name):
+        self.last_event = self.parser.CurrentByteIndex
+        block_done = False
+        if name == "style-rule" and self.rule is not None and self.path[:-1] == ["workbook", "style"]:
+            self.write_formats(self.rules.get(self.rule, (None, {}))[0], self.pending[self.rule])
+            self.pending[self.rule] = {}
+            self.rule = None
+        elif self.path == ["workbook", "style"]:
+            for workbook_element, (element, values) in self.rules.items():
+                if workbook_element not in self.pending:
+                    self.write_rule(workbook_element, element, values)
+            block_done = True
+        elif self.path == ["workbook"] and not self.style_written:
+            self.write_style_block()
+        self.path.pop()
+        super().endElement(name)
+        if block_done and self.can_copy:
+            self.start_verbatim(after_tag=True, scan=False)
+
+    def characters(self, content):
+        self.last_event = self.parser.CurrentByteIndex
+        super().characters(content)
+
+    def processingInstruction(self, target, data):
+        self.last_event = self.parser.CurrentByteIndex
+        super().processingInstruction(target, data)
+
+    def write_formats(self, element, values):
+        for attr, value in values.items():
+            super().startElement("format", {"attr": TWB_ATTRIBUTE_NAMES.get(attr, attr), "value": value})
+            super().endElement("format")
+            self.formats_written += 1
+
+    def write_rule(self, workbook_element, element, values):
+        super().startElement("style-rule", {"element": workbook_element})
+        self.write_formats(element, values)
+        super().endElement("style-rule")
+        self.pending[workbook_element] = {}
+
+    def write_style_block(self):
+        super().startElement("style", {})
+        for workbook_element, (element, values) in self.rules.items():
+            self.write_rule(workbook_element, element, values)
+        super().endElement("style")
+        self.style_written = True
+
+def rewrite_workbook_xml(source, out, rules, catalog):
+    """Stream workbook XML from one binary file object to another with the theme's style rules
+
+    Everything up to the end of the workbook <style> block goes through the
+    parser and the writer; the rest of the file (data sources, worksheets,
+    thumbnails - nearly all of it) is copied through byte for byte.
+    """
+    parser = xml.parsers.expat.ParserCreate()
+    parser.buffer_text = True
+    writer = WorkbookThemeWriter(out, rules, catalog, parser)
+    writer.startDocument()
+    # Input from offset `start` that is not written or dropped yet. Bytes
+    # before the writer's last event can go: later events start after it.
+    window, start = b"", 0
+    copying = False
+    while True:
+        chunk = source.read(WORKBOOK_COPY_CHUNK)
+        window += chunk
+        parser.Parse(chunk, not chunk)
+        if writer.verbatim_from is None:
+            if not chunk:
+                writer.endDocument()
+                break
+            done = writer.last_event - start
+            window, start = window[done:], start + done
+            continue
+        if not copying:
+            copying = True
+            writer.endDocument()
+            begin = writer.verbatim_from - start
+            if writer.verbatim_after_tag:
+                begin = window.index(b">", begin) + 1
+            window, start = window[begin:], start + begin
+        if writer.skip_to is not None:
+            # Drop the workbook-level <style> block found further down
+            out.write(window[:writer.skip_from - start])
+            tail = window.index(b">", writer.skip_to - start) + 1
+            window, start = window[tail:], start + tail
+            writer.skip_from = writer.skip_to = None
+        if writer.scanning and chunk:
+            # Keep what a workbook-level <style> found later could still start in
+            safe = (writer.skip_from if writer.skip_from is not None else writer.last_event) - start
+            out.write(window[:safe])
+            window, start = window[safe:], start + safe
+            continue
+        out.write(window)
+        shutil.copyfileobj(source, out, WORKBOOK_COPY_CHUNK)
+        break
+    return writer.formats_written
+
+def apply_theme_to_workbook(path, output_path, data, catalog=None):
+    """Write a copy of a .twb/.twbx with the theme applied as its workbook formatting
+
+    .twbx packages are rebuilt member by member: the workbook XML is rewritten
+    on the fly and every other member (extracts, images) is copied through in
+    chunks. The result is written next to the output and renamed into place,
+    so ``output_path`` may be ``path`` itself. Returns the number of formats written.
+    """
+    catalog = catalog or DEFAULT_CATALOG
+    rules = workbook_style_rules(data)
+    directory = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(directory, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as out:
+            if not zipfile.is_zipfile(path):
+                with open(path, "rb") as source:
+                    written = rewrite_workbook_xml(source, out, rules, catalog)
+            else:
+                with zipfile.ZipFile(path) as package, zipfile.ZipFile(out, "w") as repackaged:
+                    workbook = workbook_member(package)
+                    for info in package.infolist():
+                        target = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                        target.compress_type = info.compress_type
+                        target.external_attr = info.external_attr
+                        # The rewritten workbook can grow, leave room before the 4GB zip64 limit
+                        large = info.file_size * 2 >= zipfile.ZIP64_LIMIT
+                        with package.open(info) as member, repackaged.open(target, "w", force_zip64=large) as copy_out:
+                            if info is workbook:
+                                written = rewrite_workbook_xml(member, copy_out, rules, catalog)
+                            else:
+                                shutil.copyfileobj(member, copy_out, WORKBOOK_COPY_CHUNK)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return written
+
+# --- BATCH PROCESSING ---
+# Headless entry point for processing whole directories of theme files.
+# Nothing in this section touches Streamlit, so pool workers stay cheap.
+
+THEME_FILE_EXTENSIONS = (".json", ".tms")
+
+def iter_theme_files(root, extensions=THEME_FILE_EXTENSIONS):
+    """Yield theme (or other) file paths under a directory in a stable order"""
+    if os.path.isfile(root):
+        yield root
+        return
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(extensions):
+                yield os.path.join(dirpath, filename)
+
+def check_theme_shape(data):
+    """Raise ValueError unless data is a theme object with an object of styles
+
+    Problems inside individual style elements are left to validate_theme,
+    which reports them as validation errors.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Theme file must be a JSON object")
+    if not isinstance(data.get("styles", {}), dict):
+        raise ValueError("'styles' must be a JSON object")
+    return data
+
+def load_theme_file(path):
+    """Read a theme JSON file from disk, raises ValueError if it is not theme-shaped"""
+    with open(path, encoding="utf-8") as f:
+        return check_theme_shape(json.load(f))
+
+def write_theme_file(path, data):
+    """Write a theme JSON file using the same layout as the export button"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(dumps_theme(data))
+
+def batch_output_path(path, options):
+    """Work out where a batch task should write its result for a file"""
+    if options.get("in_place"):
+        return path
+    root = options["root"]
+    if os.path.isfile(root):
+        relative = os.path.basename(path)
+    else:
+        relative = os.path.relpath(path, root)
+    return os.path.join(options["output_dir"], relative)
+
+def batch_validate(path, options):
+    """Batch task: validate a single theme file"""
+    errors, warnings = validate_theme(load_theme_file(path), load_catalog(options.get("catalog")))
+    return {"valid": not errors, "errors": errors, "warnings": warnings}
+
+def batch_apply_palette(path, options):
+    """Batch task: apply a color palette to a single theme file, or only report the changes"""
+    plan = load_palette_plan(options.get("rules"), load_catalog(options.get("catalog")))
+    palette = COLOR_PALETTES[options["palette"]]
+    data = load_theme_file(path)
+    changes = plan.changes(data, palette)
+    record = {
+        "palette": options["palette"],
+        "changed": len(changes),
+        "changes": [[c.element, c.attribute, c.old, c.new] for c in changes],
+    }
+    if not options.get("dry_run"):
+        output_path = batch_output_path(path, options)
+        write_theme_file(output_path, plan.apply(data, palette))
+        record["output"] = output_path
+    return record
+
+def batch_optimize(path, options):
+    """Batch task: size-optimize a single theme file and flag it if it is still too large"""
+    rules = DROP_INHERITED_RULES if options.get("drop_inherited") else OPTIMIZE_RULES
+    result = optimize_theme(load_theme_file(path), rules, catalog=load_catalog(options.get("catalog")))
+    record = {
+        "original_bytes": result.original_bytes,
+        "optimized_bytes": result.size,
+        "saved": result.saved,
+        "over_limit": result.too_large,
+    }
+    if options.get("in_place") or options.get("output_dir"):
+        output_path = batch_output_path(path, options)
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(output_path, "wb") as f:
+            f.write(result.payload)
+        record["output"] = output_path
+    return record
+
+def batch_snap(path, options):
+    """Batch task: snap every color in a single theme file to the nearest allowed color"""
+    index = nearest_color_index(palette_colors(options.get("palette"), options.get("colors")))
+    data, report = snap_themes_to_palette([load_theme_file(path)], index, options.get("max_distance"))
+    moved = [snap for snap in report if snap.distance > 0]
+    record = {
+        "colors": len(report),
+        "moved": sum(snap.applied for snap in moved),
+        "max_distance": max((snap.distance for snap in report), default=0.0),
+        "off_palette": sum(not snap.applied for snap in report),
+        "changes": [
+            {key: value for key, value in snap._asdict().items() if key != "theme"}
+            for snap in moved
+        ],
+    }
+    if options.get("in_place") or options.get("output_dir"):
+        output_path = batch_output_path(path, options)
+        write_theme_file(output_path, data[0])
+        record["output"] = output_path
+    return record
+
+def batch_audit(path, options):
+    """Batch task: WCAG contrast audit of a single theme file"""
+    results = audit_contrast(
+        load_theme_file(path), catalog=load_catalog(options.get("catalog")), level=options.get("level", "AA")
+    )
+    failures = [result for result in results if not result.passed]
+    return {
+        "level": options.get("level", "AA"),
+        "pairs": len(results),
+        "min_ratio": min((result.ratio for result in results), default=None),
+        "contrast_failures": len(failures),
+        "failures": [result._asdict() for result in failures],
+    }
+
+def batch_extract(path, options):
+    """Batch task: extract the workbook-level formatting of a .twb/.twbx into a theme file"""
+    result = extract_workbook_theme(path, load_catalog(options.get("catalog")))
+    output_path = os.path.splitext(batch_output_path(path, options))[0] + ".json"
+    write_theme_file(output_path, result.data)
+    return {
+        "elements": len(result.data["styles"]),
+        "attributes": sum(len(properties) for properties in result.data["styles"].values()),
+        "unmapped": result.unmapped,
+        "output": output_path,
+    }
+
+def batch_apply_theme(path, options):
+    """Batch task: write a copy of a .twb/.twbx workbook with a theme applied as its workbook formatting"""
+    output_path = batch_output_path(path, options)
+    written = apply_theme_to_workbook(
+        path, output_path, load_theme_file(options["theme"]), load_catalog(options.get("catalog"))
+    )
+    return {"formats_written": written, "input_bytes": os.path.getsize(path), "output": output_path}
+
+BATCH_TASKS = {
+    "validate": batch_validate,
+    "apply-palette": batch_apply_palette,
+    "optimize": batch_optimize,
+    "snap": batch_snap,
+    "audit": batch_audit,
+    "extract": batch_extract,
+    "apply-theme": batch_apply_theme,
+}
+# Tasks that read something other than theme files
+BATCH_TASK_EXTENSIONS = {"extract": WORKBOOK_FILE_EXTENSIONS, "apply-theme": WORKBOOK_FILE_EXTENSIONS}
+
+def run_batch_task(task, path, options):
+    """Run one batch task and wrap the outcome in a JSON-serializable record"""
+    start = time.perf_counter()
+    record = {"file": path, "task": task}
+    try:
+        record.update(BATCH_TASKS[task](path, options))
+        record["status"] = "ok"
+    except (OSError, ValueError, zipfile.BadZipFile, ET.ParseError, xml.parsers.expat.ExpatError) as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+    except Exception as e:
+        # Anything else is a bug for this file, but must not end the whole run
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return record
+
+def run_batch(task, paths, options=None, workers=None):
+    """Stream files through a process pool, yielding records as they finish
+
+    Only a bounded number of files is in flight at once, so arbitrarily large
+    directories never get materialized as a single list of futures. With
+    ``workers=1`` everything runs in-process, which is handy for debugging.
+    """
+    options = options or {}
+    paths = iter(paths)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for path in paths:
+            yield run_batch_task(task, path, options)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        max_pending = workers * 4
+        pending = set()
+        for path in paths:
+            pending.add(executor.submit(run_batch_task, task, path, options))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in wait(pending).done:
+            yield future.result()
+
+def batch_record_failed(record):
+    """Whether a batch record should make the run exit non-zero"""
+    return (
+        record["status"] != "ok" or record.get("valid") is False or record.get("over_limit") is True
+        or bool(record.get("off_palette")) or bool(record.get("contrast_failures"))
+    )
+
+def build_arg_parser():
+    """Build the command line parser for headless mode"""
+    parser = argparse.ArgumentParser(
+        prog="python -m tabthemeeditor",
+        description="Headless tools for Tableau theme files. Run the editor UI with 'streamlit run tabthemeeditor.py'."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    batch = commands.add_parser("batch", help="Process a directory of theme files in parallel")
+    tasks = batch.add_subparsers(dest="task", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("path", help="Theme file or directory to scan for .json/.tms files")
+    common.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count, 1 runs in-process)")
+    common.add_argument("--results", default="-", help="Where to write JSON-lines results (default: stdout)")
+    common.add_argument(
+        "--catalog", default=BUILTIN_CATALOG_ID,
+        help=f"Element catalog to validate against, the built-in one or a schema file in {CATALOG_DIR}"
+    )
+
+    tasks.add_parser("validate", parents=[common], help="Validate every theme file")
+
+    apply_parser = tasks.add_parser("apply-palette", parents=[common], help="Apply a preset palette to every theme file")
+    apply_parser.add_argument("--palette", required=True, choices=list(COLOR_PALETTES.keys()))
+    apply_parser.add_argument(
+        "--rules", help='JSON file of palette rules, e.g. {"accent": ["mark.mark-color", "highlighter.background-color"]}'
+    )
+    destination = apply_parser.add_mutually_exclusive_group(required=True)
+    destination.add_argument("--output-dir", help="Write re-themed files here, mirroring the input layout")
+    destination.add_argument("--in-place", action="store_true", help="Overwrite the input files")
+    destination.add_argument("--dry-run", action="store_true", help="Only report what would change")
+
+    optimize_parser = tasks.add_parser(
+        "optimize", parents=[common],
+        help=f"Size-optimize every theme file and flag any still over {MAX_THEME_BYTES:,} bytes"
+    )
+    destination = optimize_parser.add_mutually_exclusive_group()
+    destination.add_argument("--output-dir", help="Write optimized files here, mirroring the input layout (default: report only)")
+    destination.add_argument("--in-place", action="store_true", help="Overwrite the input files")
+    optimize_parser.add_argument(
+        "--drop-inherited", action="store_true",
+        help="Also drop values equal to what the element inherits (follows the catalog's inheritance, which may not match Tableau's)"
+    )
+
+    snap_parser = tasks.add_parser(
+        "snap", parents=[common],
+        help="Snap every color to the nearest allowed palette color and report how far each moved"
+    )
+    snap_parser.add_argument("--palette", choices=list(COLOR_PALETTES.keys()), help="Preset palette to snap to")
+    snap_parser.add_argument("--colors", help="Comma separated allowed colors, e.g. '#003B5C,#0072CE' (added to --palette)")
+    snap_parser.add_argument(
+        "--max-distance", type=float, default=None,
+        help="Leave colors further than this OKLab distance alone and fail the file (0.02 is barely visible)"
+    )
+    destination = snap_parser.add_mutually_exclusive_group()
+    destination.add_argument("--output-dir", help="Write snapped files here, mirroring the input layout (default: report only)")
+    destination.add_argument("--in-place", action="store_true", help="Overwrite the input files")
+
+    audit_parser = tasks.add_parser("audit", parents=[common], help="Check text/background contrast against WCAG")
+    audit_parser.add_argument("--level", choices=list(CONTRAST_LEVELS), default="AA")
+
+    extract_parser = tasks.add_parser(
+        "extract", parents=[common],
+        help="Turn the workbook-level formatting of every .twb/.twbx workbook into a theme file"
+    )
+    extract_parser.add_argument("--output-dir", required=True, help="Write <workbook>.json themes here, mirroring the input layout")
+
+    apply_theme_parser = tasks.add_parser(
+        "apply-theme", parents=[common],
+        help="Apply a theme file as the workbook formatting of every .twb/.twbx workbook"
+    )
+    apply_theme_parser.add_argument("--theme", required=True, help="Theme JSON file, e.g. an export from the editor")
+    destination = apply_theme_parser.add_mutually_exclusive_group(required=True)
+    destination.add_argument("--output-dir", help="Write themed workbooks here, mirroring the input layout")
+    destination.add_argument("--in-place", action="store_true", help="Overwrite the input workbooks")
+
+    library = commands.add_parser("library", help="Import into and search the local theme library")
+    library.add_argument("--library", default=None, help=f"Library database (default: ${LIBRARY_ENV_VAR} or {default_library_path()})")
+    library_commands = library.add_subparsers(dest="task", required=True)
+    import_parser = library_commands.add_parser("import", help="Add every theme file under a directory, named by relative path")
+    import_parser.add_argument("path", help="Theme file or directory to scan for .json/.tms files")
+    search_parser = library_commands.add_parser("search", help="Print the themes matching an element/attribute/value query")
+    search_parser.add_argument("--element")
+    search_parser.add_argument("--attribute")
+    search_parser.add_argument("--kind", choices=sorted(ATTRIBUTE_KINDS))
+    search_parser.add_argument("--value")
+    search_parser.add_argument("--limit", type=int, default=100)
+    palette_parser = library_commands.add_parser(
+        "apply-palette", help="Apply a preset palette to every theme in the library and print what changed"
+    )
+    palette_parser.add_argument("--palette", required=True, choices=list(COLOR_PALETTES.keys()))
+    palette_parser.add_argument("--rules", help="JSON file of palette rules (default: the built-in rules)")
+    palette_parser.add_argument(
+        "--catalog", default=BUILTIN_CATALOG_ID,
+        help=f"Element catalog the rules' targets are checked against, the built-in one or a schema file in {CATALOG_DIR}"
+    )
+    palette_parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    return parser
+
+def library_apply_palette(library, plan, palette, dry_run=False, out=None):
+    """Apply a palette plan across the library, saving only themes it changes; returns (checked, changed)"""
+    out = out or sys.stdout
+    checked = 0
+    changed = []
+    def updates():
+        nonlocal checked
+        for theme_id, name, data in library.iter_themes():
+            checked += 1
+            changes = plan.changes(data, palette)
+            if not changes:
+                continue
+            changed.append(theme_id)
+            out.write(json.dumps({
+                "id": theme_id, "name": name,
+                "changes": [[c.element, c.attribute, c.old, c.new] for c in changes],
+            }) + "\n")
+            if not dry_run:
+                yield name, plan.apply(data, palette)
+    if dry_run:
+        for _ in updates():
+            pass
+    else:
+        library.save_many(updates())
+    return checked, len(changed)
 
-def validate_theme(data):
-    """Comprehensive theme validation"""
-    errors = []
-    warnings = []
-    
-    if not isinstance(data, dict):
-        errors.append("Theme file must be a JSON object")
-        return errors, warnings
-    
-    # Check required fields
-    if "version" not in data:
-        errors.append("Missing required 'version' field")
-    elif data["version"] != TABLEAU_VERSION:
-        warnings.append(f"Version {data['version']} may not match Tableau 2025.1 (expected {TABLEAU_VERSION})")
-    
-    if "styles" not in data:
-        errors.append("Missing required 'styles' object")
-        return errors, warnings
-    
-    # Validate base-theme
-    base_theme = data.get("base-theme", "smooth")
-    if base_theme not in BASE_THEMES:
-        warnings.append(f"Unknown base theme '{base_theme}'. Valid options: {', '.join(BASE_THEMES.keys())}")
-    
-    # Validate style elements
-    styles = data.get("styles", {})
-    for element, properties in styles.items():
-        if element not in STYLE_ELEMENTS:
-            warnings.append(f"Unknown style element '{element}' - it may not be supported")
-        
-        if not isinstance(properties, dict):
-            errors.append(f"Style element '{element}' must be an object")
-            continue
-        
-        # Validate attributes
-        for attr, value in properties.items():
-            if "color" in attr:
-                if not isinstance(value, str) or not value.startswith("#"):
-                    errors.append(f"Color attribute '{attr}' in '{element}' must be a hex color code (e.g., #FF0000)")
-            elif "font-size" in attr or "line-width" in attr:
-                if not isinstance(value, int) or value < 1 or value > 99:
-                    errors.append(f"Size attribute '{attr}' in '{element}' must be an integer between 1-99")
-            elif "font-family" in attr:
-                if not isinstance(value, str) or len(value) > 50:
-                    errors.append(f"Font family '{attr}' in '{element}' must be a string (max 50 characters)")
+def library_cli(args):
+    """Run a 'library' subcommand, returns the process exit code"""
+    library = ThemeLibrary(args.library)
+    start = time.perf_counter()
+    if args.task == "search":
+        condition = {"element": args.element, "attribute": args.attribute, "kind": args.kind, "value": args.value}
+        rows = library.search([condition], limit=args.limit)
+        for theme_id, name in rows:
+            print(json.dumps({"id": theme_id, "name": name}))
+        print(f"search: {len(rows)} theme(s) in {(time.perf_counter() - start) * 1000:.1f} ms", file=sys.stderr)
+        return 0
+    if args.task == "apply-palette":
+        try:
+            catalog = load_catalog(args.catalog)
+        except (OSError, ValueError) as e:
+            print(f"❌ Cannot load catalog '{args.catalog}': {e}", file=sys.stderr)
+            return 2
+        try:
+            plan = load_palette_plan(args.rules, catalog)
+            warnings = check_palette_plan(plan, COLOR_PALETTES[args.palette], catalog)
+        except (OSError, ValueError) as e:
+            print(f"❌ Cannot use palette rules: {e}", file=sys.stderr)
+            return 2
+        for warning in warnings:
+            print(f"⚠️ {warning}", file=sys.stderr)
+        checked, changed = library_apply_palette(library, plan, COLOR_PALETTES[args.palette], args.dry_run)
+        elapsed = time.perf_counter() - start
+        rate = checked / elapsed if elapsed > 0 else 0.0
+        verb = "would change" if args.dry_run else "changed"
+        print(f"apply-palette: {checked} theme(s) in {elapsed:.2f}s ({rate:.1f} themes/sec), {changed} {verb}", file=sys.stderr)
+        return 0
     
-    return errors, warnings
+    if not os.path.exists(args.path):
+        print(f"❌ No such file or directory: {args.path}", file=sys.stderr)
+        return 2
+    root = args.path if os.path.isdir(args.path) else os.path.dirname(args.path)
+    failed = []
+    def themes():
+        for path in iter_theme_files(args.path):
+            try:
+                yield os.path.relpath(path, root), load_theme_file(path)
+            except (OSError, ValueError) as e:
+                failed.append(path)
+                print(f"❌ {path}: {e}", file=sys.stderr)
+    count = library.save_many(themes())
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"import: {count} theme(s) in {elapsed:.2f}s ({rate:.1f} themes/sec), {len(failed)} failed", file=sys.stderr)
+    return 1 if failed else 0
 
-def apply_palette(theme_data, palette_colors):
-    """Apply a color palette to the theme"""
-    if "styles" not in theme_data:
-        theme_data["styles"] = {}
-    
-    # Apply primary to titles
-    for element in ["worksheet-title", "dashboard-title", "story-title"]:
-        if element not in theme_data["styles"]:
-            theme_data["styles"][element] = {}
-        theme_data["styles"][element]["font-color"] = palette_colors["primary"]
-    
-    # Apply secondary to controls
-    for element in ["legend-title", "filter-title", "parameter-ctrl-title"]:
-        if element not in theme_data["styles"]:
-            theme_data["styles"][element] = {}
-        theme_data["styles"][element]["font-color"] = palette_colors["secondary"]
-    
-    # Apply accent to marks
-    if "mark" not in theme_data["styles"]:
-        theme_data["styles"]["mark"] = {}
-    theme_data["styles"]["mark"]["mark-color"] = palette_colors["accent"]
-    
-    # Apply background
-    if "view" not in theme_data["styles"]:
-        theme_data["styles"]["view"] = {}
-    theme_data["styles"]["view"]["background-color"] = palette_colors["background"]
-    
-    return theme_data
+def cli(argv=None):
+    """Command line entry point, returns the process exit code"""
+    args = build_arg_parser().parse_args(argv)
+    if args.command == "library":
+        return library_cli(args)
+    options = {key: value for key, value in vars(args).items() if key not in ("command", "task", "path", "workers", "results")}
+    options["root"] = args.path
+
+    if not os.path.exists(args.path):
+        print(f"❌ No such file or directory: {args.path}", file=sys.stderr)
+        return 2
+    try:
+        load_catalog(args.catalog)
+    except (OSError, ValueError) as e:
+        print(f"❌ Cannot load catalog '{args.catalog}': {e}", file=sys.stderr)
+        return 2
+    if args.task == "apply-theme":
+        try:
+            errors, _ = validate_theme(load_theme_file(args.theme), load_catalog(args.catalog))
+        except (OSError, ValueError) as e:
+            print(f"❌ Cannot read theme '{args.theme}': {e}", file=sys.stderr)
+            return 2
+        if errors:
+            print(f"❌ Theme '{args.theme}' is not valid: {errors[0]}", file=sys.stderr)
+            return 2
+    if args.task == "apply-palette":
+        catalog = load_catalog(args.catalog)
+        try:
+            warnings = check_palette_plan(load_palette_plan(args.rules, catalog), COLOR_PALETTES[args.palette], catalog)
+        except (OSError, ValueError) as e:
+            print(f"❌ Cannot use palette rules: {e}", file=sys.stderr)
+            return 2
+        for warning in warnings:
+            print(f"⚠️ {warning}", file=sys.stderr)
+    if args.task == "snap":
+        try:
+            nearest_color_index(palette_colors(args.palette, args.colors))
+        except ValueError as e:
+            print(f"❌ {e} - pass --palette and/or --colors", file=sys.stderr)
+            return 2
+
+    out = sys.stdout if args.results == "-" else open(args.results, "w", encoding="utf-8")
+    count = failed = processed_bytes = 0
+    start = time.perf_counter()
+    try:
+        paths = iter_theme_files(args.path, BATCH_TASK_EXTENSIONS.get(args.task, THEME_FILE_EXTENSIONS))
+        for record in run_batch(args.task, paths, options, workers=args.workers):
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            count += 1
+            failed += batch_record_failed(record)
+            processed_bytes += record.get("input_bytes", 0)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0.0
+    throughput = f", {processed_bytes / elapsed / 1024 / 1024:.1f} MB/sec" if processed_bytes and elapsed > 0 else ""
+    print(f"{args.task}: {count} file(s) in {elapsed:.2f}s ({rate:.1f} files/sec{throughput}), {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
 
 # --- CUSTOM CSS ---
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     .main-header {
         background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
@@ -352,13 +3392,189 @@ st.markdown("""
         padding: 1rem;
         margin: 1rem 0;
     }
+    .theme-preview {
+        border: 1px solid #e0e0e0;
+        border-radius: 8px;
+        overflow: hidden;
+        max-width: 980px;
+    }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# --- PROFILING ---
+# Opt-in per-rerun timing, enabled with TABTHEME_PROFILE=1 or ?profile=1.
+# Set TABTHEME_PROFILE_LOG to a file path to also append each run as a JSON line.
+
+PROFILE_ENV_VAR = "TABTHEME_PROFILE"
+PROFILE_LOG_ENV_VAR = "TABTHEME_PROFILE_LOG"
+
+def profiling_enabled():
+    """Whether the debug profiler is switched on for this session"""
+    if os.environ.get(PROFILE_ENV_VAR, "").lower() in ("1", "true", "yes"):
+        return True
+    return st.query_params.get("profile", "") in ("1", "true")
+
+def widget_count():
+    """Widgets registered so far in the current run, None if Streamlit doesn't expose it"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return None
+    # Moved from the context onto ctx.shared in newer Streamlit releases
+    ids = getattr(getattr(ctx, "shared", None), "widget_ids_this_run", None)
+    if ids is None:
+        ids = getattr(ctx, "widget_ids_this_run", None)
+    if ids is None:
+        return None
+    return len(ids.snapshot()) if hasattr(ids, "snapshot") else len(ids)
+
+def session_state_size():
+    """Approximate pickled size of each session state entry, in bytes"""
+    sizes = {}
+    for key in list(st.session_state.keys()):
+        value = st.session_state[key]
+        try:
+            sizes[key] = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            # Widget values and Streamlit objects are not always picklable
+            sizes[key] = sys.getsizeof(value)
+    return sizes
+
+class RerunProfiler:
+    """Collects section timings and widget counts for one script run"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sections = []
+
+    @contextmanager
+    def section(self, name):
+        widgets_before = widget_count()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            widgets_after = widget_count()
+            self.sections.append({
+                "section": name,
+                "ms": round((time.perf_counter() - start) * 1000, 3),
+                "widgets": None if widgets_before is None or widgets_after is None else widgets_after - widgets_before,
+            })
+
+    def summary(self):
+        sizes = session_state_size()
+        return {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "widgets": widget_count(),
+            "session_state_bytes": sum(sizes.values()),
+            "session_state": dict(sorted(sizes.items(), key=lambda item: -item[1])[:10]),
+            "sections": self.sections,
+        }
+
+def profile_section(name):
+    """Time a block of the current run when profiling is on, otherwise do nothing"""
+    profiler = st.session_state.get("profiler")
+    if profiler is None:
+        return nullcontext()
+    return profiler.section(name)
+
+def render_profile_panel(profiler):
+    """Sidebar panel with the timings of the run that just finished"""
+    summary = profiler.summary()
+    log_path = os.environ.get(PROFILE_LOG_ENV_VAR)
+    if log_path:
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(summary) + "\n")
+    
+    with st.expander("⏱️ Profile (last run)", expanded=True):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Run", f"{summary['total_ms']:.0f} ms")
+        col2.metric("Widgets", summary["widgets"] if summary["widgets"] is not None else "n/a")
+        col3.metric("State", f"{summary['session_state_bytes'] / 1024:.1f} KB")
+        
+        top_level = [row for row in summary["sections"] if not row["section"].startswith("element ")]
+        elements = [row for row in summary["sections"] if row["section"].startswith("element ")]
+        st.dataframe(top_level, use_container_width=True, hide_index=True)
+        if elements:
+            st.caption(f"{len(elements)} element editor(s), slowest first")
+            st.dataframe(sorted(elements, key=lambda row: -row["ms"]), use_container_width=True, hide_index=True)
+        st.caption("Session state (bytes)")
+        st.json(summary["session_state"], expanded=False)
 
 # --- MAIN APP ---
 
+# Sidebar validation/export runs in its own fragment. A tiny watcher fragment
+# polls on this interval and reruns the page only once edits made in element
+# fragments have settled for EDIT_DEBOUNCE_SECONDS; idle sessions do no work.
+SIDEBAR_REFRESH_SECONDS = 1.0
+EDIT_DEBOUNCE_SECONDS = 0.5
+
+def mark_theme_changed(debounce=True, record=True):
+    """Follow up on a change the theme model reported
+
+    Edits made inside element fragments are debounced before the sidebar status
+    is recomputed; whole-theme changes (new, upload, palette) refresh at once.
+    The change is recorded in the undo history unless it came from undo/redo.
+    """
+    st.session_state.last_edit_time = time.monotonic() if debounce else 0.0
+    if record:
+        st.session_state.history.record(st.session_state.theme_data.to_dict())
+
+def load_theme(data):
+    """Replace the theme being edited, raises ValueError if data is not a theme object"""
+    theme = st.session_state.theme_data
+    st.session_state.pop("snap_report", None)
+    if theme is None:
+        st.session_state.theme_data = ThemeModel(data)
+    elif not theme.load(data):
+        return
+    mark_theme_changed(debounce=False)
+
+def undo_theme_change():
+    """Step the theme back one change"""
+    theme = st.session_state.theme_data
+    data = copy.deepcopy(theme.to_dict())
+    if st.session_state.history.undo(data):
+        theme.load(data)
+        mark_theme_changed(debounce=False, record=False)
+
+def redo_theme_change():
+    """Re-apply the last undone change"""
+    theme = st.session_state.theme_data
+    data = copy.deepcopy(theme.to_dict())
+    if st.session_state.history.redo(data):
+        theme.load(data)
+        mark_theme_changed(debounce=False, record=False)
+
+def switch_catalog(catalog):
+    """Make a catalog active and rebuild the caches compiled against the previous one"""
+    st.session_state.catalog = catalog
+    st.session_state.validator = IncrementalValidator(catalog)
+    st.session_state.resolver = CascadeResolver(catalog.parents, catalog.elements)
+    st.session_state.serializer = ThemeSerializer(catalog=catalog)
+    st.session_state.cvd_simulator = CvdSimulator(catalog)
+    st.session_state.pop("theme_status", None)
+
+def on_catalog_change(key):
+    """Widget callback: load and activate the selected catalog"""
+    try:
+        switch_catalog(load_catalog(st.session_state[key]))
+        st.session_state.pop("catalog_error", None)
+    except (OSError, ValueError) as e:
+        st.session_state.catalog_error = f"Cannot load catalog '{st.session_state[key]}': {e}"
+
+def on_base_theme_change(theme, key):
+    """Widget callback: store the selected base theme"""
+    if theme.set_base_theme(st.session_state[key]):
+        mark_theme_changed(debounce=False)
+
 def main():
     """Main application entry point"""
+    configure_page()
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+    
     # Header
     st.markdown("""
     <div class="main-header">
@@ -370,13 +3586,19 @@ def main():
     """, unsafe_allow_html=True)
     
     # Initialize session state
+    st.session_state.profiler = RerunProfiler() if profiling_enabled() else None
     if "theme_data" not in st.session_state:
         st.session_state.theme_data = None
     if "history" not in st.session_state:
-        st.session_state.history = []
+        st.session_state.history = ThemeHistory()
+    if "catalog" not in st.session_state:
+        switch_catalog(DEFAULT_CATALOG)
+    catalog = st.session_state.catalog
+    if "last_edit_time" not in st.session_state:
+        st.session_state.last_edit_time = 0.0
     
     # Sidebar
-    with st.sidebar:
+    with st.sidebar, profile_section("sidebar"):
         st.header("⚙️ Theme Management")
         
         # File operations
@@ -385,19 +3607,54 @@ def main():
         col1, col2 = st.columns(2)
         with col1:
             if st.button("🆕 New", use_container_width=True):
-                st.session_state.theme_data = create_default_theme()
+                load_theme(create_default_theme(catalog))
                 st.rerun()
         
         with col2:
-            uploaded_file = st.file_uploader("📤 Upload", type=["json"], label_visibility="collapsed")
-            if uploaded_file:
+            uploaded_file = st.file_uploader(
+                "📤 Upload", type=["json", "twb", "twbx"], label_visibility="collapsed",
+                help="A theme JSON file, or a Tableau workbook to take its workbook formatting from"
+            )
+            # The uploader keeps returning the file on every rerun, only load it once
+            if uploaded_file and st.session_state.get("uploaded_file_id") != uploaded_file.file_id:
                 try:
-                    st.session_state.theme_data = json.load(uploaded_file)
+                    if uploaded_file.name.lower().endswith(WORKBOOK_FILE_EXTENSIONS):
+                        extracted = extract_workbook_theme(uploaded_file, catalog)
+                        load_theme(extracted.data)
+                        if extracted.unmapped:
+                            st.info(f"ℹ️ Skipped {len(extracted.unmapped)} workbook format(s) with no theme equivalent")
+                    else:
+                        load_theme(json.load(uploaded_file))
+                    st.session_state.uploaded_file_id = uploaded_file.file_id
                     st.success("✅ Loaded!")
                 except json.JSONDecodeError:
                     st.error("❌ Invalid JSON - please check your local file.")
+                except (ET.ParseError, zipfile.BadZipFile) as e:
+                    st.error(f"❌ Cannot read workbook: {e}")
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+        
+        # Element catalog (Tableau release or organization override) to edit and validate against
+        catalog_key = "catalog_select"
+        catalog_options = available_catalogs()
+        if catalog.id not in catalog_options:
+            catalog_options.append(catalog.id)
+        bind_widget(catalog_key, catalog.id)
+        st.selectbox(
+            "📚 Element Catalog",
+            catalog_options,
+            key=catalog_key,
+            on_change=on_catalog_change,
+            args=(catalog_key,),
+            help=f"Schema files are read from {CATALOG_DIR}"
+        )
+        if st.session_state.get("catalog_error"):
+            st.error(f"❌ {st.session_state.catalog_error}")
+        st.caption(f"{catalog.label} · {len(catalog.elements)} elements")
+        
+        render_theme_library(st.session_state.theme_data, catalog)
         
-        if st.session_state.theme_data:
+        if st.session_state.theme_data is not None:
             st.divider()
             
             # Global settings
@@ -406,103 +3663,108 @@ def main():
             data = st.session_state.theme_data
             
             # Version (read-only)
-            st.text_input("Version", value=data.get("version", TABLEAU_VERSION), disabled=True)
+            st.text_input("Version", value=data.version or catalog.version, disabled=True)
             
-            # Base theme
-            current_base = data.get("base-theme", "smooth")
-            base_options = list(BASE_THEMES.keys())
-            base_idx = base_options.index(current_base) if current_base in base_options else 0
-            new_base = st.selectbox(
+            # Base theme, only written when the user picks a different one
+            base_options = list(catalog.base_themes.keys())
+            base_key = "base_theme_select"
+            bind_widget(base_key, data.base_theme if data.base_theme in catalog.base_themes else base_options[0])
+            st.selectbox(
                 "Base Theme",
                 base_options,
-                index=base_idx,
-                format_func=lambda x: f"{x.title()} - {BASE_THEMES[x]}"
+                key=base_key,
+                format_func=lambda x: f"{x.title()} - {catalog.base_themes[x]}",
+                on_change=on_base_theme_change,
+                args=(data, base_key)
             )
-            data["base-theme"] = new_base
             
             st.divider()
             
             # Quick palette application
             st.subheader("🎨 Quick Color Palettes")
+            palettes = available_palettes()
             selected_palette = st.selectbox(
                 "Apply Palette",
-                ["None"] + list(COLOR_PALETTES.keys())
+                ["None"] + list(palettes.keys())
             )
             
             if selected_palette != "None":
-                if st.button("Apply Palette", use_container_width=True):
-                    st.session_state.theme_data = apply_palette(
-                        st.session_state.theme_data,
-                        COLOR_PALETTES[selected_palette]
+                plan = load_palette_plan(catalog=st.session_state.catalog)
+                changes = plan.changes(data.to_dict(), palettes[selected_palette])
+                with st.expander(f"👀 Preview: {len(changes)} change(s)"):
+                    for change in changes:
+                        old = change.old if change.old is not None else "unset"
+                        st.markdown(f"`{change.element}` {change.attribute} ({change.role}): {old} → {change.new}")
+                    if not changes:
+                        st.caption("The theme already uses this palette")
+                    if plan.skipped:
+                        st.caption(
+                            f"Skipped, not in {st.session_state.catalog.label}: "
+                            + ", ".join(f"`{target}`" for _, target in plan.skipped)
+                        )
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button("Apply Palette", use_container_width=True):
+                        load_theme(apply_palette(
+                            copy.deepcopy(data.to_dict()),
+                            palettes[selected_palette],
+                            st.session_state.catalog
+                        ))
+                        st.success(f"✅ Applied {selected_palette}")
+                        st.rerun()
+                with col2:
+                    snap = st.button(
+                        "🧲 Snap Colors", use_container_width=True,
+                        help="Replace every color with the nearest palette color (perceptual OKLab distance)"
                     )
-                    st.success(f"✅ Applied {selected_palette}")
+                if snap:
+                    index = nearest_color_index(palette_colors(colors=",".join(palettes[selected_palette].values())))
+                    snapped, report = snap_themes_to_palette([copy.deepcopy(data.to_dict())], index)
+                    load_theme(snapped[0])
+                    st.session_state.snap_report = (selected_palette, [s for s in report if s.distance > 0])
                     st.rerun()
             
-            st.divider()
-            
-            # Validation
-            st.subheader("✅ Validation")
-            errors, warnings = validate_theme(data)
+            render_palette_generator("sidebar_generator")
             
-            if errors:
-                st.error(f"❌ {len(errors)} Error(s)")
-                with st.expander("View Errors"):
-                    for err in errors:
-                        st.write(f"• {err}")
-            elif warnings:
-                st.warning(f"⚠️ {len(warnings)} Warning(s)")
-                with st.expander("View Warnings"):
-                    for warn in warnings:
-                        st.write(f"• {warn}")
-            else:
-                st.success("✅ Theme Valid")
+            if st.session_state.get("snap_report"):
+                render_snap_report(*st.session_state.snap_report)
             
             st.divider()
             
-            # Export
-            st.subheader("💾 Export")
-            
-            theme_name = st.text_input("Theme Name", "custom_theme")
-            json_output = json.dumps(data, indent=2)
-            
-            st.download_button(
-                label="📥 Download JSON",
-                data=json_output,
-                file_name=f"{theme_name}.json",
-                mime="application/json",
-                use_container_width=True
-            )
-            
-            # File size check
-            file_size = len(json_output.encode('utf-8'))
-            if file_size > 15000:
-                st.error(f"⚠️ File too large: {file_size} bytes (max: 15,000)")
-            else:
-                st.caption(f"File size: {file_size} bytes")
+            render_theme_status(data)
+            watch_theme_status(data)
     
     # Main content area
-    if st.session_state.theme_data:
+    if st.session_state.theme_data is not None:
         data = st.session_state.theme_data
         
         # Tabs for different editing modes
-        tab1, tab2, tab3, tab4 = st.tabs([
+        tab1, tab2, tab_preview, tab3, tab4 = st.tabs([
             "📝 Edit by Category",
             "🔍 Edit All Elements",
+            "👁️ Preview",
             "💻 JSON Editor",
             "📚 Documentation"
-        ])
+        ], key="main_tabs", on_change="rerun")
         
-        with tab1:
+        with tab1, profile_section("edit_by_category"):
             edit_by_category(data)
         
-        with tab2:
+        with tab2, profile_section("edit_all_elements"):
             edit_all_elements(data)
         
-        with tab3:
+        # Switching tabs reruns the app, so the preview is always drawn from the latest edits
+        with tab_preview, profile_section("preview"):
+            if tab_preview.open:
+                show_preview(data)
+        
+        with tab3, profile_section("json_editor"):
             json_editor(data)
         
-        with tab4:
-            show_documentation()
+        # Tab state is tracked so the documentation (and pandas) only load when opened
+        with tab4, profile_section("show_documentation"):
+            if tab4.open:
+                show_documentation()
     
     else:
         # Welcome screen with getting started options
@@ -516,7 +3778,7 @@ def main():
             </div>
             """, unsafe_allow_html=True)
             if st.button("Create New Theme", use_container_width=True, type="primary"):
-                st.session_state.theme_data = create_default_theme()
+                load_theme(create_default_theme(catalog))
                 st.rerun()
         
         with col2:
@@ -529,11 +3791,13 @@ def main():
             upload = st.file_uploader("Choose JSON file", type=["json"], key="main_upload")
             if upload:
                 try:
-                    st.session_state.theme_data = json.load(upload)
+                    load_theme(json.load(upload))
                     st.success("✅ Theme loaded!")
                     st.rerun()
                 except json.JSONDecodeError:
                     st.error("❌ Invalid JSON file")
+                except ValueError as e:
+                    st.error(f"❌ {e}")
         
         with col3:
             st.markdown("""
@@ -542,12 +3806,15 @@ def main():
                 <p>Start from a color palette</p>
             </div>
             """, unsafe_allow_html=True)
-            template = st.selectbox("Choose palette", list(COLOR_PALETTES.keys()), key="template_select")
+            palettes = available_palettes()
+            template = st.selectbox("Choose palette", list(palettes.keys()), key="template_select")
             if st.button("Create from Template", use_container_width=True):
-                new_theme = create_default_theme()
-                st.session_state.theme_data = apply_palette(new_theme, COLOR_PALETTES[template])
+                new_theme = create_default_theme(catalog)
+                load_theme(apply_palette(new_theme, palettes[template], catalog))
                 st.success(f"✅ Created theme with {template} palette!")
                 st.rerun()
+            render_logo_palette(catalog)
+            render_palette_generator("welcome_generator")
         
         st.markdown("---")
         
@@ -612,13 +3879,346 @@ def main():
             - Keep your file under 15KB for best performance
             - Test on a sample workbook before rolling out widely
             """)
+    
+    if st.session_state.profiler is not None:
+        with st.sidebar:
+            render_profile_panel(st.session_state.profiler)
+
+@streamlit_decorator("cache_resource", max_entries=32, show_spinner=False)
+def cached_logo_palette(digest, count, _image_bytes):
+    """extract_logo_palette cached by image hash, so reruns don't decode the image again"""
+    return extract_logo_palette(_image_bytes, count)
+
+def render_logo_palette(catalog):
+    """Welcome screen upload that turns a logo's dominant colors into a palette"""
+    upload = st.file_uploader(
+        "…or start from a logo", type=["png", "jpg", "jpeg", "gif", "webp", "bmp"], key="logo_upload"
+    )
+    if not upload:
+        return
+    count = st.slider("Colors to extract", *LOGO_COLOR_RANGE, 6, key="logo_colors")
+    image_bytes = upload.getvalue()
+    try:
+        logo = cached_logo_palette(hashlib.sha256(image_bytes).hexdigest(), count, image_bytes)
+    except ImportError:
+        st.warning("Install Pillow (`pip install pillow`) to read logo images")
+        return
+    except (OSError, ValueError) as e:
+        st.error(f"❌ Cannot read image: {e}")
+        return
+    st.markdown(swatch_html(logo.colors), unsafe_allow_html=True)
+    st.caption(" · ".join(f"{color} {weight:.0%}" for color, weight in zip(logo.colors, logo.weights)))
+    st.markdown(swatch_html(logo.roles.values(), height=24), unsafe_allow_html=True)
+    st.caption(" · ".join(f"{role} {color}" for role, color in logo.roles.items()))
+    name = f"Logo: {upload.name}"
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Create from Logo", key="logo_create", use_container_width=True):
+            load_theme(apply_palette(create_default_theme(catalog), logo.roles, catalog))
+            st.session_state.setdefault("generated_palettes", {})[name] = dict(logo.roles)
+            st.success(f"✅ Created theme from {upload.name}!")
+            st.rerun()
+    with col2:
+        if st.button("➕ Add to Palettes", key="logo_add", use_container_width=True):
+            st.session_state.setdefault("generated_palettes", {})[name] = dict(logo.roles)
+            st.success(f"✅ Added {name}")
+            st.rerun()
+
+@streamlit_decorator("cache_resource", show_spinner=False)
+def open_library(path):
+    """Theme library shared by all sessions; connections are opened per operation"""
+    return ThemeLibrary(path)
+
+@streamlit_decorator("cache_resource", max_entries=64, show_spinner=False)
+def cached_library_search(path, revision, condition, _library):
+    """Search results and theme count of a library revision, so reruns skip the queries"""
+    return _library.search([condition]), _library.count()
+
+def render_theme_library(data, catalog):
+    """Sidebar panel to save the current theme to the library and search it"""
+    # The library file is opened (and created) only once the panel is expanded
+    panel = st.expander("🗄️ Theme Library", key="library_panel", on_change="rerun")
+    with panel:
+        if not panel.open:
+            return
+        try:
+            library = open_library(default_library_path())
+        except (OSError, sqlite3.Error) as e:
+            st.error(f"❌ Cannot open the theme library: {e}")
+            return
+
+        if data is not None:
+            name = st.text_input("Save as", key="library_save_name", placeholder="Theme name")
+            if st.button("💾 Save to Library", use_container_width=True, disabled=not name.strip()):
+                library.save(name.strip(), data.to_dict())
+                st.success(f"✅ Saved '{name.strip()}'")
+
+        element = st.selectbox(
+            "Element", [""] + list(catalog.elements), key="library_element",
+            format_func=lambda x: catalog.elements[x]["name"] if x else "Any element"
+        )
+        attributes = catalog.elements[element]["attributes"] if element else sorted(
+            {attr for info in catalog.elements.values() for attr in info["attributes"]}
+        )
+        attribute = st.selectbox(
+            "Attribute", [""] + list(attributes), key="library_attribute",
+            format_func=lambda x: x or "Any attribute"
+        )
+        value = st.text_input("Value", key="library_value", placeholder="e.g. #0072CE or Tableau Bold")
+        condition = {"element": element, "attribute": attribute, "value": value.strip()}
+        if not attribute and value.strip().startswith("#"):
+            condition["kind"] = "color"
+        results, count = cached_library_search(library.path, library.revision(), condition, library)
+        if not results:
+            st.caption("No matching themes")
+        else:
+            names = dict(results)
+            theme_id = st.selectbox(
+                f"Matches ({len(results)})", list(names), key="library_result",
+                format_func=lambda x: names.get(x, "")
+            )
+            if st.button("📂 Open", use_container_width=True):
+                try:
+                    load_theme(library.load(theme_id))
+                    st.rerun()
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+        st.caption(f"{count} theme(s) in {library.path}")
+
+def available_palettes():
+    """Preset palettes plus the ones generated in this session, as name -> role colors"""
+    return {**COLOR_PALETTES, **st.session_state.get("generated_palettes", {})}
+
+def swatch_html(colors, height=18):
+    """A strip of color swatches for st.markdown"""
+    cells = "".join(
+        f"<span title='{html.escape(color, quote=True)}' style='flex:1;background:{html.escape(color, quote=True)}'></span>"
+        for color in colors
+    )
+    return f"<div style='display:flex;height:{height}px;border-radius:4px;overflow:hidden;border:1px solid #ddd'>{cells}</div>"
+
+def render_palette_generator(prefix):
+    """Generate role palettes and mark ramps from seed colors; kept palettes join the palette selectors"""
+    with st.expander("🎛️ Generate a palette"):
+        seed = st.color_picker("Seed color", "#0072CE", key=f"{prefix}_seed").upper()
+        second = None
+        if st.checkbox("Second seed", key=f"{prefix}_use_second", help="Used as the accent and as the far end of ramps"):
+            second = st.color_picker("Second seed", "#F28E2B", key=f"{prefix}_second").upper()
+        candidates = generate_palettes(seed, second)[:PALETTE_CANDIDATES_SHOWN]
+        for candidate in candidates:
+            st.markdown(swatch_html(candidate.colors.values()), unsafe_allow_html=True)
+            flag = "✅" if candidate.passed else "⚠️"
+            st.caption(
+                f"{flag} {candidate.name.split(' (')[0]} · score {candidate.score:.2f} · "
+                f"text {candidate.text_contrast:.1f}:1 · accent {candidate.accent_contrast:.1f}:1 · "
+                f"CVD ΔE {candidate.cvd_distinctness:.2f}"
+            )
+        choice = st.selectbox(
+            "Keep", range(len(candidates)), key=f"{prefix}_choice",
+            format_func=lambda i: candidates[i].name.split(" (")[0]
+        )
+        kind = st.radio("Mark ramp", list(RAMP_TYPES), horizontal=True, key=f"{prefix}_ramp")
+        steps = st.slider("Steps", 3, 11, 7, key=f"{prefix}_steps")
+        ramp = color_ramp(seed, second, steps, kind)
+        st.markdown(swatch_html(ramp, height=24), unsafe_allow_html=True)
+        
+        picked = candidates[choice]
+        name = f"Generated: {picked.name}"
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("➕ Add to Palettes", key=f"{prefix}_add", use_container_width=True):
+                st.session_state.setdefault("generated_palettes", {})[name] = dict(picked.colors)
+                st.success(f"✅ Added {name}")
+                st.rerun()
+        with col2:
+            st.download_button(
+                "⬇️ Preferences.tps",
+                palette_preferences_tps(name, picked.colors, {kind: ramp}),
+                file_name="Preferences.tps",
+                mime="application/xml",
+                key=f"{prefix}_tps",
+                use_container_width=True,
+                help="Tableau custom color palettes for marks; merge into My Tableau Repository/Preferences.tps"
+            )
+
+def render_snap_report(palette, moved):
+    """How far each color moved in the last snap to a palette"""
+    with st.expander(f"🧲 Snapped to {palette}: {len(moved)} color(s) moved"):
+        for snap in sorted(moved, key=lambda snap: snap.distance, reverse=True):
+            st.markdown(
+                f"`{snap.element}` {snap.attribute}: {snap.original} → {snap.snapped} "
+                f"(ΔE {snap.distance:.3f})"
+            )
+        if st.button("Dismiss", key="dismiss_snap_report"):
+            del st.session_state.snap_report
+            st.rerun()
+
+@streamlit_decorator("fragment", run_every=SIDEBAR_REFRESH_SECONDS)
+def watch_theme_status(data):
+    """Rerun the page once the sidebar status is behind the theme and edits have settled
+
+    Renders nothing, so an idle poll is a single revision comparison.
+    """
+    status = st.session_state.get("theme_status")
+    if status is None or status["revision"] == data.revision:
+        return
+    if time.monotonic() - st.session_state.last_edit_time >= EDIT_DEBOUNCE_SECONDS:
+        st.rerun()
+
+@streamlit_decorator("fragment")
+def render_theme_status(data):
+    """Sidebar undo/redo, validation and export, refreshed on a debounce
+
+    Validation and serialization are cached per theme revision and only
+    recomputed once no edit has happened for EDIT_DEBOUNCE_SECONDS.
+    """
+    revision = data.revision
+    status = st.session_state.get("theme_status")
+    settled = time.monotonic() - st.session_state.last_edit_time >= EDIT_DEBOUNCE_SECONDS
+    if status is None or (status["revision"] != revision and settled):
+        with profile_section("validation"):
+            errors, warnings = st.session_state.validator.validate(data.to_dict())
+            contrast = audit_contrast(data, st.session_state.resolver, st.session_state.catalog)
+        with profile_section("export serialization"):
+            serialized = st.session_state.serializer.serialize(data.to_dict(), revision)
+            serialized.pretty_bytes
+        status = {
+            "revision": revision,
+            "errors": errors,
+            "warnings": warnings,
+            "contrast_failures": [result for result in contrast if not result.passed],
+            "serialized": serialized
+        }
+        st.session_state.theme_status = status
+    
+    # Undo / redo
+    st.subheader("↩️ History")
+    history = st.session_state.history
+    col_undo, col_redo = st.columns(2)
+    with col_undo:
+        if st.button("↩️ Undo", use_container_width=True, disabled=not history.can_undo):
+            undo_theme_change()
+            st.rerun()
+    with col_redo:
+        if st.button("↪️ Redo", use_container_width=True, disabled=not history.can_redo):
+            redo_theme_change()
+            st.rerun()
+    st.caption(f"{len(history.undo_stack)} change(s) kept, {history.memory_bytes / 1024:.1f} KB")
+    
+    st.divider()
+    
+    # Validation
+    st.subheader("✅ Validation")
+    errors, warnings = status["errors"], status["warnings"]
+    
+    if errors:
+        st.error(f"❌ {len(errors)} Error(s)")
+        with st.expander("View Errors"):
+            for err in errors:
+                st.write(f"• {err}")
+    elif warnings:
+        st.warning(f"⚠️ {len(warnings)} Warning(s)")
+        with st.expander("View Warnings"):
+            for warn in warnings:
+                st.write(f"• {warn}")
+    else:
+        st.success("✅ Theme Valid")
+    
+    contrast_failures = status["contrast_failures"]
+    if contrast_failures:
+        st.warning(f"♿ {len(contrast_failures)} Contrast Issue(s) (WCAG AA)")
+        with st.expander("View Contrast Issues"):
+            elements = st.session_state.catalog.elements
+            for result in sorted(contrast_failures, key=lambda result: result.ratio):
+                on = elements.get(result.background_source, {}).get("name", "page")
+                st.write(
+                    f"• {elements.get(result.element, {}).get('name', result.element)}: "
+                    f"{result.text_color} on {result.background} ({on}) is {result.ratio:.2f}:1, "
+                    f"needs {result.required:g}:1"
+                )
+    else:
+        st.caption("♿ All text meets WCAG AA contrast")
+    
+    if status["revision"] != revision:
+        st.caption("⏳ Updating after your latest edits...")
+    
+    st.divider()
+    
+    # Export
+    st.subheader("💾 Export")
+    
+    theme_name = st.text_input("Theme Name", "custom_theme")
+    optimize = st.toggle(
+        "Optimize for size",
+        key="export_optimized",
+        help="Shorten colors, remove empty elements and whitespace"
+    )
+    drop = optimize and st.checkbox(
+        "Drop inherited values",
+        key="export_drop_inherited",
+        help="Also drop values equal to what the element inherits in the editor. "
+             "The editor's inheritance may not match Tableau's, so check the result in Tableau"
+    )
+    
+    serialized = status["serialized"]
+    if optimize:
+        with profile_section("size optimizer"):
+            export = serialized.optimized(DROP_INHERITED_RULES if drop else OPTIMIZE_RULES)
+        payload, too_large = export.payload, export.too_large
+    else:
+        payload, too_large = serialized.pretty_bytes, serialized.too_large
+    
+    st.download_button(
+        label="📥 Download JSON",
+        # Sent only when clicked, not with every rerun of the sidebar
+        data=lambda: payload,
+        file_name=f"{theme_name}.json",
+        mime="application/json",
+        use_container_width=True
+    )
+    
+    # File size check
+    file_size = len(payload)
+    if too_large:
+        st.error(f"⚠️ File too large: {file_size} bytes (max: {MAX_THEME_BYTES:,})")
+    else:
+        st.caption(f"File size: {file_size} bytes")
+    if optimize:
+        saved = ", ".join(f"{rule} {count}" for rule, count in export.saved.items() if count)
+        st.caption(f"Saved {export.original_bytes - file_size} bytes" + (f" ({saved})" if saved else ""))
+    elif too_large:
+        st.caption("Try **Optimize for size** to shrink the export")
+
+def show_preview(data):
+    """Mock dashboard rendered from the theme's resolved styles"""
+    st.subheader("Theme Preview")
+    st.caption("Values an element does not set are inherited as in Tableau (e.g. titles fall back to the worksheet font).")
+    mode = st.radio(
+        "Color vision",
+        ["normal"] + list(CVD_MODES),
+        horizontal=True,
+        key="cvd_mode",
+        format_func=lambda x: CVD_MODES.get(x, "Normal vision")
+    )
+    theme, resolver = data, st.session_state.resolver
+    if mode != "normal":
+        simulation = st.session_state.cvd_simulator.simulate(data, mode)
+        theme, resolver = simulation.theme, simulation.resolver
+        for warning in simulation.warnings:
+            st.warning(f"⚠️ {warning}")
+        if not simulation.warnings:
+            st.caption(f"✅ Palette roles stay distinguishable with {mode}")
+    st.markdown(
+        f'<div class="theme-preview">{render_preview_svg(theme, resolver)}</div>',
+        unsafe_allow_html=True
+    )
 
 def json_editor(data):
     """Direct JSON editor with syntax highlighting"""
     st.subheader("Direct JSON Editor")
     st.caption("⚠️ Advanced users only - Edit the raw JSON. Invalid JSON will cause errors.")
     
-    json_str = json.dumps(data, indent=2)
+    json_str = st.session_state.serializer.serialize(data.to_dict(), data.revision).pretty
     
     edited = st.text_area(
         "Theme JSON",
@@ -632,14 +4232,14 @@ def json_editor(data):
         if st.button("Validate JSON", key="validate_json"):
             try:
                 parsed = json.loads(edited)
-                st.success("✅ JSON is valid")
                 # Overwrite live data
-                data.clear()
-                data.update(parsed)
-                st.session_state.theme_data = data
+                load_theme(parsed)
+                st.success("✅ JSON is valid")
                 st.rerun()
             except json.JSONDecodeError as e:
                 st.error(f"❌ Invalid JSON: {str(e)}")
+            except ValueError as e:
+                st.error(f"❌ {e}")
 
     with col2:
         st.caption("Changes here immediately affect the theme. Make sure to download a backup first.")
@@ -650,42 +4250,73 @@ def edit_by_category(data):
     
     # Group elements by category
     categories = {}
-    for element_key, element_info in STYLE_ELEMENTS.items():
+    for element_key, element_info in st.session_state.catalog.elements.items():
         category = element_info["category"]
         if category not in categories:
             categories[category] = []
         categories[category].append((element_key, element_info))
     
-    # Create tabs for each category
-    category_tabs = st.tabs(list(categories.keys()))
+    # Create tabs for each category, only the open one renders its editors
+    category_tabs = st.tabs(list(categories.keys()), key="category_tabs", on_change="rerun")
     
     for tab, (category_name, elements) in zip(category_tabs, categories.items()):
         with tab:
+            if not tab.open:
+                continue
             for element_key, element_info in elements:
                 render_element_editor(data, element_key, element_info, context="bycat")
 
+def reset_element_page():
+    """Widget callback: go back to the first page of results after a new search"""
+    st.session_state.all_elements_page = 1
+
 def edit_all_elements(data):
-    """Edit all theme elements in a list"""
+    """Edit all theme elements in a searchable, paginated list"""
     st.subheader("Edit All Style Elements")
     
-    # Search/filter
-    search = st.text_input("🔍 Search elements...", "")
+    # Search/filter through the prebuilt index (prefix and fuzzy matching)
+    search = st.text_input(
+        "🔍 Search elements...",
+        "",
+        help="Matches element keys, names, descriptions, categories and attributes",
+        on_change=reset_element_page
+    )
+    catalog = st.session_state.catalog
+    matches = catalog.search_index.search(search)
+    if not matches:
+        st.info("No style elements match your search.")
+        return
+    
+    # Only the current page of editors is rendered, so only those create widgets
+    pages = (len(matches) - 1) // ELEMENTS_PER_PAGE + 1
+    if st.session_state.get("all_elements_page", 1) > pages:
+        st.session_state.all_elements_page = 1
+    if pages > 1:
+        page = st.number_input("Page", min_value=1, max_value=pages, step=1, key="all_elements_page")
+    else:
+        page = 1
+    first = (page - 1) * ELEMENTS_PER_PAGE
+    visible = matches[first:first + ELEMENTS_PER_PAGE]
+    st.caption(f"Showing {first + 1}-{first + len(visible)} of {len(matches)} element(s)")
     
-    for element_key, element_info in STYLE_ELEMENTS.items():
-        if search.lower() in element_key.lower() or search.lower() in element_info["name"].lower():
-            render_element_editor(data, element_key, element_info, context="all")
+    for element_key in visible:
+        render_element_editor(data, element_key, catalog.elements[element_key], context="all")
 
 
+@streamlit_decorator("fragment")
 def render_element_editor(data, element_key, element_info, context=""):
-    """Render editor for a single style element"""
+    """Render editor for a single style element
+
+    Runs as a fragment: editing one of its widgets only re-executes this
+    element, the sidebar status picks the change up on its next refresh.
+    """
     prefix = f"{context}_" if context else ""
-    styles = data.setdefault("styles", {})
-    properties = styles.setdefault(element_key, {})
     
-    with st.expander(f"**{element_info['name']}** - {element_info['description']}", expanded=False):
+    with profile_section(f"element {context}/{element_key}"), \
+            st.expander(f"**{element_info['name']}** - {element_info['description']}", expanded=False):
         
         # Check if element is in theme
-        is_active = element_key in styles and bool(properties)
+        is_active = data.has_element(element_key)
         
         col_toggle, col_remove = st.columns([4, 1])
         with col_toggle:
@@ -694,8 +4325,16 @@ def render_element_editor(data, element_key, element_info, context=""):
                     f"➕ Add {element_info['name']}",
                     key=f"{prefix}add_{element_key}"
                 ):
-                    styles[element_key] = {}
-                    st.rerun()
+                    # Seed the inherited (or default) values so the element is actually written to the theme
+                    resolved = st.session_state.resolver.resolve(data, element_key)
+                    defaults = {}
+                    for attr in element_info["attributes"]:
+                        default = resolved.get(attr, attribute_spec(element_key, attr, st.session_state.catalog.schema).default)
+                        if default is not None:
+                            defaults[attr] = default
+                    if data.update(element_key, defaults):
+                        mark_theme_changed()
+                    st.rerun(scope="fragment")
                 return
         
         with col_remove:
@@ -704,127 +4343,205 @@ def render_element_editor(data, element_key, element_info, context=""):
                 key=f"{prefix}remove_{element_key}",
                 help="Remove this element"
             ):
-                del styles[element_key]
-                st.rerun()
+                if data.remove_element(element_key):
+                    mark_theme_changed()
+                st.rerun(scope="fragment")
                 return
         
         # Edit attributes
         for attr in element_info["attributes"]:
-            render_attribute_editor(properties, element_key, attr, context=context)
+            render_attribute_editor(data, element_key, attr, context=context)
+
 
+def set_attribute(theme, element_key, attr, value):
+    """Store an attribute value, flagging the theme as changed only if it differs"""
+    if theme.set(element_key, attr, value):
+        mark_theme_changed()
 
-def render_attribute_editor(properties, element_key, attr, context=""):
+def bind_widget(key, value):
+    """Point a keyed widget at the theme's current value before it is drawn
+
+    The same element is rendered in more than one tab, so widget state is
+    synced from the theme instead of the theme being synced from widgets.
+    """
+    if st.session_state.get(key) != value:
+        st.session_state[key] = value
+
+def on_attribute_change(theme, element_key, attr, key, convert=None):
+    """Widget callback: copy the edited widget value into the theme"""
+    value = st.session_state[key]
+    set_attribute(theme, element_key, attr, convert(value) if convert else value)
+
+def attribute_value(theme, element_key, attr, spec):
+    """Value an attribute editor shows (set, inherited or the spec default) and a help note when inherited"""
+    resolver = st.session_state.resolver
+    value = resolver.resolve(theme, element_key).get(attr, spec.default)
+    source = resolver.source(theme, element_key, attr)
+    if source is None:
+        return value, None
+    name = st.session_state.catalog.elements.get(source, {}).get('name', source)
+    # A bad value (the JSON editor accepts anything) falls back to the default
+    # so it can't break the editors of every element inheriting it
+    if spec.validate is not None and spec.validate(source, attr, value) is not None:
+        if source == element_key:
+            return spec.default, f"Invalid value {value!r}, showing the default"
+        return spec.default, f"Invalid value {value!r} inherited from {name}, showing the default"
+    if source == element_key:
+        return value, None
+    return value, f"Inherited from {name}"
+
+def render_attribute_editor(theme, element_key, attr, context=""):
     """Render editor for a specific attribute"""
     prefix = f"{context}_" if context else ""
+    spec = attribute_spec(element_key, attr, st.session_state.catalog.schema)
+    if spec.widget is not None:
+        spec.widget(theme, element_key, attr, spec, prefix)
+
+def render_color_editor(theme, element_key, attr, spec, prefix):
+    """Color editor with picker plus Hex / RGB / CMYK entry"""
+    key = f"{element_key}_{attr}"
+    st.markdown(f"**{attr.replace('-', ' ').title()}**")
+    col1, col2, col3 = st.columns([1, 1.5, 2])
     
-    if "color" in attr:
-        # Color editor
-        st.markdown(f"**{attr.replace('-', ' ').title()}**")
-        col1, col2, col3 = st.columns([1, 1.5, 2])
-        
-        current_color = validate_hex(properties.get(attr, "#000000"))
-        
-        with col1:
-            picked = st.color_picker(
-                "Color",
-                current_color,
-                key=f"{prefix}picker_{element_key}_{attr}",
-            )
-            if picked != current_color:
-                properties[attr] = picked
-        
-        with col2:
-            mode = st.radio(
-                "Mode",
-                ["Hex", "RGB", "CMYK"],
-                horizontal=True,
-                key=f"{prefix}mode_{element_key}_{attr}",
-                label_visibility="collapsed"
-            )
-        
-        with col3:
-            if mode == "Hex":
-                manual = st.text_input(
-                    "Hex",
-                    current_color,
-                    key=f"{prefix}hex_{element_key}_{attr}",
-                    max_chars=9
-                )
-                if manual != current_color:
-                    properties[attr] = validate_hex(manual)
-            
-            elif mode == "RGB":
-                rgb = hex_to_rgb(current_color)
-                c1, c2, c3 = st.columns(3)
-                r = c1.number_input("R", 0, 255, rgb[0], key=f"{prefix}r_{element_key}_{attr}")
-                g = c2.number_input("G", 0, 255, rgb[1], key=f"{prefix}g_{element_key}_{attr}")
-                b = c3.number_input("B", 0, 255, rgb[2], key=f"{prefix}b_{element_key}_{attr}")
-                new_hex = rgb_to_hex(r, g, b)
-                if st.button(f"Apply {new_hex}", key=f"{prefix}apply_rgb_{element_key}_{attr}"):
-                    properties[attr] = new_hex
-            
-            elif mode == "CMYK":
-                c1, c2, c3, c4 = st.columns(4)
-                c = c1.number_input("C%", 0, 100, 0, key=f"{prefix}c_{element_key}_{attr}")
-                m = c2.number_input("M%", 0, 100, 0, key=f"{prefix}m_{element_key}_{attr}")
-                y = c3.number_input("Y%", 0, 100, 0, key=f"{prefix}y_{element_key}_{attr}")
-                k = c4.number_input("K%", 0, 100, 0, key=f"{prefix}k_{element_key}_{attr}")
-                calc_hex = cmyk_to_hex(c, m, y, k)
-                if st.button(f"Apply {calc_hex}", key=f"{prefix}apply_cmyk_{element_key}_{attr}"):
-                    properties[attr] = calc_hex
-    
-    elif attr == "font-family":
-        current = properties.get(attr, TABLEAU_FONTS[0])
-        new_font = st.selectbox(
-            "Font Family",
-            TABLEAU_FONTS,
-            index=TABLEAU_FONTS.index(current) if current in TABLEAU_FONTS else 0,
-            key=f"{prefix}font_{element_key}_{attr}"
-        )
-        properties[attr] = new_font
-    
-    elif attr in ["font-size", "line-width"]:
-        current = properties.get(attr, 10 if "size" in attr else 1)
-        new_val = st.number_input(
-            attr.replace("-", " ").title(),
-            min_value=1,
-            max_value=99,
-            value=int(current),
-            key=f"{prefix}size_{element_key}_{attr}"
+    value, inherited = attribute_value(theme, element_key, attr, spec)
+    current_color = validate_hex(value)
+    
+    with col1:
+        # The picker has no alpha channel, keep any transparency from the hex value
+        picker_key = f"{prefix}picker_{key}"
+        bind_widget(picker_key, current_color[:7])
+        st.color_picker(
+            "Color",
+            key=picker_key,
+            help=inherited,
+            on_change=on_attribute_change,
+            args=(theme, element_key, attr, picker_key, partial(keep_alpha, current_color))
         )
-        properties[attr] = new_val
-    
-    elif attr == "font-weight":
-        current = properties.get(attr, "normal")
-        new_weight = st.radio(
-            "Font Weight",
-            ["normal", "bold"],
-            index=0 if current == "normal" else 1,
+    
+    with col2:
+        mode = st.radio(
+            "Mode",
+            ["Hex", "RGB", "CMYK"],
             horizontal=True,
-            key=f"{prefix}weight_{element_key}_{attr}"
+            key=f"{prefix}mode_{key}",
+            label_visibility="collapsed"
         )
-        properties[attr] = new_weight
-    
-    elif attr == "line-visibility":
-        current = properties.get(attr, "on")
-        new_vis = st.radio(
-            "Line Visibility",
-            ["on", "off"],
-            index=0 if current == "on" else 1,
+    
+    with col3:
+        if mode == "Hex":
+            hex_key = f"{prefix}hex_{key}"
+            bind_widget(hex_key, current_color)
+            st.text_input(
+                "Hex",
+                key=hex_key,
+                max_chars=9,
+                on_change=on_attribute_change,
+                args=(theme, element_key, attr, hex_key, validate_hex)
+            )
+        
+        elif mode == "RGB":
+            rgb = hex_to_rgb(current_color)
+            c1, c2, c3 = st.columns(3)
+            r = c1.number_input("R", 0, 255, rgb[0], key=f"{prefix}r_{key}")
+            g = c2.number_input("G", 0, 255, rgb[1], key=f"{prefix}g_{key}")
+            b = c3.number_input("B", 0, 255, rgb[2], key=f"{prefix}b_{key}")
+            new_hex = keep_alpha(current_color, rgb_to_hex(r, g, b))
+            if st.button(f"Apply {new_hex}", key=f"{prefix}apply_rgb_{key}"):
+                set_attribute(theme, element_key, attr, new_hex)
+                st.rerun(scope="fragment")
+        
+        elif mode == "CMYK":
+            cmyk = hex_to_cmyk(current_color)
+            c1, c2, c3, c4 = st.columns(4)
+            c = c1.number_input("C%", 0, 100, cmyk[0], key=f"{prefix}c_{key}")
+            m = c2.number_input("M%", 0, 100, cmyk[1], key=f"{prefix}m_{key}")
+            y = c3.number_input("Y%", 0, 100, cmyk[2], key=f"{prefix}y_{key}")
+            k = c4.number_input("K%", 0, 100, cmyk[3], key=f"{prefix}k_{key}")
+            calc_hex = keep_alpha(current_color, cmyk_to_hex(c, m, y, k))
+            if st.button(f"Apply {calc_hex}", key=f"{prefix}apply_cmyk_{key}"):
+                set_attribute(theme, element_key, attr, calc_hex)
+                st.rerun(scope="fragment")
+
+def render_font_editor(theme, element_key, attr, spec, prefix):
+    """Font family selector over the suggested fonts"""
+    current, inherited = attribute_value(theme, element_key, attr, spec)
+    font_key = f"{prefix}font_{element_key}_{attr}"
+    bind_widget(font_key, current if current in spec.allowed else spec.default)
+    st.selectbox(
+        "Font Family",
+        spec.allowed,
+        key=font_key,
+        help=inherited,
+        on_change=on_attribute_change,
+        args=(theme, element_key, attr, font_key)
+    )
+
+def render_size_editor(theme, element_key, attr, spec, prefix):
+    """Integer input for font sizes and line widths"""
+    current, inherited = attribute_value(theme, element_key, attr, spec)
+    size_key = f"{prefix}size_{element_key}_{attr}"
+    bind_widget(size_key, min(max(int(current), 1), 99))
+    st.number_input(
+        attr.replace("-", " ").title(),
+        min_value=1,
+        max_value=99,
+        key=size_key,
+        help=inherited,
+        on_change=on_attribute_change,
+        args=(theme, element_key, attr, size_key)
+    )
+
+def render_choice_editor(theme, element_key, attr, spec, prefix):
+    """Radio (two options) or selectbox for enumerated attributes"""
+    current, inherited = attribute_value(theme, element_key, attr, spec)
+    choice_key = f"{prefix}choice_{element_key}_{attr}"
+    bind_widget(choice_key, current if current in spec.allowed else spec.default)
+    label = attr.replace("-", " ").title()
+    if len(spec.allowed) <= 2:
+        st.radio(
+            label,
+            spec.allowed,
             horizontal=True,
-            key=f"{prefix}vis_{element_key}_{attr}"
+            key=choice_key,
+            help=inherited,
+            on_change=on_attribute_change,
+            args=(theme, element_key, attr, choice_key)
         )
-        properties[attr] = new_vis
-    
-    elif attr == "pattern":
-        current = properties.get(attr, "none")
-        new_pattern = st.selectbox(
-            "Pattern",
-            ["none", "dotted", "dashed"],
-            index=["none", "dotted", "dashed"].index(current) if current in ["none", "dotted", "dashed"] else 0,
-            key=f"{prefix}pattern_{element_key}_{attr}"
+    else:
+        st.selectbox(
+            label,
+            spec.allowed,
+            key=choice_key,
+            help=inherited,
+            on_change=on_attribute_change,
+            args=(theme, element_key, attr, choice_key)
         )
-        properties[attr] = new_pattern
+
+# AttributeSpec kind -> editor widget builder, read when specs are compiled
+ATTRIBUTE_WIDGETS = {
+    "color": render_color_editor,
+    "size": render_size_editor,
+    "font-family": render_font_editor,
+    "font-weight": render_choice_editor,
+    "visibility": render_choice_editor,
+    "pattern": render_choice_editor,
+}
+
+@streamlit_decorator("cache_resource", show_spinner=False)
+def documentation_table(catalog_id, dependencies, _elements):
+    """Style element reference table, built once per catalog version and shared by all sessions"""
+    # pandas is only needed here, so it is imported on first use rather than at startup
+    import pandas as pd
+
+    element_data = []
+    for key, info in _elements.items():
+        element_data.append({
+            "Element": info["name"],
+            "Key": key,
+            "Category": info["category"],
+            "Attributes": ", ".join(info["attributes"])
+        })
+    return pd.DataFrame(element_data)
 
 def show_documentation():
     """Show comprehensive documentation"""
@@ -846,19 +4563,13 @@ def show_documentation():
     """)
     
     # Display all style elements in a table
-
-    
-    element_data = []
-    for key, info in STYLE_ELEMENTS.items():
-        element_data.append({
-            "Element": info["name"],
-            "Key": key,
-            "Category": info["category"],
-            "Attributes": ", ".join(info["attributes"])
-        })
-    
-    df = pd.DataFrame(element_data)
-    st.dataframe(df, use_container_width=True, hide_index=True)
+    catalog = st.session_state.catalog
+    st.caption(f"Elements in the selected catalog: {catalog.label}")
+    st.dataframe(
+        documentation_table(catalog.id, catalog.dependencies, catalog.elements),
+        use_container_width=True,
+        hide_index=True
+    )
     
     st.markdown("""
     ### Best Practices
@@ -904,6 +4615,249 @@ def show_documentation():
     - [Tableau Community Forums](https://community.tableau.com)
     """)
     
+# --- CATALOGS ---
+# Element catalogs describe what a Tableau release supports. The built-in one
+# is assembled from the constants above; more are loaded from JSON schema files
+# in CATALOG_DIR, one per release plus organization overrides that "extends"
+# another catalog. Parsed catalogs are cached as JSON in a cache directory keyed
+# by the hash of every file they were built from, so a restart skips re-parsing.
+# File hashes are memoized per process on (mtime, size), so checking that a
+# catalog is still current is a stat per schema file.
+
+BUILTIN_CATALOG_ID = "tableau-2025.1"
+CATALOG_DIR = os.environ.get("TABTHEME_CATALOG_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalogs")
+CATALOG_CACHE_ENV_VAR = "TABTHEME_CATALOG_CACHE"
+CATALOG_CACHE_FORMAT = 2
+CATALOG_SECTIONS = ("fonts", "base_themes", "elements")
+
+class Catalog(NamedTuple):
+    id: str
+    label: str
+    version: str
+    fonts: tuple
+    base_themes: dict
+    elements: dict
+    parents: dict
+    schema: dict
+    search_index: ElementSearchIndex
+    # (catalog id, sha256) of every schema file the catalog was built from
+    dependencies: tuple = ()
+
+def builtin_catalog_data():
+    """The built-in Tableau 2025.1 catalog in catalog file form"""
+    return {
+        "label": "Tableau 2025.1 (built-in)",
+        "version": TABLEAU_VERSION,
+        "fonts": list(TABLEAU_FONTS),
+        "base_themes": dict(BASE_THEMES),
+        "elements": dict(STYLE_ELEMENTS),
+        "parents": dict(STYLE_PARENTS),
+    }
+
+def build_catalog(catalog_id, data, dependencies=(), index_state=None):
+    """Compile catalog data into a Catalog (schema and search index)"""
+    fonts = tuple(data["fonts"])
+    elements = data["elements"]
+    schema = compile_schema(elements, fonts)
+    if index_state is None:
+        search_index = ElementSearchIndex(elements)
+    else:
+        search_index = ElementSearchIndex.from_state(index_state)
+    return Catalog(
+        id=catalog_id,
+        label=data["label"],
+        version=data["version"],
+        fonts=fonts,
+        base_themes=data["base_themes"],
+        elements=elements,
+        parents=data["parents"],
+        schema=schema,
+        search_index=search_index,
+        dependencies=tuple(dependencies),
+    )
+
+def catalog_path(directory, catalog_id):
+    """Schema file of a catalog id"""
+    return os.path.join(directory, f"{catalog_id}.json")
+
+def catalog_cache_dir(directory):
+    """Where compiled catalogs are cached (TABTHEME_CATALOG_CACHE overrides)"""
+    return os.environ.get(CATALOG_CACHE_ENV_VAR) or os.path.join(directory, ".cache")
+
+# path -> (mtime_ns, size, sha256 hex digest)
+FILE_DIGEST_MEMO = {}
+
+def file_digest(path):
+    """sha256 hex digest of a file's bytes, re-hashed only when its mtime or size changes"""
+    stat = os.stat(path)
+    memo = FILE_DIGEST_MEMO.get(path)
+    if memo is not None and memo[:2] == (stat.st_mtime_ns, stat.st_size):
+        return memo[2]
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    FILE_DIGEST_MEMO[path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+def available_catalogs(directory=None):
+    """Catalog ids to choose from: the built-in one, then every schema file in the directory"""
+    directory = directory or CATALOG_DIR
+    try:
+        files = sorted(name[:-5] for name in os.listdir(directory) if name.endswith(".json"))
+    except OSError:
+        files = []
+    return [BUILTIN_CATALOG_ID] + [catalog_id for catalog_id in files if catalog_id != BUILTIN_CATALOG_ID]
+
+def merge_catalog(base, spec, catalog_id):
+    """Overlay a catalog file on the catalog it extends
+
+    Fonts are appended, base themes, elements and parents are merged by key;
+    an element or parent set to null is removed, an element given as an object
+    replaces only the fields it lists.
+    """
+    merged = {
+        "label": spec.get("label", catalog_id),
+        "version": spec.get("version", base["version"]),
+        "fonts": base["fonts"] + [font for font in spec.get("fonts", []) if font not in base["fonts"]],
+        "base_themes": {**base["base_themes"], **spec.get("base_themes", {})},
+        "elements": dict(base["elements"]),
+        "parents": dict(base["parents"]),
+    }
+    for element, info in spec.get("elements", {}).items():
+        if info is None:
+            merged["elements"].pop(element, None)
+            continue
+        if not isinstance(info, dict):
+            raise ValueError(f"Catalog '{catalog_id}': element '{element}' must be an object or null")
+        info = {**merged["elements"].get(element, {}), **info}
+        if not isinstance(info.get("attributes"), list):
+            raise ValueError(f"Catalog '{catalog_id}': element '{element}' needs an 'attributes' list")
+        info.setdefault("name", element)
+        info.setdefault("description", "")
+        info.setdefault("category", "Custom")
+        merged["elements"][element] = info
+    for element, parent in spec.get("parents", {}).items():
+        if parent is None:
+            merged["parents"].pop(element, None)
+        else:
+            merged["parents"][element] = parent
+    return merged
+
+def parse_catalog(catalog_id, directory, seen=()):
+    """Read a catalog file and everything it extends, returns (data, dependencies)"""
+    if catalog_id == BUILTIN_CATALOG_ID:
+        return builtin_catalog_data(), ()
+    if catalog_id in seen:
+        raise ValueError(f"Catalog '{catalog_id}' extends itself")
+    with open(catalog_path(directory, catalog_id), "rb") as f:
+        raw = f.read()
+    try:
+        spec = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Catalog '{catalog_id}' is not valid JSON: {e}") from e
+    if not isinstance(spec, dict):
+        raise ValueError(f"Catalog '{catalog_id}' must be a JSON object")
+    
+    if spec.get("extends"):
+        base, dependencies = parse_catalog(spec["extends"], directory, seen + (catalog_id,))
+    else:
+        missing = [section for section in CATALOG_SECTIONS if section not in spec]
+        if missing:
+            raise ValueError(f"Catalog '{catalog_id}' must define {', '.join(missing)} or extend another catalog")
+        base = {"version": TABLEAU_VERSION, "fonts": [], "base_themes": {}, "elements": {}, "parents": {}}
+        dependencies = ()
+    data = merge_catalog(base, spec, catalog_id)
+    return data, dependencies + ((catalog_id, hashlib.sha256(raw).hexdigest()),)
+
+def dependencies_current(dependencies, directory):
+    """Whether every schema file still hashes to what the catalog was built from"""
+    try:
+        return all(file_digest(catalog_path(directory, catalog_id)) == digest for catalog_id, digest in dependencies)
+    except OSError:
+        return False
+
+def read_catalog_cache(path):
+    """Load a catalog cache entry, or None if it is missing, unreadable or malformed"""
+    # Plain JSON, so a tampered cache file can at worst hold wrong data, which
+    # the dependency hashes and the shape checks below reject
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+        entry = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) or entry.get("format") != CATALOG_CACHE_FORMAT:
+        return None
+    dependencies = entry.get("dependencies")
+    if not isinstance(dependencies, list) or not all(
+        isinstance(dependency, list) and len(dependency) == 2 and all(isinstance(part, str) for part in dependency)
+        for dependency in dependencies
+    ):
+        return None
+    data, index = entry.get("data"), entry.get("index")
+    if not isinstance(data, dict) or not isinstance(index, dict):
+        return None
+    if not isinstance(data.get("label"), str) or not isinstance(data.get("version"), str):
+        return None
+    if not isinstance(data.get("fonts"), list) or any(key not in index for key in ("order", "tokens", "postings")):
+        return None
+    if any(not isinstance(data.get(section), dict) for section in ("base_themes", "elements", "parents")):
+        return None
+    if not all(isinstance(info, dict) and isinstance(info.get("attributes"), list) for info in data["elements"].values()):
+        return None
+    entry["dependencies"] = tuple(tuple(dependency) for dependency in dependencies)
+    return entry
+
+def write_catalog_cache(path, entry):
+    """Store a compiled catalog, silently skipping read-only deployments"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(dumps_theme(entry, pretty=False))
+        os.replace(temp_path, path)
+    except OSError:
+        pass
+
+# (directory, catalog id) -> Catalog, checked against the file hashes on each load
+CATALOG_MEMO = {}
+
+def load_catalog(catalog_id=None, directory=None):
+    """Load a compiled catalog by id, from memory, the disk cache or its schema files
+
+    Raises OSError if a catalog file is missing and ValueError if it is invalid.
+    """
+    if catalog_id is None or catalog_id == BUILTIN_CATALOG_ID:
+        return DEFAULT_CATALOG
+    directory = directory or CATALOG_DIR
+    catalog = CATALOG_MEMO.get((directory, catalog_id))
+    if catalog is not None and dependencies_current(catalog.dependencies, directory):
+        return catalog
+    
+    digest = file_digest(catalog_path(directory, catalog_id))
+    cache_path = os.path.join(catalog_cache_dir(directory), f"{catalog_id}-{digest[:16]}.json")
+    entry = read_catalog_cache(cache_path)
+    if entry is None or not dependencies_current(entry["dependencies"], directory):
+        data, dependencies = parse_catalog(catalog_id, directory)
+        entry = {
+            "format": CATALOG_CACHE_FORMAT,
+            "dependencies": dependencies,
+            "data": data,
+            "index": ElementSearchIndex(data["elements"]).state(),
+        }
+        write_catalog_cache(cache_path, entry)
+    catalog = build_catalog(catalog_id, entry["data"], entry["dependencies"], entry["index"])
+    CATALOG_MEMO[(directory, catalog_id)] = catalog
+    return catalog
+
+DEFAULT_CATALOG = build_catalog(BUILTIN_CATALOG_ID, builtin_catalog_data())
+# The built-in catalog's compiled schema, for callers that don't pass a catalog
+SCHEMA = DEFAULT_CATALOG.schema
+
+
     # Run the app
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # "streamlit run" has Streamlit loaded already; a CLI run never imports it
+    if "streamlit" in sys.modules and st.runtime.exists():
+        main()
+    else:
+        sys.exit(cli())
@@ -0,0 +1,28 @@
+# Regression checks for the element editors against bad values in the theme
+# run as "python -m pytest tests"
+import os
+
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tabthemeeditor.py")
+
+
+def test_editors_fall_back_from_invalid_inherited_values():
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.run()
+    next(button for button in at.button if button.label == "Create New Theme").click().run()
+    theme = at.session_state.theme_data
+    theme.update("worksheet", {"font-size": "abc"})
+    theme.update("all", {"font-color": 5})
+
+    for mode in ("RGB", "CMYK", "Hex"):
+        for radio in at.radio:
+            if radio.key and radio.key.startswith("bycat_mode_"):
+                radio.set_value(mode)
+        at.session_state["category_tabs"] = "Worksheet"
+        at.run()
+        assert not at.exception
+
+    size = next(box for box in at.number_input if box.key == "bycat_size_worksheet_font-size")
+    assert size.value == 10
+    assert at.text_input(key="bycat_hex_worksheet_font-color").value == "#000000"
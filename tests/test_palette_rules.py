@@ -0,0 +1,61 @@
+# Regression checks for palette rules against catalogs that remove rule targets
+# run as "python -m pytest tests"
+import json
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, "tabthemeeditor.py")
+sys.path.insert(0, REPO_ROOT)
+
+import tabthemeeditor as tte
+
+NO_MARKS = {"label": "No marks", "extends": tte.BUILTIN_CATALOG_ID, "elements": {"mark": None}}
+
+
+@pytest.fixture
+def catalog_dir(tmp_path, monkeypatch):
+    """Catalog directory holding a catalog that drops the mark element"""
+    with open(tmp_path / "no-marks.json", "w", encoding="utf-8") as f:
+        json.dump(NO_MARKS, f)
+    monkeypatch.setenv("TABTHEME_CATALOG_DIR", str(tmp_path))
+    monkeypatch.setenv("TABTHEME_CATALOG_CACHE", str(tmp_path / ".cache"))
+    return str(tmp_path)
+
+
+def test_plan_skips_targets_the_catalog_drops(catalog_dir):
+    catalog = tte.load_catalog("no-marks", catalog_dir)
+    plan = tte.load_palette_plan(catalog=catalog)
+    assert plan.skipped == (("accent", "mark.mark-color"),)
+    assert "accent" not in plan.rules
+
+    palette = tte.COLOR_PALETTES["Corporate Blue"]
+    theme = tte.apply_palette(tte.create_default_theme(catalog), palette, catalog)
+    assert "mark-color" not in theme["styles"].get("mark", {})
+    assert theme["styles"]["worksheet-title"]["font-color"] == palette["primary"]
+    assert len(tte.check_palette_plan(plan, palette, catalog)) == 1
+
+
+def test_plan_still_rejects_non_color_targets():
+    with pytest.raises(ValueError):
+        tte.PalettePlan({"primary": ("worksheet-title.font-size",)})
+
+
+def test_sidebar_palette_with_catalog_that_drops_mark(catalog_dir):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.run()
+    next(button for button in at.button if button.label == "Create New Theme").click().run()
+    at.selectbox(key="catalog_select").set_value("no-marks").run()
+    assert not at.exception
+
+    apply = next(box for box in at.selectbox if box.label == "Apply Palette")
+    apply.set_value("Corporate Blue").run()
+    assert not at.exception
+    assert any("mark.mark-color" in caption.value for caption in at.caption)
+
+    next(button for button in at.button if button.label == "Apply Palette").click().run()
+    assert not at.exception
@@ -0,0 +1,29 @@
+# Regression checks for duplicate workbook formats, extraction and rewriting must agree
+# run as "python -m pytest tests"
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import tabthemeeditor as tte
+
+DUPLICATES = b"""<?xml version='1.0' encoding='utf-8' ?>
+<workbook><preferences/><style>
+<style-rule element='worksheet'><format attr='color' value='#111111'/><format attr='font-size' value='9'/><format attr='color' value='#222222'/></style-rule>
+<style-rule element='worksheet'><format attr='color' value='#444444'/></style-rule>
+</style><worksheets/></workbook>"""
+
+
+def test_last_duplicate_format_wins(tmp_path):
+    source = tmp_path / "duplicates.twb"
+    source.write_bytes(DUPLICATES)
+    assert tte.extract_workbook_theme(str(source)).data["styles"] == {"worksheet": {"font-color": "#444444", "font-size": 9}}
+
+    theme = tte.create_default_theme()
+    theme["styles"] = {"worksheet": {"font-color": "#ABCDEF", "font-family": "Arial"}}
+    output = tmp_path / "themed.twb"
+    tte.apply_theme_to_workbook(str(source), str(output), theme)
+    styles = tte.extract_workbook_theme(str(output)).data["styles"]
+    assert styles == {"worksheet": {"font-color": "#ABCDEF", "font-size": 9, "font-family": "Arial"}}
+    assert output.read_bytes().count(b'value="Arial"') == 1